@@ -3,6 +3,7 @@ import time
 import portalocker
 import re
 import error_handler
+import file_cache
 from functools import wraps
 import loaders
 
@@ -39,6 +40,7 @@ def add_action_to_json(action_name, statement):
 
         finally:
             portalocker.unlock(file)
+    file_cache.invalidate('action_history.json')
 
 @error_handler.if_errors
 def action_wrapper(func):
@@ -69,11 +71,14 @@ from dateutil.relativedelta import relativedelta
 
 @error_handler.if_errors
 def get_human_readable_action_history():
-    # Read the actions from the JSON file
+    # Read the actions from the JSON file (re-parsed only when add_action_to_json has changed it);
+    # hold the lock so a miss can't read a half-rewritten file
     with open('action_history.json', 'r') as file:
         portalocker.lock(file, portalocker.LOCK_EX)
-        actions = json.load(file)
-        portalocker.unlock(file)
+        try:
+            actions = file_cache.load_json('action_history.json')
+        finally:
+            portalocker.unlock(file)
 
     # Sort the actions in descending order based on their timestamps
     sorted_actions = sorted(actions.items(), key=lambda item: item[0], reverse=True)
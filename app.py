@@ -9,11 +9,12 @@ import io
 from datetime import datetime
 import database
 import gui_interface
+import memory_ingest
+import turn_context
 import loaders
 import document_handler
 import threading
 import json
-import asyncio
 
 def ensure_directories_exist():
     """Create all required directories if they don't exist"""
@@ -117,7 +118,7 @@ def login():
     
     # Create Redis namespace for this user
     redis_key = f"user:{username}"
-    asyncio.run(loaders.redis_save(f"{redis_key}:username", username))
+    loaders.run(loaders.redis_save(f"{redis_key}:username", username))
     # Don't initialize conversation_history to empty - let it accumulate
     
     # Schedule header check to run in background (non-blocking)
@@ -126,7 +127,7 @@ def login():
     
     def check_conversation_timeout():
         try:
-            asyncio.run(headers.build_header(username))
+            loaders.run(headers.build_header(username))
         except Exception as e:
             print(f"Background header check error: {e}")
     
@@ -164,6 +165,7 @@ def start_recording():
     return jsonify({'success': True, 'session_id': session_id})
 
 @app.route('/api/stop_recording', methods=['POST'])
+@loaders.releases_loop_clients
 async def stop_recording():
     """Stop recording and process audio (push-to-talk release)"""
     data = request.json
@@ -257,6 +259,7 @@ async def stop_recording():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/send_message', methods=['POST'])
+@loaders.releases_loop_clients
 async def send_message():
     """Handle text message input"""
     data = request.json
@@ -351,7 +354,7 @@ def get_chat_history():
     username = session.get('username', 'Friend')
     redis_key = f"user:{username}"
     
-    conversation_history = asyncio.run(loaders.redis_load(f"{redis_key}:conversation_history"))
+    conversation_history = loaders.run(loaders.load_conversation_history(username))
     
     if conversation_history:
         # Parse conversation history into messages
@@ -367,6 +370,16 @@ def get_chat_history():
     
     return jsonify({'messages': []})
 
+@app.route('/api/ingest_status', methods=['GET'])
+def ingest_status():
+    """Depth and lag of the long-term memory ingest queue"""
+    return jsonify(memory_ingest.metrics())
+
+@app.route('/api/turn_context_status', methods=['GET'])
+def turn_context_status():
+    """How many context loader calls per-turn memoization has saved"""
+    return jsonify(turn_context.metrics())
+
 @socketio.on('connect')
 def handle_connect():
     """Handle WebSocket connection"""
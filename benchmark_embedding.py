@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Compare query-embedding latency of the embedding server (HTTP /pureembed) with the
+in-process local_embedder backend, one query at a time as memory searches do, and
+check that both produce the same vectors (cosine agreement; 1.0 means identical).
+
+Queries come from stored memory messages (--from-memory) or a built-in list of short
+queries. The embedding cache is bypassed so every call does real work.
+
+Example:
+    EMBEDDING_SERVICE_URL=http://gpu-box:5001 python benchmark_embedding.py --queries 200 --from-memory
+"""
+
+import time
+import asyncio
+import argparse
+import numpy as np
+import embedding_client
+import local_embedder
+import memory_store
+
+SHORT_QUERIES = [
+    "what did we talk about yesterday",
+    "Maggie's favorite book",
+    "the garden in spring",
+    "how was the trip to the coast",
+    "did I finish the journal entry",
+    "the song from last week",
+    "plans for the weekend",
+    "what scares you",
+]
+
+def sample_queries(count, from_memory):
+    if from_memory:
+        queries = []
+        for _, record in memory_store.iter_records():
+            if record.get('message'):
+                queries.append(record['message'])
+            if len(queries) >= count:
+                break
+        if queries:
+            return queries
+    return [SHORT_QUERIES[i % len(SHORT_QUERIES)] + f" ({i})" for i in range(count)]
+
+def percentiles(timings):
+    return np.percentile(timings, 50), np.percentile(timings, 99), np.mean(timings)
+
+async def time_http(queries):
+    timings, vectors = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = await embedding_client.client.post('pureembed', {'text': query, 'uuid': 'benchmark'})
+        timings.append((time.perf_counter() - start) * 1000)
+        vectors.append(np.asarray(response['embedding'], dtype='float32').reshape(-1) if response else None)
+    await embedding_client.client.close()
+    return timings, vectors
+
+def time_local(queries):
+    timings, vectors = [], []
+    for query in queries:
+        start = time.perf_counter()
+        vector = local_embedder.encode([query])
+        timings.append((time.perf_counter() - start) * 1000)
+        vectors.append(vector[0] if vector is not None else None)
+    return timings, vectors
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP vs in-process embedding latency")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--from-memory', action='store_true', help="Use stored memory messages as queries")
+    parser.add_argument('--skip-http', action='store_true')
+    args = parser.parse_args()
+
+    queries = sample_queries(args.queries + args.warmup, args.from_memory)
+    warmup, queries = queries[:args.warmup], queries[args.warmup:]
+
+    if local_embedder.get_encoder() is None:
+        print("Local embedding model could not be loaded; see the message above.")
+        return
+    time_local(warmup)
+    local_timings, local_vectors = time_local(queries)
+
+    print(f"{'backend':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+    print(f"{'local':>8} {percentiles(local_timings)[0]:>8.1f} {percentiles(local_timings)[1]:>8.1f} {percentiles(local_timings)[2]:>8.1f}")
+    if args.skip_http:
+        return
+
+    asyncio.run(time_http(warmup))
+    http_timings, http_vectors = asyncio.run(time_http(queries))
+    p50, p99, mean = percentiles(http_timings)
+    print(f"{'http':>8} {p50:>8.1f} {p99:>8.1f} {mean:>8.1f}")
+
+    agreement = [float(np.dot(a, b)) for a, b in zip(local_vectors, http_vectors) if a is not None and b is not None]
+    if agreement:
+        print(f"\nCosine agreement with the server over {len(agreement)} queries: mean {np.mean(agreement):.4f}, min {np.min(agreement):.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark FAISS index types for conversational memory.
+
+For each corpus size, builds every index type from index_manager.build_index on the same
+L2-normalized vectors and reports recall@k against an exact flat search, plus p50/p99
+single-query search latency (the app searches one query at a time). Real vectors can be
+loaded from an existing index with --from-index; otherwise clustered synthetic vectors are used.
+
+Example:
+    python benchmark_index.py --sizes 10000 100000 1000000 --k 5 --metric ip
+"""
+
+import time
+import argparse
+import numpy as np
+import faiss
+import index_manager
+
+def synthetic_vectors(n, dimension, rng, clusters=256):
+    """Clustered, normalized vectors (uniform random vectors make every ANN index look bad)"""
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, clusters, n)
+    vectors = centers[assignments] + 0.35 * rng.standard_normal((n, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def sample_vectors(pool, n, rng):
+    if n <= len(pool):
+        return pool[rng.choice(len(pool), n, replace=False)]
+    # Not enough real vectors: jitter copies of them
+    extra = pool[rng.integers(0, len(pool), n - len(pool))] + 0.01 * rng.standard_normal((n - len(pool), pool.shape[1])).astype('float32')
+    vectors = np.vstack([pool, extra]).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def latency_percentiles(index, queries, k):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(row_found) & set(row_truth)) for row_found, row_truth in zip(found, truth))
+    return hits / truth.size
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark for memory index types")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--types', nargs='+', default=list(index_manager.INDEX_TYPES), choices=index_manager.INDEX_TYPES)
+    parser.add_argument('--metric', default='ip', choices=('l2', 'ip'))
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--dimension', type=int, default=index_manager.DEFAULT_DIMENSION)
+    parser.add_argument('--from-index', help="Sample vectors from an existing index file instead of synthetic data")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    pool = None
+    if args.from_index:
+        _, pool = index_manager.extract_vectors(faiss.read_index(args.from_index))
+        pool = np.ascontiguousarray(pool, dtype='float32')
+        args.dimension = pool.shape[1]
+        print(f"Loaded {len(pool)} vectors from {args.from_index}")
+
+    print(f"{'size':>9} {'type':>9} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8}")
+    for size in args.sizes:
+        if pool is not None:
+            vectors = sample_vectors(pool, size + args.queries, rng)
+        else:
+            vectors = synthetic_vectors(size + args.queries, args.dimension, rng)
+        corpus, queries = vectors[:size], vectors[size:]
+        ids = np.arange(size, dtype='int64')
+
+        exact = index_manager.build_index(args.dimension, 'flat', args.metric)
+        exact.add_with_ids(corpus, ids)
+        _, truth = exact.search(queries, args.k)
+
+        for index_type in args.types:
+            start = time.perf_counter()
+            index = index_manager.build_index(args.dimension, index_type, args.metric, training_vectors=corpus)
+            index.add_with_ids(corpus, ids)
+            build_seconds = time.perf_counter() - start
+            _, found = index.search(queries, args.k)
+            p50, p99 = latency_percentiles(index, queries, args.k)
+            print(f"{size:>9} {index_type:>9} {recall_at_k(found, truth):>10.3f} {p50:>8.3f} {p99:>8.3f} {build_seconds:>8.1f}")
+            del index
+        del exact
+
+if __name__ == "__main__":
+    main()
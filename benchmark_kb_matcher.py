@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Compare knowledgebase key matching: the original per-entry, per-key loop against
+kb_matcher.KeyMatcher, on synthetic knowledgebases of increasing size, and check that
+both pick the same entries. Builds are timed separately since the matcher is built
+once per knowledgebase version, not per turn.
+
+Example:
+    python benchmark_kb_matcher.py --entries 1000 10000 --history-chars 12000
+"""
+
+import re
+import time
+import random
+import argparse
+import numpy as np
+import kb_matcher
+
+WORDS = ("garden tea coast journal song weekend piano harbor lantern winter orchard "
+         "letter violin market river meadow attic recipe chess novel kettle festival").split()
+
+def legacy_match(entries, text):
+    """get_key_matches' original loop"""
+    matched = []
+    for position, entry in enumerate(entries):
+        for key in entry['keys']:
+            if key.startswith('/') and key.endswith('/is'):
+                if re.search(key[1:-3], text, re.IGNORECASE):
+                    matched.append(position)
+                    break
+            elif key in text:
+                matched.append(position)
+                break
+    return matched
+
+def synthetic_entries(count, keys_per_entry, regex_share, rng):
+    entries = []
+    for i in range(count):
+        keys = []
+        for _ in range(keys_per_entry):
+            if rng.random() < regex_share:
+                keys.append(f"/\\b(name{i}|alias{i})s?\\b/is" if rng.random() < 0.8 else f"/{rng.choice(WORDS)}\\s+\\d+/is")
+            else:
+                keys.append(f"{rng.choice(WORDS)} {i}-{rng.randrange(1000)}")
+        entries.append({'keys': keys})
+    return entries
+
+def synthetic_history(entries, chars, hits, rng):
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    # Plant some real keys so there is something to find
+    for position, entry in enumerate(rng.sample(entries, min(hits, len(entries)))):
+        key = entry['keys'][0]
+        words.insert(rng.randrange(len(words)), key if not kb_matcher.is_regex_key(key) else f"Name{position}s")
+    return ' '.join(words)
+
+def time_calls(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, np.percentile(timings, 50), np.percentile(timings, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description="Knowledgebase key matching benchmark")
+    parser.add_argument('--entries', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--keys-per-entry', type=int, default=4)
+    parser.add_argument('--regex-share', type=float, default=0.1, help="Fraction of keys that are /regex/is keys")
+    parser.add_argument('--history-chars', type=int, default=12000)
+    parser.add_argument('--hits', type=int, default=20, help="Keys planted in the history")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    backend = 'pyahocorasick' if kb_matcher.ahocorasick is not None else 'pure Python'
+    print(f"Aho-Corasick backend: {backend}")
+    print(f"{'entries':>8} {'build ms':>9} {'loop p50':>9} {'loop p99':>9} {'match p50':>10} {'match p99':>10} {'speedup':>8} {'matches':>8}")
+    for count in args.entries:
+        rng = random.Random(args.seed)
+        entries = synthetic_entries(count, args.keys_per_entry, args.regex_share, rng)
+        history = synthetic_history(entries, args.history_chars, args.hits, rng)
+
+        start = time.perf_counter()
+        matcher = kb_matcher.KeyMatcher(entries)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        expected, loop_p50, loop_p99 = time_calls(lambda: legacy_match(entries, history), args.repeats)
+        found, match_p50, match_p99 = time_calls(lambda: matcher.match(history), args.repeats)
+        if found != expected:
+            print(f"✗ Mismatch at {count} entries: loop found {len(expected)}, matcher found {len(found)}")
+        print(f"{count:>8} {build_ms:>9.1f} {loop_p50:>9.2f} {loop_p99:>9.2f} {match_p50:>10.2f} {match_p99:>10.2f} "
+              f"{loop_p50 / match_p50 if match_p50 else float('inf'):>7.1f}x {len(found):>8}")
+
+if __name__ == "__main__":
+    main()
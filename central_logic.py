@@ -19,6 +19,7 @@ import open_router
 import prompt_builder
 import executive_functioning
 import loaders
+import log_writer
 import post_processing
 import error_handler
 import ltm
@@ -445,6 +446,7 @@ async def generate_response(username, retry=False, persona="Rhoda", type="defaul
 async def wakeup_ritual():
 	"""Async version of wakeup_ritual"""
 	today, yesterday = loaders.journal_date()
+	await asyncio.to_thread(log_writer.flush, f"Logs/{today}.txt")
 	async with aiofiles.open(f"Logs/{today}.txt", 'r') as f:
 		print(f"//Log opened...")
 		log_content = await f.read()
@@ -7,6 +7,13 @@ import threading
 DB_PATH = 'fellowship_demo.db'
 db_lock = threading.Lock()
 
+# Bumped on every write to a table group (under db_lock) so in-memory copies, like
+# knowledgebase_search's snapshot and relevance's TF-IDF indexes, know to reload
+data_versions = {'kb': 0, 'planner': 0, 'reminders': 0}
+
+def bump_data_version(name):
+    data_versions[name] += 1
+
 def init_db():
     """Initialize the SQLite database with users table"""
     with db_lock:
@@ -565,6 +572,7 @@ def add_planner_event(event_data):
             
             cursor.execute(query, list(event_data.values()))
             conn.commit()
+            bump_data_version('planner')
             return cursor.lastrowid
         finally:
             conn.close()
@@ -590,6 +598,7 @@ def update_planner_event(event_id, event_data):
             params = list(event_data.values()) + [event_id]
             cursor.execute(query, params)
             conn.commit()
+            bump_data_version('planner')
             return cursor.rowcount > 0
         finally:
             conn.close()
@@ -603,6 +612,7 @@ def delete_planner_event(event_id):
         try:
             cursor.execute('DELETE FROM planner_events WHERE id = ?', (event_id,))
             conn.commit()
+            bump_data_version('planner')
             return cursor.rowcount > 0
         finally:
             conn.close()
@@ -693,6 +703,7 @@ def add_reminder(reminder_data):
             
             cursor.execute(query, list(reminder_data.values()))
             conn.commit()
+            bump_data_version('reminders')
             return cursor.lastrowid
         finally:
             conn.close()
@@ -783,6 +794,7 @@ def add_kb_category(category_data):
             
             cursor.execute(query, list(category_data.values()))
             conn.commit()
+            bump_data_version('kb')
             return cursor.lastrowid
         finally:
             conn.close()
@@ -864,6 +876,7 @@ def add_kb_entry(entry_data):
             
             cursor.execute(query, list(entry_data.values()))
             conn.commit()
+            bump_data_version('kb')
             return entry_data.get('id', cursor.lastrowid)
         finally:
             conn.close()
@@ -894,6 +907,7 @@ def update_kb_entry(entry_id, entry_data):
             params = list(entry_data.values()) + [entry_id]
             cursor.execute(query, params)
             conn.commit()
+            bump_data_version('kb')
             return cursor.rowcount > 0
         finally:
             conn.close()
@@ -907,6 +921,7 @@ def delete_kb_entry(entry_id):
         try:
             cursor.execute('DELETE FROM kb_entries WHERE id = ?', (entry_id,))
             conn.commit()
+            bump_data_version('kb')
             return cursor.rowcount > 0
         finally:
             conn.close()
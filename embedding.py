@@ -1,11 +1,18 @@
 import os
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"
-
+# EMBEDDING_DEVICE=cpu runs the server on a CPU-only box (fp16 is GPU-only, so it's turned off there)
+EMBEDDING_DEVICE = os.getenv('EMBEDDING_DEVICE', 'cuda')
+os.environ["CUDA_VISIBLE_DEVICES"] = "" if EMBEDDING_DEVICE == 'cpu' else os.getenv('EMBEDDING_CUDA_DEVICE', "0")
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
 import torch
 import torch.nn.functional as F
 from transformers import AutoTokenizer, AutoModel, AutoConfig
 from flask import Flask, request, jsonify, send_file
 import faiss
+import index_manager
 import numpy as np
 import json
 from datetime import datetime
@@ -14,14 +21,18 @@ from FlagEmbedding import BGEM3FlagModel
 
 app = Flask(__name__)
 
-directory_path="D:\\Models\\Models\\Cache\\models--BAAI--bge-m3\\snapshots\\50f9396f75618b3389c1fd1068a1ff58dc7b5b26"
+directory_path=os.getenv('EMBEDDING_MODEL_PATH', "D:\\Models\\Models\\Cache\\models--BAAI--bge-m3\\snapshots\\50f9396f75618b3389c1fd1068a1ff58dc7b5b26")
 print(f"Directory path loaded!")
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 # Model loading from local directory
 
 model_path = directory_path  # Adjust if your structure differs
-model = BGEM3FlagModel(model_path, use_fp16=True)
+use_fp16 = EMBEDDING_DEVICE != 'cpu' and torch.cuda.is_available()
+if not torch.cuda.is_available():
+    torch.set_num_threads(int(os.getenv('EMBEDDING_CPU_THREADS', os.cpu_count() or 1)))
+model = BGEM3FlagModel(model_path, use_fp16=use_fp16)
+print(f"Embedding model loaded on {'cuda' if torch.cuda.is_available() else 'cpu'} (fp16={use_fp16})")
 
 import random
 
@@ -45,8 +56,9 @@ dimension=768
 
 def create_faiss_index(dimension, index_name):
     """Creates a new Faiss index and saves it to disk."""
-    base_index = faiss.IndexFlatL2(dimension)  # Most common index type for embeddings
-    index = faiss.IndexIDMap(base_index)
+    # Type/metric come from MEMORY_INDEX_TYPE/MEMORY_INDEX_METRIC (flat L2 by default);
+    # IVF types start flat until rebuilt from real vectors with rebuild_memory_index.py
+    index = index_manager.build_index(dimension)
     index_path = f"{index_name}.index"
     faiss.write_index(index, index_path) 
     return index_path
@@ -101,6 +113,121 @@ def mean_pooling(model_output, attention_mask):
     input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
     return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
+text_embedding_dim = 768  # Change this to the desired dimension size
+# Texts per model.encode forward pass; bounds GPU memory however many texts a request batch holds
+EMBED_ENCODE_BATCH = int(os.getenv('EMBED_ENCODE_BATCH', 12))
+
+def encode_texts(texts, batch_size=EMBED_ENCODE_BATCH):
+    """Dense bge-m3 vectors for a list of texts, truncated to text_embedding_dim and L2-normalized"""
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        max_length=8192,
+    )['dense_vecs']
+    embeddings = torch.from_numpy(np.asarray(embeddings).reshape(len(texts), -1))
+    embeddings = embeddings.type(torch.float32)
+    return F.normalize(embeddings[:, :text_embedding_dim], p=2, dim=1).numpy()
+
+#=====REQUEST BATCHING========#
+
+# Requests arriving within EMBED_BATCH_WAIT_MS of each other are encoded together (up to
+# EMBED_MAX_BATCH texts, in forward passes of EMBED_ENCODE_BATCH)
+EMBED_MAX_BATCH = int(os.getenv('EMBED_MAX_BATCH', 32))
+EMBED_BATCH_WAIT_MS = float(os.getenv('EMBED_BATCH_WAIT_MS', 5))
+
+class EmbeddingBatcher:
+    """
+    Queues texts from concurrent requests and encodes them together on one worker
+    thread. Each caller blocks on a Future for its own rows of the batch.
+    """
+
+    def __init__(self, max_batch=EMBED_MAX_BATCH, wait_ms=EMBED_BATCH_WAIT_MS):
+        self.max_batch = max_batch
+        self.wait_seconds = wait_ms / 1000
+        self.queue = queue.Queue()
+        self.metrics_lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.largest_batch = 0
+        self.batch_sizes = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.encode_seconds = 0.0
+        self.thread = threading.Thread(target=self.run, name="embedding-batcher", daemon=True)
+        self.thread.start()
+
+    def embed(self, texts):
+        """Encode texts (joining whatever else is queued) and return their vectors as an array"""
+        future = Future()
+        self.queue.put((list(texts), time.perf_counter(), future))
+        return future.result()
+
+    def collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait runs out"""
+        pending = [self.queue.get()]
+        count = len(pending[0][0])
+        deadline = time.perf_counter() + self.wait_seconds
+        while count < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def run(self):
+        while True:
+            pending = self.collect()
+            started = time.perf_counter()
+            texts = [text for item in pending for text in item[0]]
+            try:
+                vectors = encode_texts(texts)
+            except Exception as e:
+                for _, _, future in pending:
+                    future.set_exception(e)
+                continue
+            encode_seconds = time.perf_counter() - started
+
+            offset = 0
+            for item_texts, _, future in pending:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+            self.record(pending, len(texts), started, encode_seconds)
+
+    def record(self, pending, batch_size, started, encode_seconds):
+        with self.metrics_lock:
+            self.batches += 1
+            self.texts += batch_size
+            self.largest_batch = max(self.largest_batch, batch_size)
+            self.batch_sizes[batch_size] = self.batch_sizes.get(batch_size, 0) + 1
+            for _, queued_at, _ in pending:
+                waited = started - queued_at
+                self.queue_wait_total += waited
+                self.queue_wait_max = max(self.queue_wait_max, waited)
+            self.encode_seconds += encode_seconds
+
+    def metrics(self):
+        with self.metrics_lock:
+            return {
+                'max_batch': self.max_batch,
+                'batch_wait_ms': self.wait_seconds * 1000,
+                'queue_depth': self.queue.qsize(),
+                'batches': self.batches,
+                'texts': self.texts,
+                'mean_batch_size': self.texts / self.batches if self.batches else 0,
+                'largest_batch': self.largest_batch,
+                'batch_size_counts': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                'mean_queue_wait_ms': (self.queue_wait_total / self.texts * 1000) if self.texts else 0,
+                'max_queue_wait_ms': self.queue_wait_max * 1000,
+                'encode_seconds': self.encode_seconds,
+            }
+
+batcher = EmbeddingBatcher()
+
 @app.route('/pureembed', methods=['POST'])
 def get_embedding():
     try:
@@ -108,23 +235,36 @@ def get_embedding():
         data = request.get_json(force=True)
         text = data['text']
         unique_id = data['uuid']
-        
-        embeddings = model.encode(
-            [text],  # Embed single text at a time
-            batch_size=12,  
-            max_length=8192,
-        )['dense_vecs']
-        
-        embeddings = torch.from_numpy(embeddings)
-        embeddings = embeddings.type(torch.float32)    
-        text_embedding_dim = 768  # Change this to the desired dimension size
-        embeddings = F.normalize(embeddings[:, :text_embedding_dim], p=2, dim=1).numpy()
-        
+
+        embeddings = batcher.embed([text])
+
         # Return the embeddings as JSON response
         return jsonify({'embedding': embeddings.tolist(), 'uuid': unique_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/pureembed_batch', methods=['POST'])
+def get_embeddings_batch():
+    """Several texts in one request: {'texts': [...], 'uuids': [...]} -> {'embeddings': [...], 'uuids': [...]}"""
+    try:
+        data = request.get_json(force=True)
+        texts = data['texts']
+        uuids = data.get('uuids') or [None] * len(texts)
+        if len(uuids) != len(texts):
+            return jsonify({'error': 'texts and uuids must be the same length'}), 400
+        if not texts:
+            return jsonify({'embeddings': [], 'uuids': []})
+
+        embeddings = batcher.embed(texts)
+
+        return jsonify({'embeddings': embeddings.tolist(), 'uuids': uuids})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def embedding_metrics():
+    return jsonify(batcher.metrics())
+
 @app.route('/search', methods=['POST'])
 def search():
     try:
@@ -0,0 +1,286 @@
+"""
+Async client for the embedding service (embedding.py).
+
+One pooled keep-alive aiohttp session per process, owned by a background thread's
+event loop. aiohttp sessions are bound to the loop that created them and Flask runs
+each async view on its own short-lived loop, so requests are handed to the client's
+loop and awaited from the caller's; memory lookups reuse warm connections across
+requests instead of paying a TCP handshake per call. Each endpoint gets its own
+timeout; a slow or unreachable service returns None instead of hanging the prompt build.
+
+Query embeddings are cached by a hash of the text (LRU with a TTL, optionally shared
+through Redis), and concurrent requests for the same text share a single call to the
+service, whichever request loop they come from. With EMBEDDING_BACKEND=local, embeds
+are computed in process by local_embedder instead, and the service is only used if the
+local model can't load.
+"""
+import os
+import time
+import base64
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+import aiohttp
+import numpy as np
+import local_embedder
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_SERVICE_URL = os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')
+EMBEDDING_MAX_CONNECTIONS = int(os.getenv('EMBEDDING_MAX_CONNECTIONS', 20))
+EMBEDDING_KEEPALIVE_TIMEOUT = float(os.getenv('EMBEDDING_KEEPALIVE_TIMEOUT', 60))
+EMBEDDING_CONNECT_TIMEOUT = float(os.getenv('EMBEDDING_CONNECT_TIMEOUT', 3))
+# Total seconds allowed per request; query embeds are on the turn's critical path,
+# writes to the service-side indexes can take longer
+EMBEDDING_QUERY_TIMEOUT = float(os.getenv('EMBEDDING_QUERY_TIMEOUT', 10))
+EMBEDDING_WRITE_TIMEOUT = float(os.getenv('EMBEDDING_WRITE_TIMEOUT', 30))
+
+ENDPOINT_TIMEOUTS = {
+    'pureembed': EMBEDDING_QUERY_TIMEOUT,
+    'pureembed_batch': EMBEDDING_WRITE_TIMEOUT,
+    'testsearch': EMBEDDING_QUERY_TIMEOUT,
+    'notesearch': EMBEDDING_QUERY_TIMEOUT,
+    'booksearch': EMBEDDING_QUERY_TIMEOUT,
+    'journalsearch': EMBEDDING_QUERY_TIMEOUT,
+    'delete': EMBEDDING_QUERY_TIMEOUT,
+    'notesembed': EMBEDDING_WRITE_TIMEOUT,
+    'testembed': EMBEDDING_WRITE_TIMEOUT,
+    'bookembed': EMBEDDING_WRITE_TIMEOUT,
+    'journalembed': EMBEDDING_WRITE_TIMEOUT,
+}
+
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 512))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', 3600))
+# Share cached vectors between processes/restarts through Redis (off by default)
+EMBEDDING_CACHE_REDIS = os.getenv('EMBEDDING_CACHE_REDIS', 'false').lower() in ('1', 'true', 'yes')
+EMBEDDING_CACHE_PREFIX = 'embedding_cache:'
+
+def text_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """In-process LRU of text hash -> embedding rows, with a TTL; safe to share between loops"""
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE, ttl=EMBEDDING_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+embedding_cache = EmbeddingCache()
+
+async def redis_get_embedding(key):
+    """Cached rows from Redis (stored as base64 float32), or None"""
+    if not EMBEDDING_CACHE_REDIS:
+        return None
+    import loaders  # loaders imports ltm, which imports this module
+    try:
+        client = await loaders.get_redis_client()
+        value = await client.get(f"{EMBEDDING_CACHE_PREFIX}{key}")
+    except Exception as e:
+        print(f"++CONSOLE: Embedding cache Redis read failed: {e}")
+        return None
+    if not value:
+        return None
+    dimension, encoded = value.split(':', 1)
+    return np.frombuffer(base64.b64decode(encoded), dtype='float32').reshape(-1, int(dimension)).tolist()
+
+async def redis_put_embedding(key, embedding):
+    if not EMBEDDING_CACHE_REDIS:
+        return
+    import loaders
+    rows = np.asarray(embedding, dtype='float32')
+    rows = rows.reshape(-1, rows.shape[-1])
+    value = f"{rows.shape[1]}:{base64.b64encode(rows.tobytes()).decode('ascii')}"
+    try:
+        client = await loaders.get_redis_client()
+        await client.set(f"{EMBEDDING_CACHE_PREFIX}{key}", value, ex=int(EMBEDDING_CACHE_TTL))
+    except Exception as e:
+        print(f"++CONSOLE: Embedding cache Redis write failed: {e}")
+
+class EmbeddingClient:
+    """Pooled client for every embedding-service endpoint"""
+
+    def __init__(self, base_url=EMBEDDING_SERVICE_URL):
+        self.base_url = base_url.rstrip('/')
+        self.loop = None
+        self.session = None
+        self.lock = threading.Lock()
+        # text hash -> Task for embeds currently being fetched (client loop only)
+        self.inflight = {}
+
+    def build_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=EMBEDDING_MAX_CONNECTIONS,
+            keepalive_timeout=EMBEDDING_KEEPALIVE_TIMEOUT,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def client_loop(self):
+        """The long-lived event loop (on its own daemon thread) that owns the session"""
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="embedding-client", daemon=True).start()
+            return self.loop
+
+    async def on_client_loop(self, coroutine):
+        """Await coroutine on the client's loop from whatever loop is running"""
+        loop = self.client_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        # Cancelling the caller cancels the request on the client loop too
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    async def close(self):
+        """Close the shared session (scripts, before exiting); the next request opens a new one"""
+        async def close_session():
+            session, self.session = self.session, None
+            if session is not None:
+                await session.close()
+        await self.on_client_loop(close_session())
+
+    async def post(self, endpoint, payload):
+        """
+        POST JSON to an endpoint and return the decoded response, or None on a
+        non-200 status, timeout or connection error.
+        """
+        return await self.on_client_loop(self.post_on_client_loop(endpoint, payload))
+
+    async def post_on_client_loop(self, endpoint, payload):
+        timeout = aiohttp.ClientTimeout(
+            total=ENDPOINT_TIMEOUTS.get(endpoint, EMBEDDING_QUERY_TIMEOUT),
+            connect=EMBEDDING_CONNECT_TIMEOUT,
+        )
+        if self.session is None or self.session.closed:
+            self.session = self.build_session()
+        session = self.session
+        try:
+            async with session.post(f"{self.base_url}/{endpoint}", json=payload, timeout=timeout) as response:
+                if response.status == 200:
+                    return await response.json(content_type=None)
+                error_text = await response.text()
+                print(f"++CONSOLE: Embedding service /{endpoint} returned {response.status}: {error_text}")
+                return None
+        except asyncio.TimeoutError:
+            print(f"++CONSOLE: Embedding service /{endpoint} timed out after {timeout.total}s")
+            return None
+        except aiohttp.ClientError as e:
+            print(f"++CONSOLE: Embedding service /{endpoint} request failed: {e}")
+            return None
+
+    async def embed(self, text, uuid='search_query'):
+        """Embedding only ({'uuid', 'embedding'}); the vector is stored/searched locally"""
+        key = text_key(text)
+        embedding = embedding_cache.get(key)
+        if embedding is None:
+            embedding = await self.fetch_embedding(key, text)
+        if embedding is None:
+            return None
+        return {'embedding': embedding, 'uuid': uuid}
+
+    async def fetch_embedding(self, key, text):
+        """Embed text through Redis or the service; identical concurrent requests from any loop share one call"""
+        return await self.on_client_loop(self.shared_fetch(key, text))
+
+    async def shared_fetch(self, key, text):
+        """Join or start the fetch for key; runs on the client loop, which is the only thread touching inflight"""
+        task = self.inflight.get(key)
+        if task is not None:
+            with embedding_cache.lock:
+                embedding_cache.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self.fetch_uncached(key, text))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded so one caller being cancelled doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def fetch_uncached(self, key, text):
+        embedding = await redis_get_embedding(key)
+        if embedding is None:
+            embedding = await self.local_embeddings([text])
+            if embedding is None:
+                response = await self.post('pureembed', {'text': text, 'uuid': 'search_query'})
+                embedding = response.get('embedding') if response else None
+            if embedding is not None:
+                await redis_put_embedding(key, embedding)
+        if embedding is not None:
+            embedding_cache.put(key, embedding)
+        return embedding
+
+    async def local_embeddings(self, texts):
+        """Rows from the in-process model when EMBEDDING_BACKEND=local, else None"""
+        if not local_embedder.enabled():
+            return None
+        vectors = await local_embedder.embed_texts(texts)
+        return vectors.tolist() if vectors is not None else None
+
+    async def embed_many(self, texts, uuids=None):
+        """Several embeddings in one request ({'uuids', 'embeddings'}, rows in input order); cached texts are skipped"""
+        texts = list(texts)
+        uuids = list(uuids) if uuids is not None else [None] * len(texts)
+        keys = [text_key(text) for text in texts]
+        rows = [embedding_cache.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            vectors = await self.local_embeddings([texts[i] for i in missing])
+            if vectors is None:
+                response = await self.post('pureembed_batch', {'texts': [texts[i] for i in missing], 'uuids': [uuids[i] for i in missing]})
+                if response is None:
+                    return None
+                vectors = response['embeddings']
+            for i, vector in zip(missing, vectors):
+                rows[i] = [vector]
+                embedding_cache.put(keys[i], rows[i])
+        return {'embeddings': [row[0] for row in rows], 'uuids': uuids}
+
+    async def search(self, endpoint, text):
+        """Service-side search against one of its own indexes (testsearch, notesearch, booksearch...)"""
+        return await self.post(endpoint, {'text': text})
+
+    async def upsert(self, endpoint, text, unique_id):
+        """Service-side embed-and-store (notesembed, testembed, bookembed)"""
+        return await self.post(endpoint, {'text': text, 'uuid': unique_id})
+
+    async def journal_upsert(self, text, unique_id):
+        return await self.post('journalembed', {'journal_entry': text, 'uuid': unique_id})
+
+    async def delete(self, unique_id, index_name):
+        return await self.post('delete', {'unique_id': str(unique_id), 'index_name': index_name})
+
+client = EmbeddingClient()
@@ -0,0 +1,96 @@
+"""
+In-memory cache for small files that get re-read on every prompt build
+(Fleeting/*.txt, todo.json, action_history.json, calendar.json, journal entries).
+
+Entries are validated with os.stat: a cached value is returned only while the file's
+mtime, size and inode are unchanged, so edits from other processes (or by hand) are
+picked up on the next read. Writers in this codebase also call invalidate() after
+writing, so a same-size rewrite within the filesystem's mtime granularity can't be missed.
+"""
+import os
+import copy
+import glob
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# Upper bound on cached files; least recently used entries are dropped first
+FILE_CACHE_MAX_ENTRIES = int(os.getenv('FILE_CACHE_MAX_ENTRIES', 256))
+# Directory listings are re-scanned after this many seconds even if the directory mtime is unchanged
+# (rewriting an existing file changes its own mtime, not the directory's)
+FILE_CACHE_LISTING_TTL = float(os.getenv('FILE_CACHE_LISTING_TTL', 30))
+
+cache = OrderedDict()
+listings = {}
+cache_lock = threading.Lock()
+
+def file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def load(path, parse=None, encoding='utf-8'):
+    """
+    Return the contents of path (passed through parse, if given), reading the file only when
+    it changed since the last call. Raises FileNotFoundError like open() does.
+    """
+    key = (os.path.abspath(path), parse)
+    signature = file_signature(path)
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is not None and entry[0] == signature:
+            cache.move_to_end(key)
+            return entry[1]
+    with open(path, 'r', encoding=encoding) as f:
+        contents = f.read()
+    value = parse(contents) if parse else contents
+    with cache_lock:
+        cache[key] = (signature, value)
+        cache.move_to_end(key)
+        while len(cache) > FILE_CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+    return value
+
+def load_text(path, encoding='utf-8'):
+    return load(path, encoding=encoding)
+
+def load_json(path, encoding='utf-8'):
+    """Parsed JSON for path; returns a copy so callers can modify it without touching the cache"""
+    return copy.deepcopy(load(path, json.loads, encoding))
+
+def invalidate(path=None):
+    """Forget cached contents for path (or everything); call after writing the file"""
+    with cache_lock:
+        if path is None:
+            cache.clear()
+            listings.clear()
+            return
+        absolute = os.path.abspath(path)
+        for key in [k for k in cache if k[0] == absolute]:
+            del cache[key]
+        listings.pop(os.path.dirname(absolute), None)
+
+def latest_file(directory, pattern='*'):
+    """
+    Most recently modified file in directory matching pattern, or None. The scan is reused
+    while the directory's mtime is unchanged and FILE_CACHE_LISTING_TTL hasn't elapsed.
+    """
+    absolute = os.path.abspath(directory)
+    directory_mtime = os.stat(directory).st_mtime_ns
+    now = time.monotonic()
+    with cache_lock:
+        entry = listings.get(absolute)
+        if entry is not None and entry[0] == (directory_mtime, pattern) and now - entry[1] < FILE_CACHE_LISTING_TTL:
+            return entry[2]
+    latest_path, latest_mtime = None, None
+    for path in glob.glob(os.path.join(directory, pattern)):
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            # Deleted between glob and stat
+            continue
+        if latest_mtime is None or mtime > latest_mtime:
+            latest_path, latest_mtime = path, mtime
+    with cache_lock:
+        listings[absolute] = ((directory_mtime, pattern), now, latest_path)
+    return latest_path
@@ -22,6 +22,9 @@ load_dotenv()
 # Import existing modules
 import central_logic
 import loaders
+import log_writer
+import memory_store
+import memory_ingest
 import prompt_builder
 import executive_functioning
 import post_processing
@@ -43,9 +46,6 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
     if not redis_key:
         redis_key = f"user:{username}"
     
-    # Store username in Redis for this session
-    await loaders.redis_save("username", username, username)
-    
     # Get current date for recording organization
     current_date = central_logic.recording_date()
     
@@ -84,17 +84,19 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
             'timeout_duration': timeout_duration
         }
     
-    # Save transcription to Redis with user namespace
-    await loaders.redis_save("transcription", transcription, username)
+    # Generate unique ID for transcription
+    unique_id_transcription = loaders.generate_random_id()
     
-    # Update conversation history
-    await loaders.save_to_fleeting_convo_history(transcription, username, username)
+    # Store username/transcription, update conversation history and swap in the new
+    # transcript id in one Redis round trip
+    turn_state = loaders.TurnStateWriter(username)
+    turn_state.set("username", username).set("transcription", transcription)
+    await loaders.queue_fleeting_convo_history(turn_state, transcription, username)
+    turn_state.get("last_response_id").set("last_transcript_id", unique_id_transcription)
+    previous_message = (await turn_state.flush()).get("last_response_id")
     await loaders.save_transcription(transcription)
     
-    # Generate unique ID and metadata for transcription
-    unique_id_transcription = loaders.generate_random_id()
-    previous_message = await loaders.redis_load("last_response_id", username)
-    
+    # Build metadata for transcription
     metadata_transcription = {
         'speaker': username,
         'message': f"{datetime.utcnow().isoformat()} {username}: {transcription}",
@@ -103,31 +105,31 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
         'time': datetime.utcnow().isoformat()
     }
     
-    # Save metadata
-    await loaders.redis_save("last_transcript_id", unique_id_transcription, username)
-    
     if previous_message:
-        previous_json_path = os.path.join('Memory', 'JSONs', f'{previous_message}.json')
-        if os.path.exists(previous_json_path):
-            previous_json = await loaders.load_json(previous_json_path)
-            previous_json["resulting_message_id"] = unique_id_transcription
-            await loaders.save_json(previous_json_path, previous_json)
+        # Link the previous message to this one in place
+        memory_store.set_record_field(previous_message, "resulting_message_id", unique_id_transcription)
     
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_transcription}.json'), metadata_transcription)
+    memory_store.put_record(unique_id_transcription, metadata_transcription)
     
-    # Store in long-term memory (skip await to avoid blocking)
-    # This will run in background without blocking the response
-    asyncio.create_task(ltm.upsert(transcription, unique_id_transcription))  # Fire and forget
+    # Queue for long-term memory (embedded and indexed in batches by the ingest worker;
+    # only waits here if the queue is full)
+    await memory_ingest.submit(transcription, unique_id_transcription, username, metadata_transcription['time'])
     
     # Generate response
     response, conversation_ended = await generate_response_for_user(username, transcription, document_content, image_url)
     
-    # Save response to Redis
-    await loaders.redis_save("response", response, username)
+    unique_id_response = loaders.generate_random_id()
     
-    # Update conversation history with response IMMEDIATELY
-    await loaders.save_to_fleeting_convo_history(response, 'Rhoda', username)
+    # Update conversation history with response IMMEDIATELY, record the response id and
+    # stash the response in one round trip. The stash lets generate_response_for_user
+    # spot a retry if we die before the log write below; the temporary values are reset
+    # once the response is logged.
+    await loaders.queue_fleeting_convo_history(turn_state, response, 'Rhoda')
+    turn_state.set("last_response_id", unique_id_response).set("response", response)
+    await turn_state.flush()
     await loaders.save_to_daily_log_with_label(response, "Rhoda")
+    turn_state.set("response", "").set("vectorized", "").set("printed", "")
+    await turn_state.flush()
     
     # Debug session_id and socketio
     print(f"DEBUG: session_id={session_id}, socketio={socketio}, response_length={len(response)}")
@@ -146,7 +148,7 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
                 new_loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(new_loop)
                 # Run the synthesis
-                new_loop.run_until_complete(synthesize_and_send_audio(response, username, session_id, socketio))
+                new_loop.run_until_complete(loaders.releases_loop_clients(synthesize_and_send_audio)(response, username, session_id, socketio))
                 new_loop.close()
                 print(f"Audio synthesis completed for {username}")
             except Exception as e:
@@ -165,10 +167,6 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
     audio_url = None  # Audio will be sent via WebSocket when ready
     
     # Create response metadata
-    unique_id_response = loaders.generate_random_id()
-    # Store response in long-term memory (skip await to avoid blocking) 
-    asyncio.create_task(ltm.upsert(response, unique_id_response))  # Fire and forget
-    
     metadata_response = {
         'speaker': 'Rhoda',
         'message': f"{datetime.utcnow().isoformat()} Rhoda: {response}",
@@ -177,17 +175,15 @@ async def process_audio_input(audio_file_path, username, redis_key=None, session
         'time': datetime.utcnow().isoformat()
     }
     
+    # Queue response for long-term memory, with the same time as its record
+    await memory_ingest.submit(response, unique_id_response, 'Rhoda', metadata_response['time'])
+    
     metadata_transcription['my_response'] = unique_id_response
-    await loaders.redis_save("last_response_id", unique_id_response, username)
     
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_response}.json'), metadata_response)
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_transcription}.json'), metadata_transcription)
-
-  
-    # Reset temporary Redis values
-    await loaders.redis_save("response", "", username)
-    await loaders.redis_save("vectorized", "", username)
-    await loaders.redis_save("printed", "", username)
+    memory_store.put_records([
+        (unique_id_response, metadata_response),
+        (unique_id_transcription, metadata_transcription),
+    ])
     
     return {
         'success': True,
@@ -207,9 +203,6 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
     if not redis_key:
         redis_key = f"user:{username}"
     
-    # Store username in Redis for this session
-    await loaders.redis_save("username", username, username)
-    
     # Skip transcription step, use text directly
     transcription = text_message
     
@@ -224,16 +217,18 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
             'timeout_duration': timeout_duration
         }
     
-    # Save to Redis with user namespace
-    await loaders.redis_save("transcription", transcription, username)
-    
-    # Update conversation history
-    await loaders.save_to_fleeting_convo_history(transcription, username, username)
-    
-    # Generate unique ID and metadata
+    # Generate unique ID
     unique_id_transcription = loaders.generate_random_id()
-    previous_message = await loaders.redis_load("last_response_id", username)
     
+    # Store username/transcription, update conversation history and swap in the new
+    # transcript id in one Redis round trip
+    turn_state = loaders.TurnStateWriter(username)
+    turn_state.set("username", username).set("transcription", transcription)
+    await loaders.queue_fleeting_convo_history(turn_state, transcription, username)
+    turn_state.get("last_response_id").set("last_transcript_id", unique_id_transcription)
+    previous_message = (await turn_state.flush()).get("last_response_id")
+    
+    # Build metadata
     metadata_transcription = {
         'speaker': username,
         'message': f"{datetime.utcnow().isoformat()} {username}: {transcription}",
@@ -243,31 +238,31 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
         'input_type': 'text'
     }
     
-    # Save metadata
-    await loaders.redis_save("last_transcript_id", unique_id_transcription, username)
-    
     if previous_message:
-        previous_json_path = os.path.join('Memory', 'JSONs', f'{previous_message}.json')
-        if os.path.exists(previous_json_path):
-            previous_json = await loaders.load_json(previous_json_path)
-            previous_json["resulting_message_id"] = unique_id_transcription
-            await loaders.save_json(previous_json_path, previous_json)
+        # Link the previous message to this one in place
+        memory_store.set_record_field(previous_message, "resulting_message_id", unique_id_transcription)
     
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_transcription}.json'), metadata_transcription)
+    memory_store.put_record(unique_id_transcription, metadata_transcription)
     
-    # Store in long-term memory (skip await to avoid blocking)
-    # This will run in background without blocking the response
-    asyncio.create_task(ltm.upsert(transcription, unique_id_transcription))  # Fire and forget
+    # Queue for long-term memory (embedded and indexed in batches by the ingest worker;
+    # only waits here if the queue is full)
+    await memory_ingest.submit(transcription, unique_id_transcription, username, metadata_transcription['time'])
     
     # Generate response
     response, conversation_ended = await generate_response_for_user(username, transcription, document_content, image_url)
     
-    # Save response to Redis
-    await loaders.redis_save("response", response, username)
+    unique_id_response = loaders.generate_random_id()
     
-    # Update conversation history with response IMMEDIATELY
-    await loaders.save_to_fleeting_convo_history(response, 'Rhoda', username)
+    # Update conversation history with response IMMEDIATELY, record the response id and
+    # stash the response in one round trip. The stash lets generate_response_for_user
+    # spot a retry if we die before the log write below; the temporary values are reset
+    # once the response is logged.
+    await loaders.queue_fleeting_convo_history(turn_state, response, 'Rhoda')
+    turn_state.set("last_response_id", unique_id_response).set("response", response)
+    await turn_state.flush()
     await loaders.save_to_daily_log_with_label(response, "Rhoda")
+    turn_state.set("response", "").set("vectorized", "").set("printed", "")
+    await turn_state.flush()
     
     # Debug session_id and socketio
     print(f"DEBUG: session_id={session_id}, socketio={socketio}, response_length={len(response)}")
@@ -286,7 +281,7 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
                 new_loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(new_loop)
                 # Run the synthesis
-                new_loop.run_until_complete(synthesize_and_send_audio(response, username, session_id, socketio))
+                new_loop.run_until_complete(loaders.releases_loop_clients(synthesize_and_send_audio)(response, username, session_id, socketio))
                 new_loop.close()
                 print(f"Audio synthesis completed for {username}")
             except Exception as e:
@@ -305,10 +300,6 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
     audio_url = None  # Audio will be sent via WebSocket when ready
     
     # Create response metadata
-    unique_id_response = loaders.generate_random_id()
-    # Store response in long-term memory (skip await to avoid blocking) 
-    asyncio.create_task(ltm.upsert(response, unique_id_response))  # Fire and forget
-    
     metadata_response = {
         'speaker': 'Rhoda',
         'message': f"{datetime.utcnow().isoformat()} Rhoda: {response}",
@@ -317,16 +308,15 @@ async def process_text_input(text_message, username, redis_key=None, session_id=
         'time': datetime.utcnow().isoformat()
     }
     
-    metadata_transcription['my_response'] = unique_id_response
-    await loaders.redis_save("last_response_id", unique_id_response, username)
+    # Queue response for long-term memory, with the same time as its record
+    await memory_ingest.submit(response, unique_id_response, 'Rhoda', metadata_response['time'])
     
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_response}.json'), metadata_response)
-    await loaders.save_json(os.path.join('Memory', 'JSONs', f'{unique_id_transcription}.json'), metadata_transcription)
+    metadata_transcription['my_response'] = unique_id_response
     
-    # Reset temporary Redis values
-    await loaders.redis_save("response", "", username)
-    await loaders.redis_save("vectorized", "", username)
-    await loaders.redis_save("printed", "", username)
+    memory_store.put_records([
+        (unique_id_response, metadata_response),
+        (unique_id_transcription, metadata_transcription),
+    ])
     
     return {
         'success': True,
@@ -429,6 +419,7 @@ async def generate_response_for_user(username, transcription, document_content=N
         # Check if response is already in log (retry scenario)
         today = datetime.now().strftime('%Y-%m-%d')
         log_path = f"Logs/{today}.txt"
+        await asyncio.to_thread(log_writer.flush, log_path)
         if os.path.exists(log_path):
             with open(log_path, 'r') as f:
                 log_content = f.read()
@@ -10,33 +10,36 @@ import executive_functioning
 import ltm
 import error_handler
 import local_embedding_handler
+import index_manager
 import numpy as np
 import faiss
-import aiohttp
+import embedding_client
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+SUMMARY_INDEX_PATH = ltm.SUMMARY_INDEX_PATH
+
 @error_handler.if_errors
-async def build_header(username=None):
+async def build_header(username=None, snapshot=None):
+    """Pass a loaders.load_turn_snapshot() result to read held_thought/last_message/convo_start without extra round trips"""
     header = ""
     # Get username if not provided
     if not username:
-        username = await loaders.redis_load("username")
-    convo_start_time = await get_convo_start_time(username)
-    held_thought = await loaders.redis_load("held_thought")
+        username = snapshot["username"] if snapshot is not None else await loaders.redis_load("username")
+    convo_start_time = await get_convo_start_time(username, snapshot)
+    held_thought = snapshot["held_thought"] if snapshot is not None else await loaders.redis_load("held_thought")
     if held_thought and held_thought is not None:
         header += f"//CURRENTLY HELD THOUGHT: {held_thought}\n"
-    current_time, time_difference, last_message_time = await calculate_time_difference(username)
+    current_time, time_difference, last_message_time = await calculate_time_difference(username, snapshot)
     print(f"++CONSOLE: Current time: {current_time}")
     print(f"++CONSOLE: Last message time: {last_message_time}")
     print(f"++CONSOLE: Time Difference: {time_difference}")
     if last_message_time.date() != current_time.date():
         print(f"++CONSOLE: Last conversation yesterday! Resetting fleeting...")
         header += "This is my first conversation of the day on this interface.\n"
-        fleeting = await loaders.redis_load("conversation_history", username)
-        if fleeting and fleeting is not None:
+        if await loaders.conversation_history_exists(username):
             await remove_fleeting(username)
             # MAGGIE-ONLY TODO: logic to summarize short_term and insert into daily_summary
             await loaders.redis_save("short_term", "")
@@ -45,13 +48,11 @@ async def build_header(username=None):
     elif time_difference > timedelta(minutes=30):
         print(f"++CONSOLE: Last conversation more than 30 minutes ago, so things are probably reset! Resetting fleeting...")
         header += "It's been more than a half hour since our last conversation on this interface.\n"
-        fleeting = await loaders.redis_load("conversation_history", username)
-        if fleeting and fleeting is not None:
+        if await loaders.conversation_history_exists(username):
             await remove_fleeting(username)
     elif last_message_time == convo_start_time:
         print(f"++CONSOLE: Last message time == convo_start_time, meaning this is a new conversation; clearing fleeting for good measure and updating convo_start_time")
-        fleeting = await loaders.redis_load("conversation_history", username)
-        if fleeting and fleeting is not None:
+        if await loaders.conversation_history_exists(username):
             await remove_fleeting(username)
         if current_time:
             await loaders.redis_save("convo_start", current_time.strftime('%Y-%m-%dT%H:%M:%S.%f'), username)
@@ -74,8 +75,11 @@ async def build_header(username=None):
     return header
 
 @error_handler.if_errors
-async def get_last_message_time(current_time, username=None):
-    last_message = await loaders.redis_load("last_message", username)
+async def get_last_message_time(current_time, username=None, snapshot=None):
+    if snapshot is not None:
+        last_message = snapshot["last_message"]
+    else:
+        last_message = await loaders.redis_load("last_message", username)
     if last_message:
         last_message_timestamp = last_message.strip()
         print(f"++CONSOLE: Last message timestamp located! Cleaning.")
@@ -93,11 +97,14 @@ async def set_current_time_as_last_message(username=None):
     await loaders.redis_save("last_message", current_time.strftime('%Y-%m-%dT%H:%M:%S.%f'), username)
 
 @error_handler.if_errors
-async def get_convo_start_time(username=None):
-    current_time, time_difference, last_message_time = await calculate_time_difference(username)
+async def get_convo_start_time(username=None, snapshot=None):
+    current_time, time_difference, last_message_time = await calculate_time_difference(username, snapshot)
     convo_start_time=""
     try:
-        convo_start = await loaders.redis_load("convo_start", username)
+        if snapshot is not None:
+            convo_start = snapshot["convo_start"]
+        else:
+            convo_start = await loaders.redis_load("convo_start", username)
         if convo_start:
             convo_start_time = datetime.strptime(convo_start, '%Y-%m-%dT%H:%M:%S.%f')
 
@@ -118,10 +125,10 @@ async def get_convo_start_time(username=None):
     return convo_start_time
 
 @error_handler.if_errors
-async def calculate_time_difference(username=None):
+async def calculate_time_difference(username=None, snapshot=None):
     current_time = datetime.now()
     print(f"Current time in calculate_time_difference(): {current_time}")
-    last_message_time = await get_last_message_time(current_time, username)
+    last_message_time = await get_last_message_time(current_time, username, snapshot)
     print(f"last_message_time from get_last_message_time(current_time)")
     time_difference = current_time - last_message_time
 
@@ -129,7 +136,7 @@ async def calculate_time_difference(username=None):
 
 @error_handler.if_errors
 async def remove_fleeting(username=None):
-    old_convo = await loaders.redis_load("conversation_history", username)
+    old_convo = await loaders.load_conversation_history(username)
     if old_convo and old_convo is not None:
         today, yesterday = loaders.journal_date()
         current_date = datetime.strptime(today, '%Y-%m-%d')
@@ -144,7 +151,7 @@ async def remove_fleeting(username=None):
         print(f"++CONSOLE: Old conversation saved to number {current_convo_number}; erasing fleeting_convo_history...")
         context = f"I'm currently thinking about an earlier conversation so as to better orient myself in the present by cultivating my short-term memory."
         # Clear conversation history immediately
-        await loaders.redis_save("conversation_history", "", username)
+        await loaders.clear_conversation_history(username)
         
         # Process short-term memory in background (non-blocking)
         import asyncio
@@ -189,49 +196,28 @@ async def store_summary_embedding(summary_text, summary_id):
     """Store a short-term memory summary in the summary vector database"""
     try:
         # Get embedding from server
-        url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/pureembed"
-        data = {'text': summary_text, 'uuid': summary_id}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data) as response:
-                if response.status == 200:
-                    # Get embedding from server
-                    embedding_data = await response.json()
-                    
-                    # Store in local summary_memory.index
-                    index_path = 'Memory/summary_memory.index'
-                    
-                    # Load or create the index
-                    if os.path.exists(index_path):
-                        index = faiss.read_index(index_path)
-                    else:
-                        # Create new index for 768-dimensional vectors
-                        index = faiss.IndexFlatL2(768)
-                        index = faiss.IndexIDMap(index)
-                    
-                    # Prepare embedding
-                    embeddings = np.array(embedding_data['embedding'], dtype='float32')
-                    if embeddings.ndim == 2 and embeddings.shape[0] == 1:
-                        embeddings = embeddings.reshape(1, -1)
-                    elif embeddings.ndim == 1:
-                        embeddings = embeddings.reshape(1, -1)
-                    
-                    # Convert string ID to numeric ID for FAISS
-                    numeric_id = int(summary_id) if summary_id.isdigit() else hash(summary_id) % (2**63)
-                    id_array = np.array([numeric_id], dtype='int64')
-                    
-                    # Add to index
-                    index.add_with_ids(embeddings, id_array)
-                    
-                    # Save index
-                    faiss.write_index(index, index_path)
-                    
-                    print(f"Successfully stored summary embedding for {summary_id}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    print(f"Error getting embedding: {error_text}")
-                    return False
+        embedding_data = await embedding_client.client.embed(summary_text, summary_id)
+        if embedding_data is None:
+            print(f"Error getting embedding for summary {summary_id}")
+            return False
+
+        # Store in the resident summary_memory.index
+        index = index_manager.get_index(SUMMARY_INDEX_PATH)
+
+        # Prepare embedding
+        embeddings = np.array(embedding_data['embedding'], dtype='float32')
+        if embeddings.ndim == 1:
+            embeddings = embeddings.reshape(1, -1)
+
+        # Convert string ID to numeric ID for FAISS
+        numeric_id = int(summary_id) if summary_id.isdigit() else hash(summary_id) % (2**63)
+        id_array = np.array([numeric_id], dtype='int64')
+
+        # Add to index (logged to its WAL, snapshotted in the background)
+        index.add(id_array, embeddings)
+
+        print(f"Successfully stored summary embedding for {summary_id}")
+        return True
     except Exception as e:
         print(f"Error storing summary embedding: {e}")
         return False
@@ -240,48 +226,36 @@ async def store_summary_embedding(summary_text, summary_id):
 async def search_memory_summaries(query_text, k=5):
     """Search for relevant memory summaries based on a query"""
     try:
-        index_path = 'Memory/summary_memory.index'
-        
-        if not os.path.exists(index_path):
+        if not index_manager.index_exists(SUMMARY_INDEX_PATH):
             return []
-        
+
         # Get embedding for query
-        url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/pureembed"
-        data = {'text': query_text, 'uuid': 'search_query'}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=data) as response:
-                if response.status == 200:
-                    embedding_data = await response.json()
-                    
-                    # Load index
-                    index = faiss.read_index(index_path)
-                    
-                    # Prepare query embedding
-                    query_embedding = np.array(embedding_data['embedding'], dtype='float32')
-                    if query_embedding.ndim == 1:
-                        query_embedding = query_embedding.reshape(1, -1)
-                    elif query_embedding.ndim == 2 and query_embedding.shape[0] == 1:
-                        query_embedding = query_embedding.reshape(1, -1)
-                    
-                    # Search
-                    distances, indices = index.search(query_embedding, k)
-                    
-                    # Format results with human-readable time
-                    results = []
-                    for i, (dist, idx) in enumerate(zip(distances[0], indices[0])):
-                        if idx != -1:  # Valid result
-                            # Look up metadata using the ID
-                            # For now, return the ID and distance
-                            results.append({
-                                'id': str(idx),
-                                'distance': float(dist)
-                            })
-                    
-                    return results
-                else:
-                    print(f"Error getting query embedding")
-                    return []
+        embedding_data = await embedding_client.client.embed(query_text)
+        if embedding_data is None:
+            print(f"Error getting query embedding")
+            return []
+
+        # Resident index
+        index = index_manager.get_index(SUMMARY_INDEX_PATH)
+
+        # Prepare query embedding
+        query_embedding = np.array(embedding_data['embedding'], dtype='float32')
+        if query_embedding.ndim == 1:
+            query_embedding = query_embedding.reshape(1, -1)
+
+        # Search
+        distances, indices = index.search(query_embedding, k)
+
+        # Format results (ID and distance; metadata is looked up by the caller)
+        results = []
+        for dist, idx in zip(distances[0], indices[0]):
+            if idx != -1:  # Valid result
+                results.append({
+                    'id': str(idx),
+                    'distance': float(dist)
+                })
+
+        return results
     except Exception as e:
         print(f"Error searching memory summaries: {e}")
         return []
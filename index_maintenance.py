@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Maintenance for Rhoda's local memory index (Memory/conversational_memory.index).
+
+    remove   drop vectors by id (their records are marked removed so verify leaves them out)
+    dedupe   drop near-duplicate vectors, keeping the earliest copy (the dropped
+             record is marked duplicate_of so verify doesn't report it as unindexed)
+    verify   compare index ids with memory_store records in both directions;
+             --fix removes orphaned vectors and re-queues records that have no vector
+    compact  rebuild as the same index type/metric and snapshot
+
+The functions work on the resident ManagedIndex, so the app can call them while it
+serves searches. dedupe is incremental: it saves how far it got in
+<index>.maintenance.json and only scans vectors added since, and --limit caps one run.
+Run the command line with the app stopped (the app owns the index files while it's running).
+
+Examples:
+    python index_maintenance.py verify --fix
+    python index_maintenance.py dedupe --threshold 0.99 --limit 50000
+    python index_maintenance.py remove 123420251017120000 456720251017120500
+"""
+import os
+import json
+import time
+import argparse
+import index_manager
+import local_embedding_handler
+import memory_store
+import memory_ingest
+
+# Cosine similarity at or above which two memory vectors count as duplicates
+DEDUPE_THRESHOLD = float(os.getenv('DEDUPE_THRESHOLD', 0.985))
+# Neighbors checked per vector when looking for duplicates
+DEDUPE_NEIGHBORS = int(os.getenv('DEDUPE_NEIGHBORS', 5))
+SCAN_BATCH = 1024
+
+def state_path(path):
+    return f"{path}.maintenance.json"
+
+def load_state(path):
+    try:
+        with open(state_path(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(path, state):
+    temp_path = f"{state_path(path)}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, state_path(path))
+
+def remove_ids(ids, path=local_embedding_handler.INDEX_PATH):
+    """Remove vectors by id and mark their records removed; returns how many were in the index"""
+    removed = index_manager.get_index(path).remove([int(record_id) for record_id in ids])
+    for record_id in ids:
+        memory_store.set_record_field(record_id, 'removed', True)
+    print(f"++CONSOLE: Removed {removed} of {len(ids)} requested ids from {path}")
+    return removed
+
+def dedupe(path=local_embedding_handler.INDEX_PATH, threshold=DEDUPE_THRESHOLD, limit=None, restart=False):
+    """
+    Drop vectors whose nearest earlier vector is at least `threshold` similar, starting
+    where the last run stopped. Returns {dropped_id: kept_id}.
+    """
+    managed = index_manager.get_index(path)
+    state = load_state(path)
+    cursor = 0 if restart else min(state.get('dedupe_cursor', 0), managed.size)
+    # Positions shift when the index is compacted; resume after the last vector scanned if it's still there
+    last_position = None if restart else managed.position(state.get('dedupe_cursor_id'))
+    if last_position is not None:
+        cursor = last_position + 1
+    end = managed.size if limit is None else min(managed.size, cursor + limit)
+    metric = managed.metric
+
+    drops = {}
+    last_id = state.get('dedupe_cursor_id')
+    for start in range(cursor, end, SCAN_BATCH):
+        ids, vectors = managed.vectors(start, min(SCAN_BATCH, end - start))
+        if not len(ids):
+            continue
+        distances, neighbors = managed.search(vectors, DEDUPE_NEIGHBORS + 1)
+        for row, record_id in enumerate(ids.tolist()):
+            for distance, neighbor in zip(distances[row], neighbors[row].tolist()):
+                # Only collapse onto vectors that came earlier and are staying
+                if neighbor == -1 or neighbor in drops or managed.position(neighbor) is None \
+                        or managed.position(neighbor) >= managed.position(record_id):
+                    continue
+                if index_manager.similarity(distance, metric) >= threshold:
+                    drops[record_id] = neighbor
+                    break
+        kept = [record_id for record_id in ids.tolist() if record_id not in drops]
+        if kept:
+            last_id = kept[-1]
+        print(f"++CONSOLE: Dedupe scanned {min(start + SCAN_BATCH, end) - cursor}/{end - cursor} positions, {len(drops)} duplicates")
+
+    if drops:
+        managed.remove(list(drops))
+        for dropped, kept in drops.items():
+            memory_store.set_record_field(dropped, 'duplicate_of', str(kept))
+    # Everything before the new cursor has been compared against all earlier vectors;
+    # removals only tombstone, so positions don't move until the next compact
+    state['dedupe_cursor'] = end
+    state['dedupe_cursor_id'] = last_id
+    state['dedupe_threshold'] = threshold
+    state['last_dedupe'] = time.time()
+    save_state(path, state)
+    print(f"++CONSOLE: Dropped {len(drops)} near-duplicate vectors from {path}")
+    return drops
+
+def verify(path=local_embedding_handler.INDEX_PATH, fix=False):
+    """
+    Check index ids against memory_store. Returns (orphans, unindexed): vector ids with no
+    stored record, and stored records with no vector. With fix, orphans are removed and
+    unindexed records are re-queued through memory_ingest.
+    """
+    managed = index_manager.get_index(path)
+    index_ids = [str(record_id) for record_id in managed.ids().tolist()]
+    indexed = set(index_ids)
+
+    orphans = []
+    for start in range(0, len(index_ids), memory_store.BATCH_SIZE):
+        batch = index_ids[start:start + memory_store.BATCH_SIZE]
+        found = memory_store.get_records(batch)
+        orphans.extend(record_id for record_id in batch if record_id not in found)
+
+    unindexed = []
+    for record_id, record in memory_store.iter_records():
+        if record_id in indexed or record.get('duplicate_of') or record.get('removed') or not record.get('message'):
+            continue
+        if record_id.isdigit():
+            unindexed.append((record_id, record))
+
+    print(f"++CONSOLE: {path}: {len(index_ids)} vectors, {len(orphans)} without records, {len(unindexed)} records without vectors")
+    if fix:
+        if orphans:
+            remove_ids(orphans, path)
+        for record_id, record in unindexed:
+            memory_ingest.ingestor.enqueue(record['message'], record_id, record.get('speaker'), record.get('time'))
+        if unindexed:
+            print(f"++CONSOLE: Re-queued {len(unindexed)} records for embedding")
+    return orphans, [record_id for record_id, _ in unindexed]
+
+def compact(path=local_embedding_handler.INDEX_PATH):
+    managed = index_manager.get_index(path)
+    before = index_manager.describe_index(managed.index)
+    managed.compact()
+    print(f"++CONSOLE: Compacted {path}: {before} -> {index_manager.describe_index(managed.index)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local memory index")
+    parser.add_argument('--index', default=local_embedding_handler.INDEX_PATH, help="Index file to work on")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    remove_parser = commands.add_parser('remove', help="Remove vectors by id")
+    remove_parser.add_argument('ids', nargs='+')
+
+    dedupe_parser = commands.add_parser('dedupe', help="Drop near-duplicate vectors")
+    dedupe_parser.add_argument('--threshold', type=float, default=DEDUPE_THRESHOLD)
+    dedupe_parser.add_argument('--limit', type=int, help="Scan at most this many vectors this run")
+    dedupe_parser.add_argument('--restart', action='store_true', help="Rescan from the start of the index")
+
+    verify_parser = commands.add_parser('verify', help="Check index ids against stored records")
+    verify_parser.add_argument('--fix', action='store_true', help="Remove orphans and re-queue unindexed records")
+
+    commands.add_parser('compact', help="Rebuild as the same type and snapshot")
+    args = parser.parse_args()
+
+    if args.command == 'remove':
+        remove_ids(args.ids, args.index)
+    elif args.command == 'dedupe':
+        dedupe(args.index, args.threshold, args.limit, args.restart)
+    elif args.command == 'verify':
+        verify(args.index, args.fix)
+        if args.fix:
+            memory_ingest.ingestor.wait_idle()
+    elif args.command == 'compact':
+        compact(args.index)
+    index_manager.snapshot_all()
+
+if __name__ == "__main__":
+    main()
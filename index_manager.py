@@ -0,0 +1,846 @@
+"""
+Process-wide, memory-resident FAISS indexes with write-ahead logging.
+
+Each index file (Memory/conversational_memory.index, Memory/summary_memory.index) is
+loaded once per process and then served from memory. Searches share a reader lock,
+adds and removals take the writer lock. Every mutation is first appended to
+<index>.wal, so nothing is lost between snapshots. A snapshot serializes the index in
+memory and moves the WAL aside to <index>.wal.snapshot while writers are blocked, then
+writes the file atomically (temp file + os.replace) and deletes the moved WAL after
+writers have been let go. Snapshots run in the background every INDEX_SNAPSHOT_INTERVAL
+seconds, as soon as the WAL reaches INDEX_WAL_MAX_OPS records, and at interpreter exit.
+Loading an index replays <index>.wal.snapshot (if a snapshot didn't finish) and then
+<index>.wal on top of the last snapshot.
+
+New and rebuilt indexes come from build_index(), configured by MEMORY_INDEX_TYPE
+(flat, hnsw, ivf_flat, ivf_pq) and MEMORY_INDEX_METRIC (l2, ip). Our embeddings are
+L2-normalized, so inner product ranks exactly like L2 but scores are similarities
+(higher is closer). IVF types need training data, so an empty index starts as flat
+until rebuild_index() (or rebuild_memory_index.py) converts it from the stored vectors.
+Removing an id tombstones it: its id_map entry becomes DEAD_ID, which searches exclude
+through the position masks below and which is saved with the snapshot like any other
+id. The vectors stay in the index until compact() rebuilds it without them, so a removal
+never retrains or rebuilds anything under the writer lock.
+
+Each index also keeps compact per-id metadata columns (speaker, time, source) in
+<index>.meta.npz, updated through the same WAL, so search_filtered() can restrict
+hits to one speaker and weight them by recency without loading any records. The
+restriction is a bitmap over the inner index's positions per speaker/source filter,
+updated in place as vectors and metadata are written.
+
+Only one process should own a given index at a time (the app, or a maintenance
+script run while the app is stopped).
+"""
+import os
+import io
+import json
+import time
+import zlib
+import atexit
+import struct
+import shutil
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import faiss
+
+DEFAULT_DIMENSION = 768
+# Seconds between background snapshots of indexes with pending WAL records
+INDEX_SNAPSHOT_INTERVAL = float(os.getenv('INDEX_SNAPSHOT_INTERVAL', 300))
+# Snapshot early once this many WAL records have accumulated
+INDEX_WAL_MAX_OPS = int(os.getenv('INDEX_WAL_MAX_OPS', 1000))
+
+# Index factory settings
+MEMORY_INDEX_TYPE = os.getenv('MEMORY_INDEX_TYPE', 'flat')
+MEMORY_INDEX_METRIC = os.getenv('MEMORY_INDEX_METRIC', 'l2')
+HNSW_M = int(os.getenv('HNSW_M', 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 200))
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', 128))
+# 0 means "pick from the number of training vectors" (about 4*sqrt(n))
+IVF_NLIST = int(os.getenv('IVF_NLIST', 0))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 16))
+# Sub-quantizers for IVF-PQ; must divide the dimension (768 / 96 = 8 dims per code byte)
+PQ_M = int(os.getenv('PQ_M', 96))
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+# id_map entry of a removed vector; compact() drops them
+DEAD_ID = -1
+# Suggest compacting once this share of an index's vectors are removed ones
+COMPACT_HINT_FRACTION = 0.2
+
+# Recency weighting for search_filtered: a memory's bonus halves every this many days
+RECENCY_HALF_LIFE_DAYS = float(os.getenv('RECENCY_HALF_LIFE_DAYS', 30))
+# Extra candidates fetched when re-ranking by recency, or when filtering without IDSelectorBitmap support
+SEARCH_OVERFETCH = int(os.getenv('SEARCH_OVERFETCH', 4))
+
+# WAL record: op code, id count, payload length, payload crc32; then the payload
+# (int64 ids, followed for adds by float32 vectors, for metadata by a JSON list)
+WAL_HEADER = struct.Struct('<BIII')
+OP_ADD = 1
+OP_REMOVE = 2
+OP_META = 3
+
+indexes = {}
+indexes_lock = threading.Lock()
+snapshot_thread = None
+
+class RWLock:
+    """Many readers or one writer; waiting writers block new readers so adds aren't starved"""
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writer or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+
+    def release_write(self):
+        with self.condition:
+            self.writer = False
+            self.condition.notify_all()
+
+class ReadLocked:
+    def __init__(self, lock):
+        self.lock = lock
+    def __enter__(self):
+        self.lock.acquire_read()
+    def __exit__(self, *exc):
+        self.lock.release_read()
+
+class WriteLocked:
+    def __init__(self, lock):
+        self.lock = lock
+    def __enter__(self):
+        self.lock.acquire_write()
+    def __exit__(self, *exc):
+        self.lock.release_write()
+
+def as_vectors(vectors, dimension=None):
+    """Coerce embeddings (lists, 1-D or nested arrays) into a C-contiguous float32 (n, d) array"""
+    vectors = np.ascontiguousarray(np.asarray(vectors, dtype='float32'))
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    elif vectors.ndim == 2 and dimension and vectors.shape[1] == 1 and vectors.shape[0] == dimension:
+        # [[v], [v], ...] column vector from the server
+        vectors = vectors.reshape(1, -1)
+    return vectors
+
+def faiss_metric(metric):
+    if metric == 'ip':
+        return faiss.METRIC_INNER_PRODUCT
+    if metric == 'l2':
+        return faiss.METRIC_L2
+    raise ValueError(f"Unknown index metric '{metric}' (expected 'l2' or 'ip')")
+
+def choose_nlist(n_vectors):
+    if IVF_NLIST:
+        return IVF_NLIST
+    # Roughly 4*sqrt(n) lists, and at least ~39 training points per list as faiss recommends
+    return max(1, min(int(4 * np.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+
+def build_index(dimension=DEFAULT_DIMENSION, index_type=None, metric=None, training_vectors=None):
+    """
+    Create an empty IndexIDMap-wrapped index of the configured type. IVF types are
+    trained on training_vectors; without enough of them we fall back to flat.
+    """
+    index_type = (index_type or MEMORY_INDEX_TYPE).lower()
+    metric = (metric or MEMORY_INDEX_METRIC).lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+    faiss_metric_type = faiss_metric(metric)
+
+    if index_type.startswith('ivf'):
+        n_training = 0 if training_vectors is None else len(training_vectors)
+        nlist = choose_nlist(n_training)
+        if n_training < max(nlist, 256 if index_type == 'ivf_pq' else 1) or n_training < 39:
+            print(f"++CONSOLE: Not enough vectors to train {index_type} ({n_training}); using a flat index for now")
+            index_type = 'flat'
+
+    if index_type == 'flat':
+        base = faiss.IndexFlatIP(dimension) if metric == 'ip' else faiss.IndexFlatL2(dimension)
+    elif index_type == 'hnsw':
+        base = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss_metric_type)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        quantizer = faiss.IndexFlatIP(dimension) if metric == 'ip' else faiss.IndexFlatL2(dimension)
+        if index_type == 'ivf_flat':
+            base = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss_metric_type)
+        else:
+            base = faiss.IndexIVFPQ(quantizer, dimension, nlist, PQ_M, 8, faiss_metric_type)
+        base.train(as_vectors(training_vectors))
+    # (faiss' Python wrappers keep the quantizer and base index alive via referenced_objects)
+    index = faiss.IndexIDMap(base)
+    tune_index(index)
+    return index
+
+def tune_index(index):
+    """Apply search-time parameters (efSearch / nprobe), which aren't fixed at build time"""
+    inner = faiss.downcast_index(index.index) if hasattr(index, 'index') else index
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    return index
+
+def describe_index(index):
+    inner = faiss.downcast_index(index.index) if hasattr(index, 'index') else index
+    return f"{type(inner).__name__} ({metric_of(index)}, {index.ntotal} vectors)"
+
+def extract_vectors(index, start=0, count=None):
+    """
+    (ids, vectors) of the live entries in an IndexIDMap, optionally only positions
+    [start, start+count); exact for flat/HNSW/IVF-Flat, approximate for PQ
+    """
+    ids = stored_ids(index)
+    end = len(ids) if count is None else min(len(ids), start + count)
+    ids = ids[start:end]
+    inner = faiss.downcast_index(index.index)
+    if not len(ids):
+        return ids, np.zeros((0, index.d), dtype='float32')
+    if isinstance(inner, faiss.IndexIVF) and inner.direct_map.type == faiss.DirectMap.NoMap:
+        inner.make_direct_map()
+    if isinstance(inner, faiss.IndexIVFPQ):
+        print("++CONSOLE: Warning: reconstructing from IVF-PQ codes is lossy")
+    # The inner index stores vectors in insertion order, matching id_map
+    vectors = inner.reconstruct_n(start, end - start)
+    live = ids != DEAD_ID
+    if not live.all():
+        ids, vectors = ids[live], vectors[live]
+    return ids, vectors
+
+def index_type_of(index):
+    """The build_index() type name for an existing IndexIDMap"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+def metric_of(index):
+    return 'ip' if index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2'
+
+def search_parameters(index, selector):
+    """SearchParameters of the class index's inner index expects, carrying selector and its efSearch/nprobe"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    return faiss.SearchParameters(sel=selector)
+
+def similarity(distance, metric):
+    """Cosine similarity from a FAISS distance (vectors are L2-normalized; L2 distances are squared)"""
+    if metric == 'ip':
+        return float(distance)
+    return 1.0 - float(distance) / 2.0
+
+def as_ids(ids):
+    return np.ascontiguousarray(np.asarray(ids, dtype='int64').reshape(-1))
+
+def write_atomic(path, data):
+    """Write bytes (or a uint8 array) to path via a fsynced temp file and os.replace"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(memoryview(data))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def wal_paths(path):
+    """The WAL files an index at path may have, in replay order"""
+    return [f"{path}.wal.snapshot", f"{path}.wal"]
+
+def index_exists(path):
+    """Whether there's a snapshot or any WAL to load an index from"""
+    return any(os.path.exists(candidate) for candidate in [path] + wal_paths(path))
+
+def as_epoch(value):
+    """Epoch seconds from an ISO time string (naive means UTC, as our records store it) or a number; nan if unknown"""
+    if value is None or value == '':
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return np.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+class MetadataTable:
+    """
+    Per-id columns kept next to an index: speaker and source as small integer codes,
+    time as epoch seconds. Rows are found through an id -> row dict; removed rows are
+    blanked and squeezed out when the table is saved.
+    """
+    COLUMNS = (('ids', 'int64', -1), ('speaker', 'int32', -1), ('source', 'int16', -1), ('time', 'float64', np.nan))
+
+    def __init__(self):
+        for name, dtype, fill in self.COLUMNS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self.count = 0
+        self.rows = {}
+        self.speakers = []
+        self.sources = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def code(value, names):
+        if value is None:
+            return -1
+        if value not in names:
+            names.append(value)
+        return names.index(value)
+
+    def grow(self, needed):
+        if self.count + needed <= len(self.ids):
+            return
+        capacity = max(1024, len(self.ids) * 2, self.count + needed)
+        for name, dtype, fill in self.COLUMNS:
+            column = np.full(capacity, fill, dtype=dtype)
+            column[:self.count] = getattr(self, name)[:self.count]
+            setattr(self, name, column)
+
+    def set(self, ids, entries):
+        """Set metadata for ids from dicts with optional 'speaker', 'time' and 'source'"""
+        ids = as_ids(ids).tolist()
+        self.grow(len(ids))
+        for record_id, entry in zip(ids, entries):
+            row = self.rows.get(record_id)
+            if row is None:
+                row = self.count
+                self.count += 1
+                self.rows[record_id] = row
+                self.ids[row] = record_id
+            self.speaker[row] = self.code(entry.get('speaker'), self.speakers)
+            self.source[row] = self.code(entry.get('source'), self.sources)
+            self.time[row] = as_epoch(entry.get('time'))
+
+    def remove(self, ids):
+        for record_id in as_ids(ids).tolist():
+            row = self.rows.pop(record_id, None)
+            if row is not None:
+                for name, dtype, fill in self.COLUMNS:
+                    getattr(self, name)[row] = fill
+
+    def matches(self, ids, speaker=None, source=None):
+        """Boolean array: which ids have metadata matching speaker/source (None means any)"""
+        speakers, _, sources = self.lookup(ids)
+        mask = np.ones(len(speakers), dtype=bool)
+        if speaker is not None:
+            mask &= speakers == (self.speakers.index(speaker) if speaker in self.speakers else -2)
+        if source is not None:
+            mask &= sources == (self.sources.index(source) if source in self.sources else -2)
+        return mask
+
+    def lookup(self, ids):
+        """(speaker codes, times, source codes) for ids; -1 / nan where unknown"""
+        rows = np.array([self.rows.get(record_id, -1) for record_id in as_ids(ids).tolist()], dtype='int64')
+        known = rows >= 0
+        speakers = np.where(known, self.speaker[np.maximum(rows, 0)] if self.count else -1, -1)
+        times = np.where(known, self.time[np.maximum(rows, 0)] if self.count else np.nan, np.nan)
+        sources = np.where(known, self.source[np.maximum(rows, 0)] if self.count else -1, -1)
+        return speakers, times, sources
+
+    def serialize(self):
+        """The table as .npz bytes, without the blanked rows"""
+        live = self.ids[:self.count] != -1
+        buffer = io.BytesIO()
+        np.savez(buffer, speakers=np.array(self.speakers, dtype=str), sources=np.array(self.sources, dtype=str),
+                 **{name: getattr(self, name)[:self.count][live] for name, dtype, fill in self.COLUMNS})
+        return buffer.getvalue()
+
+    def save(self, path):
+        write_atomic(path, self.serialize())
+
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        if not os.path.exists(path):
+            return table
+        with np.load(path) as data:
+            for name, dtype, fill in cls.COLUMNS:
+                setattr(table, name, data[name].astype(dtype))
+            table.speakers = data['speakers'].tolist()
+            table.sources = data['sources'].tolist()
+        table.count = len(table.ids)
+        table.rows = {record_id: row for row, record_id in enumerate(table.ids.tolist())}
+        return table
+
+class PositionMask:
+    """
+    Bitmap over an index's inner positions, searched through a faiss IDSelectorBitmap that
+    reads the bits in place; only growing the bitmap replaces the selector
+    """
+    def __init__(self):
+        self.bits = np.zeros(0, dtype='uint8')
+        self.selector = None
+
+    def reserve(self, size):
+        needed = (size + 7) // 8
+        if self.selector is not None and needed <= len(self.bits):
+            return
+        bits = np.zeros(max(128, needed, len(self.bits) * 2), dtype='uint8')
+        bits[:len(self.bits)] = self.bits
+        self.bits = bits
+        self.selector = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+
+    def assign(self, positions, member):
+        """Set the bits at positions where member is True, clear the others"""
+        positions = np.asarray(positions, dtype='int64')
+        if not len(positions):
+            return
+        self.reserve(int(positions.max()) + 1)
+        member = np.asarray(member, dtype=bool)
+        byte = positions >> 3
+        bit = np.left_shift(1, positions & 7).astype('uint8')
+        np.bitwise_or.at(self.bits, byte[member], bit[member])
+        np.bitwise_and.at(self.bits, byte[~member], ~bit[~member])
+
+class ManagedIndex:
+    def __init__(self, path, dimension=DEFAULT_DIMENSION):
+        self.path = path
+        self.rotated_wal_path, self.wal_path = wal_paths(path)
+        self.meta_path = f"{path}.meta.npz"
+        self.metadata = MetadataTable.load(self.meta_path)
+        # id -> inner position of the live ids, how many positions are tombstoned, and a
+        # PositionMask per (speaker, source) filter searched so far
+        self.positions = {}
+        self.dead = 0
+        self.masks = {}
+        self.masks_lock = threading.Lock()
+        self.dimension = dimension
+        self.lock = RWLock()
+        self.snapshot_lock = threading.Lock()
+        self.wal_file = None
+        self.pending_ops = 0
+        self.index = None
+        self.recover()
+
+    def new_index(self):
+        return build_index(self.dimension)
+
+    def recover(self):
+        """Load the last snapshot (or start empty) and replay the WALs on top of it"""
+        if os.path.exists(self.path):
+            index = tune_index(faiss.read_index(self.path))
+            self.dimension = index.d
+            print(f"++CONSOLE: Loaded index {self.path} ({index.ntotal} vectors)")
+        else:
+            index = self.new_index()
+            print(f"++CONSOLE: Created new index for {self.path}")
+        self.index = index
+        self.reset_positions()
+        replayed = sum(self.replay_wal(wal_path) for wal_path in (self.rotated_wal_path, self.wal_path))
+        if replayed:
+            print(f"++CONSOLE: Replayed {replayed} WAL records into {self.path} ({self.ntotal} vectors)")
+        self.pending_ops = replayed
+
+    def replay_wal(self, wal_path):
+        """Apply the records in one WAL file to the index; returns how many were replayed"""
+        if not os.path.exists(wal_path):
+            return 0
+        replayed = 0
+        valid_bytes = 0
+        with open(wal_path, 'rb') as wal:
+            while True:
+                header = wal.read(WAL_HEADER.size)
+                if len(header) < WAL_HEADER.size:
+                    break
+                op, count, length, crc = WAL_HEADER.unpack(header)
+                payload = wal.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Torn write from a crash mid-append; everything before it is intact
+                    print(f"++CONSOLE: Ignoring incomplete trailing record in {wal_path}")
+                    break
+                valid_bytes = wal.tell()
+                try:
+                    self.replay_record(op, count, payload)
+                except (AssertionError, RuntimeError, ValueError) as e:
+                    # One record that cannot be applied must not keep the whole index from opening
+                    print(f"++CONSOLE: Skipping WAL record in {wal_path} that cannot be applied: {e}")
+                    continue
+                replayed += 1
+        if valid_bytes != os.path.getsize(wal_path):
+            with open(wal_path, 'r+b') as wal:
+                wal.truncate(valid_bytes)
+        return replayed
+
+    def replay_record(self, op, count, payload):
+        ids = np.frombuffer(payload[:count * 8], dtype='int64')
+        if op == OP_ADD:
+            vectors = np.frombuffer(payload[count * 8:], dtype='float32').reshape(count, -1)
+            self.check_vectors(ids, vectors)
+            # Skip ids the snapshot already contains (snapshot written but its WAL not yet deleted)
+            keep = np.array([i not in self.positions for i in ids.tolist()], dtype=bool)
+            if keep.any():
+                self.apply_add(np.ascontiguousarray(ids[keep]), np.ascontiguousarray(vectors[keep]))
+        elif op == OP_REMOVE:
+            self.apply_remove(ids)
+        elif op == OP_META:
+            self.metadata.set(ids, json.loads(payload[count * 8:].decode('utf-8')))
+
+    def check_vectors(self, ids, vectors):
+        """Raise ValueError unless vectors is one finite row of the index dimension per id"""
+        if vectors.ndim != 2 or vectors.shape != (len(ids), self.dimension):
+            raise ValueError(f"Expected vectors of shape ({len(ids)}, {self.dimension}) for {self.path}, got {vectors.shape}")
+        if not np.isfinite(vectors).all():
+            raise ValueError(f"Vectors for {self.path} contain NaN or infinite values")
+
+    def append_wal(self, op, ids, vectors=None, extra=b''):
+        payload = ids.tobytes() + (vectors.tobytes() if vectors is not None else b'') + extra
+        if self.wal_file is None:
+            directory = os.path.dirname(self.wal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.wal_file = open(self.wal_path, 'ab')
+        self.wal_file.write(WAL_HEADER.pack(op, len(ids), len(payload), zlib.crc32(payload)) + payload)
+        self.wal_file.flush()
+        os.fsync(self.wal_file.fileno())
+        self.pending_ops += 1
+
+    def add(self, ids, vectors, metadata=None):
+        """
+        Durably add vectors under the given int64 ids, with optional per-id metadata dicts.
+        Ids already in the index keep their vector (their metadata is still written), so
+        retrying an add is harmless. Returns how many vectors were added.
+        """
+        ids = as_ids(ids)
+        vectors = as_vectors(vectors, self.dimension)
+        self.check_vectors(ids, vectors)
+        with WriteLocked(self.lock):
+            new = np.array([record_id not in self.positions for record_id in ids.tolist()], dtype=bool)
+            positions = np.zeros(0, dtype='int64')
+            if new.any():
+                new_ids, new_vectors = np.ascontiguousarray(ids[new]), np.ascontiguousarray(vectors[new])
+                self.append_wal(OP_ADD, new_ids, new_vectors)
+                positions = self.apply_add(new_ids, new_vectors)
+            if metadata is not None:
+                self.write_metadata(ids, metadata)
+                positions = [self.positions[record_id] for record_id in ids.tolist() if record_id in self.positions]
+            self.refresh_masks(positions)
+            pending = self.pending_ops
+        if pending >= INDEX_WAL_MAX_OPS:
+            self.snapshot()
+        return int(new.sum())
+
+    def remove(self, ids):
+        """Durably remove (tombstone) ids; returns how many vectors were removed"""
+        ids = as_ids(ids)
+        with WriteLocked(self.lock):
+            self.append_wal(OP_REMOVE, ids)
+            positions = self.apply_remove(ids)
+            self.refresh_masks(positions)
+            dead, size = self.dead, self.size
+        if len(positions) and dead > COMPACT_HINT_FRACTION * size:
+            print(f"++CONSOLE: {dead} of {size} vectors in {self.path} are removed ones; "
+                  f"compact it (index_maintenance.py compact) to reclaim them")
+        return len(positions)
+
+    def apply_add(self, ids, vectors):
+        """Add vectors to the index and the position map; returns their positions. Caller holds the write lock"""
+        start = self.index.ntotal
+        self.index.add_with_ids(vectors, ids)
+        self.positions.update(zip(ids.tolist(), range(start, self.index.ntotal)))
+        return np.arange(start, self.index.ntotal)
+
+    def apply_remove(self, ids):
+        """Tombstone the live ids and drop their metadata; returns their positions. Caller holds the write lock"""
+        positions = [self.positions.pop(record_id) for record_id in ids.tolist() if record_id in self.positions]
+        positions = np.array(positions, dtype='int64')
+        if len(positions):
+            self.id_map()[positions] = DEAD_ID
+            self.dead += len(positions)
+        self.metadata.remove(ids)
+        return positions
+
+    def write_metadata(self, ids, entries):
+        """Log and apply metadata for ids; caller holds the write lock"""
+        entries = [{key: entry.get(key) for key in ('speaker', 'time', 'source')} for entry in entries]
+        self.append_wal(OP_META, ids, extra=json.dumps(entries).encode('utf-8'))
+        self.metadata.set(ids, entries)
+
+    def set_metadata(self, ids, entries):
+        """Durably set speaker/time/source for ids already in the index (e.g. backfilling)"""
+        ids = as_ids(ids)
+        with WriteLocked(self.lock):
+            self.write_metadata(ids, entries)
+            self.refresh_masks([self.positions[i] for i in ids.tolist() if i in self.positions])
+
+    def id_map(self):
+        """View (not a copy) of the ids by inner position; caller holds the lock"""
+        if not self.index.ntotal:
+            return np.zeros(0, dtype='int64')
+        return faiss.rev_swig_ptr(self.index.id_map.data(), self.index.id_map.size())
+
+    def reset_positions(self):
+        """Rebuild the position map and tombstone count and drop the masks; caller holds the write lock (or owns the index)"""
+        ids = self.id_map()
+        self.positions = {record_id: position for position, record_id in enumerate(ids.tolist()) if record_id != DEAD_ID}
+        self.dead = int((ids == DEAD_ID).sum())
+        self.masks = {}
+
+    def position_matches(self, positions, speaker, source):
+        """Which positions hold live ids whose metadata matches speaker/source"""
+        ids = self.id_map()[positions]
+        return (ids != DEAD_ID) & self.metadata.matches(ids, speaker, source)
+
+    def refresh_masks(self, positions):
+        """Recompute every cached mask at positions after their vectors or metadata changed; caller holds the write lock"""
+        positions = np.asarray(positions, dtype='int64')
+        if not len(positions) or not self.masks:
+            return
+        for (speaker, source), mask in self.masks.items():
+            mask.assign(positions, self.position_matches(positions, speaker, source))
+
+    def position_mask(self, speaker, source):
+        """The PositionMask for speaker/source, built from the metadata on first use; caller holds the lock"""
+        key = (speaker, source)
+        mask = self.masks.get(key)
+        if mask is None:
+            with self.masks_lock:
+                mask = self.masks.get(key)
+                if mask is None:
+                    mask = PositionMask()
+                    mask.reserve(self.index.ntotal)
+                    positions = np.arange(self.index.ntotal)
+                    mask.assign(positions, self.position_matches(positions, speaker, source))
+                    self.masks[key] = mask
+        return mask
+
+    def search_positions(self, vectors, k, speaker=None, source=None):
+        """
+        (distances, ids) among the live positions matching speaker/source, through a
+        PositionMask whenever something has to be excluded; caller holds the read lock
+        """
+        if not self.index.ntotal or (speaker is None and source is None and not self.dead):
+            return self.index.search(vectors, k)
+        mask = self.position_mask(speaker, source)
+        # IndexIDMap would hand the selector ids, so search the inner index by position
+        distances, positions = self.index.index.search(vectors, k, params=search_parameters(self.index, mask.selector))
+        return distances, np.where(positions >= 0, self.id_map()[np.maximum(positions, 0)], -1)
+
+    def search_filtered(self, vector, k=5, speaker=None, source=None, recency_weight=0.0, half_life_days=RECENCY_HALF_LIFE_DAYS):
+        """
+        Top-k hits for one query as dicts (id, distance, similarity, score, speaker, time, source).
+        speaker/source (and tombstones) restrict the search to a cached PositionMask (or
+        over-fetch and filter on faiss builds without IDSelectorBitmap). recency_weight adds
+        recency_weight * 0.5 ** (age_days / half_life_days) to the cosine similarity before ranking.
+        """
+        vector = as_vectors(vector, self.dimension)[:1]
+        filtering = speaker is not None or source is not None
+        use_selector = hasattr(faiss, 'IDSelectorBitmap')
+        with ReadLocked(self.lock):
+            overfetch = recency_weight or (not use_selector and (filtering or self.dead))
+            fetch = max(1, min(k * SEARCH_OVERFETCH if overfetch else k, self.index.ntotal))
+            if use_selector:
+                distances, ids = self.search_positions(vector, fetch, speaker, source)
+            else:
+                # Tombstoned positions come back as DEAD_ID and are dropped with the misses
+                distances, ids = self.index.search(vector, fetch)
+            valid = ids[0] != -1
+            ids, distances = ids[0][valid], distances[0][valid]
+            speakers, times, sources = self.metadata.lookup(ids)
+            speaker_names, source_names = list(self.metadata.speakers), list(self.metadata.sources)
+            metric = self.metric
+
+        if filtering and not use_selector:
+            keep = np.ones(len(ids), dtype=bool)
+            if speaker is not None:
+                keep &= speakers == (speaker_names.index(speaker) if speaker in speaker_names else -2)
+            if source is not None:
+                keep &= sources == (source_names.index(source) if source in source_names else -2)
+            ids, distances, speakers, times, sources = ids[keep], distances[keep], speakers[keep], times[keep], sources[keep]
+
+        similarities = distances.astype('float64') if metric == 'ip' else 1.0 - distances.astype('float64') / 2.0
+        scores = similarities.copy()
+        if recency_weight:
+            age_days = np.maximum(0.0, (time.time() - times) / 86400.0)
+            scores += recency_weight * np.where(np.isnan(times), 0.0, 0.5 ** (age_days / half_life_days))
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [{
+            'id': str(ids[i]),
+            'distance': float(distances[i]),
+            'similarity': float(similarities[i]),
+            'score': float(scores[i]),
+            'speaker': speaker_names[speakers[i]] if 0 <= speakers[i] < len(speaker_names) else None,
+            'time': None if np.isnan(times[i]) else float(times[i]),
+            'source': source_names[sources[i]] if 0 <= sources[i] < len(source_names) else None,
+        } for i in order]
+
+    def search(self, vectors, k=5):
+        """(distances, ids) of the k nearest live vectors; -1 ids pad missing results"""
+        vectors = as_vectors(vectors, self.dimension)
+        with ReadLocked(self.lock):
+            if hasattr(faiss, 'IDSelectorBitmap'):
+                return self.search_positions(vectors, k)
+            return self.index.search(vectors, k)
+
+    def ids(self):
+        """The live ids, in position order"""
+        with ReadLocked(self.lock):
+            ids = stored_ids(self.index)
+        return ids[ids != DEAD_ID]
+
+    def position(self, record_id):
+        """Inner position of a live id (None if it isn't in the index); stable until the next compact()"""
+        return self.positions.get(record_id)
+
+    def vectors(self, start=0, count=None):
+        """(ids, vectors) of the live entries at positions [start, start+count), for incremental scans"""
+        with ReadLocked(self.lock):
+            return extract_vectors(self.index, start, count)
+
+    @property
+    def ntotal(self):
+        """Live vectors"""
+        return self.index.ntotal - self.dead
+
+    @property
+    def size(self):
+        """Positions, including tombstoned ones"""
+        return self.index.ntotal
+
+    @property
+    def metric(self):
+        return metric_of(self.index)
+
+    @property
+    def index_type(self):
+        return index_type_of(self.index)
+
+    def rebuild(self, index_type=None, metric=None):
+        """Rebuild in place as a different index type/metric from the live vectors, then snapshot"""
+        with WriteLocked(self.lock):
+            ids, vectors = extract_vectors(self.index)
+            index = build_index(self.dimension, index_type, metric, training_vectors=vectors)
+            if len(ids):
+                index.add_with_ids(np.ascontiguousarray(vectors), ids)
+            self.index = index
+            self.reset_positions()
+            # Force the snapshot below; the WAL no longer matches the old layout's file
+            self.pending_ops += 1
+        self.snapshot()
+        print(f"++CONSOLE: Rebuilt {self.path} as {describe_index(self.index)}")
+        return self.index
+
+    def compact(self):
+        """
+        Rebuild as the same type/metric without the tombstoned vectors (retraining IVF lists
+        on the current vectors; lossy for IVF-PQ) and snapshot
+        """
+        return self.rebuild(self.index_type, self.metric)
+
+    def rotate_wal(self):
+        """
+        Move the WAL's records into the rotated WAL, which the snapshot being taken will
+        cover; caller blocks writers. A rotated WAL left by a snapshot that didn't finish
+        is appended to, since the previous snapshot file doesn't contain its records either.
+        """
+        if self.wal_file is not None:
+            self.wal_file.close()
+            self.wal_file = None
+        if os.path.exists(self.wal_path):
+            if os.path.exists(self.rotated_wal_path):
+                with open(self.wal_path, 'rb') as source, open(self.rotated_wal_path, 'ab') as target:
+                    shutil.copyfileobj(source, target)
+                    target.flush()
+                    os.fsync(target.fileno())
+                os.remove(self.wal_path)
+            else:
+                os.replace(self.wal_path, self.rotated_wal_path)
+        self.pending_ops = 0
+
+    def snapshot(self):
+        """
+        Write the index atomically and drop the WAL records it covers. Writers only wait
+        while the index and metadata are serialized in memory and the WAL is rotated.
+        """
+        with self.snapshot_lock:
+            if not self.pending_ops and os.path.exists(self.path):
+                return False
+            with ReadLocked(self.lock):
+                data = faiss.serialize_index(self.index)
+                metadata = self.metadata.serialize()
+                ntotal = self.ntotal
+                self.rotate_wal()
+            try:
+                write_atomic(self.path, data)
+                write_atomic(self.meta_path, metadata)
+            except Exception:
+                # The rotated WAL still holds these records; make the next snapshot retry
+                self.pending_ops += 1
+                raise
+            if os.path.exists(self.rotated_wal_path):
+                os.remove(self.rotated_wal_path)
+            print(f"++CONSOLE: Snapshot of {self.path} written ({ntotal} vectors)")
+            return True
+
+def stored_ids(index):
+    """The int64 ids held by an IndexIDMap"""
+    return faiss.vector_to_array(index.id_map).copy()
+
+def get_index(path, dimension=DEFAULT_DIMENSION):
+    """The process-wide ManagedIndex for path, loaded (and recovered) on first use"""
+    key = os.path.abspath(path)
+    managed = indexes.get(key)
+    if managed is None:
+        with indexes_lock:
+            managed = indexes.get(key)
+            if managed is None:
+                managed = ManagedIndex(path, dimension)
+                indexes[key] = managed
+                start_snapshot_thread()
+    return managed
+
+def rebuild_index(path, index_type=None, metric=None):
+    """Convert an index file to another type/metric (see MEMORY_INDEX_TYPE) using its stored vectors"""
+    return get_index(path).rebuild(index_type, metric)
+
+def snapshot_all():
+    for managed in list(indexes.values()):
+        try:
+            managed.snapshot()
+        except Exception as e:
+            print(f"++CONSOLE: Snapshot of {managed.path} failed: {e}")
+
+def start_snapshot_thread():
+    global snapshot_thread
+    if snapshot_thread is not None:
+        return
+
+    def snapshot_loop():
+        while True:
+            time.sleep(INDEX_SNAPSHOT_INTERVAL)
+            snapshot_all()
+
+    snapshot_thread = threading.Thread(target=snapshot_loop, name="index-snapshots", daemon=True)
+    snapshot_thread.start()
+
+atexit.register(snapshot_all)
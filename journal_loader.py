@@ -2,7 +2,7 @@
 import os
 import json
 from datetime import datetime, timedelta
-import glob
+import file_cache
 
 
 def journal_date():
@@ -21,33 +21,29 @@ def journal_date():
 # --- Configuration ---
 JOURNAL_DIR = "JournalEntries"  # Using forward slashes for better path compatibility
 SOC_DIR = "SOC"
-USER_SPECIFIED_CURRENT_DATE_STR, YESTERDAY_DATE_STR = journal_date()
-CURRENT_DATETIME = datetime.strptime(USER_SPECIFIED_CURRENT_DATE_STR, "%Y-%m-%d")
-YESTERDAY_DATETIME = CURRENT_DATETIME - timedelta(days=1)
-YESTERDAY_DATE_STR = YESTERDAY_DATETIME.strftime("%Y-%m-%d")
+
+def _current_dates():
+    """
+    Returns (current date string, current datetime, yesterday date string).
+    Computed on every call so a long-running process doesn't keep yesterday's date after midnight.
+    """
+    current_date_str, yesterday_date_str = journal_date()
+    current_datetime = datetime.strptime(current_date_str, "%Y-%m-%d")
+    return current_date_str, current_datetime, yesterday_date_str
 
 # --- Internal Helper Functions ---
 def _get_latest_journal_file_path():
     """
     Finds the most recently modified JSON file in the journal directory.
     Returns the file path or None if no JSON files are found.
+    The directory scan is cached by file_cache until the directory changes.
     """
     # Ensure the directory exists to prevent glob errors if it's missing
     if not os.path.isdir(JOURNAL_DIR):
         print(f"Error: Journal directory not found: {JOURNAL_DIR}")
         return None
     
-    list_of_files = glob.glob(os.path.join(JOURNAL_DIR, '*.json'))
-    if not list_of_files:
-        return None
-    
-    try:
-        latest_file = max(list_of_files, key=os.path.getmtime)
-        return latest_file
-    except FileNotFoundError:
-        # This can happen in a rare race condition if a file is deleted between glob and getmtime
-        print(f"Error: A file listed by glob was not found during mtime check in {JOURNAL_DIR}")
-        return None
+    return file_cache.latest_file(JOURNAL_DIR, '*.json')
 
 # --- Main Journal Data Function ---
 def get_journal_data_from_latest_file():
@@ -56,21 +52,21 @@ def get_journal_data_from_latest_file():
     If no file is found or an error occurs, it returns a default structure.
     """
     latest_file_path = _get_latest_journal_file_path()
+    _, _, yesterday_date_str = _current_dates()
 
     if not latest_file_path:
         print(f"No journal files found in {JOURNAL_DIR}. Returning default structure for 'yesterday'.")
         return {
-            "date": YESTERDAY_DATE_STR,
+            "date": yesterday_date_str,
             "sentiment": "N/A",
             "mood": "N/A",
             "tags": [],
-            "journal_entry": f"There was no journal entry for {YESTERDAY_DATE_STR} (no file found).",
+            "journal_entry": f"There was no journal entry for {yesterday_date_str} (no file found).",
             "long_term_goal": "N/A"
         }
 
     try:
-        with open(latest_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = file_cache.load_json(latest_file_path)
         # It's good practice to ensure the 'date' field exists,
         # even if we primarily rely on the file being the "latest".
         if "date" not in data:
@@ -82,21 +78,21 @@ def get_journal_data_from_latest_file():
         # but kept for robustness.
         print(f"Error: Journal file {latest_file_path} not found unexpectedly.")
         return {
-            "date": YESTERDAY_DATE_STR,
+            "date": yesterday_date_str,
             "journal_entry": f"Error: File {latest_file_path} not found.",
             "long_term_goal": "Error: File not found."
         }
     except json.JSONDecodeError:
         print(f"Error: Could not decode JSON from {latest_file_path}.")
         return {
-            "date": YESTERDAY_DATE_STR, # Or attempt to get date from filename if possible
+            "date": yesterday_date_str, # Or attempt to get date from filename if possible
             "journal_entry": f"Error: Invalid JSON in {latest_file_path}.",
             "long_term_goal": "Error: Invalid JSON."
         }
     except Exception as e:
         print(f"An unexpected error occurred while reading journal file {latest_file_path}: {e}")
         return {
-            "date": YESTERDAY_DATE_STR,
+            "date": yesterday_date_str,
             "journal_entry": f"Error reading journal: {e}",
             "long_term_goal": f"Error reading journal: {e}"
         }
@@ -115,7 +111,7 @@ def get_long_term_goal_text(journal_data: dict) -> str:
 
 def get_journal_age_statement(journal_data: dict) -> str:
     """
-    Determines how many days ago the journal entry is from (relative to USER_SPECIFIED_CURRENT_DATE_STR)
+    Determines how many days ago the journal entry is from (relative to the current date)
     and returns an appropriate statement.
     """
     journal_date_str = journal_data.get("date")
@@ -127,15 +123,16 @@ def get_journal_age_statement(journal_data: dict) -> str:
     except ValueError:
         return f"My journal entry from a date with an invalid format ({journal_date_str}):"
 
-    # Calculate days ago from the user-specified current date (May 29th, 2025)
-    actual_days_ago = (CURRENT_DATETIME - journal_date_obj).days
+    # Calculate days ago from the current date
+    current_date_str, current_datetime, _ = _current_dates()
+    actual_days_ago = (current_datetime - journal_date_obj).days
 
     if actual_days_ago == 1:  # Entry is from May 28th (yesterday relative to May 29th)
         return "My journal entry from yesterday:"
     elif actual_days_ago == 0: # Entry is from "today" (May 29th)
         return "My journal entry from today:"
     elif actual_days_ago < 0: # Entry is from the future
-        return f"My journal entry from {-actual_days_ago} days in the future (relative to {USER_SPECIFIED_CURRENT_DATE_STR}):"
+        return f"My journal entry from {-actual_days_ago} days in the future (relative to {current_date_str}):"
     else:  # actual_days_ago > 1 or other cases
         return f"My journal entry from {actual_days_ago} days ago:"
 
@@ -153,26 +150,27 @@ def get_long_term_goal_age_statement(journal_data: dict) -> str:
     except ValueError:
         return f"My long term goal from a date with an invalid format ({journal_date_str}):"
 
-    actual_days_ago = (CURRENT_DATETIME - journal_date_obj).days
+    current_date_str, current_datetime, _ = _current_dates()
+    actual_days_ago = (current_datetime - journal_date_obj).days
 
     if actual_days_ago == 1:  # Entry is from May 28th
         return "My long term goal from yesterday:"
     elif actual_days_ago == 0: # Entry is from "today" (May 29th)
         return "My long term goal from today:"
     elif actual_days_ago < 0:
-        return f"My long term goal from {-actual_days_ago} days in the future (relative to {USER_SPECIFIED_CURRENT_DATE_STR}):"
+        return f"My long term goal from {-actual_days_ago} days in the future (relative to {current_date_str}):"
     else:  # actual_days_ago > 1
         return f"My long term goal from {actual_days_ago} days ago:"
 
 # --- SOC File Check Function ---
 def check_soc_file_size() -> bool:
     """
-    Checks today's SOC file (YYYY-MM-DD.txt in SOC, based on USER_SPECIFIED_CURRENT_DATE_STR).
+    Checks today's SOC file (YYYY-MM-DD.txt in SOC, based on the current date).
     Returns True if file size > 1600 KB.
     Returns False otherwise (covering cases <= 1600 KB, which also means it handles the
     user's secondary condition "if less than 2500 KB, return False" for those smaller files).
     """
-    today_date_str_for_soc = CURRENT_DATETIME.strftime("%Y-%m-%d")
+    today_date_str_for_soc, _, _ = _current_dates()
     soc_file_name = f"{today_date_str_for_soc}.txt"
     soc_file_path = os.path.join(SOC_DIR, soc_file_name)
 
@@ -202,7 +200,8 @@ def check_soc_file_size() -> bool:
 
 # Example of how you might call these functions:
 if __name__ == "__main__":
-    print(f"Operating based on user-specified current date: {USER_SPECIFIED_CURRENT_DATE_STR}\n")
+    current_date_str, current_datetime, _ = _current_dates()
+    print(f"Operating based on user-specified current date: {current_date_str}\n")
 
     # 1. Get data from the latest journal entry
     harrys_latest_journal_data = get_journal_data_from_latest_file()
@@ -226,7 +225,7 @@ if __name__ == "__main__":
 
 
     # 3. Check SOC file size
-    print(f"\n--- SOC File Check for {CURRENT_DATETIME.strftime('%Y-%m-%d')} ---")
+    print(f"\n--- SOC File Check for {current_datetime.strftime('%Y-%m-%d')} ---")
     
     # General call (will look for actual file or print not found)
     soc_status = check_soc_file_size()
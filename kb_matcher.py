@@ -0,0 +1,180 @@
+"""
+Knowledgebase key matching in one pass over the conversation text.
+
+Plain keys go into an Aho-Corasick automaton (pyahocorasick if it's installed, a
+pure-Python one otherwise) and /pattern/is keys are compiled once, each gated on the
+literals it can't match without; every key maps back to the entries that use it.
+Matching follows get_key_matches' original rules: plain keys are case-sensitive
+substrings, regex keys are searched case-insensitively, and an entry matches if any of
+its keys does. knowledgebase_search builds one KeyMatcher per
+knowledgebase snapshot, so it's rebuilt only when the KB changes.
+"""
+import re
+from collections import deque
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Shortest literal worth prefiltering a regex key on
+MIN_PREFILTER_LENGTH = 3
+# Characters re.IGNORECASE matches to an ASCII letter that casefold() maps elsewhere
+# (dotless ı and dotted İ both match 'i'); every other such character casefolds to it
+PREFILTER_FOLDS = str.maketrans({'\u0131': 'i', '\u0130': 'i'})
+
+def is_regex_key(key):
+    return key.startswith('/') and key.endswith('/is')
+
+def prefilter_fold(text):
+    """Casefold text so it contains a required literal wherever re.IGNORECASE could match it"""
+    return text.translate(PREFILTER_FOLDS).casefold()
+
+def required_literals(items):
+    """
+    Casefolded ASCII strings at least one of which must occur in any text the parsed
+    pattern matches, or None if no useful set can be read off it. Only plain literal runs,
+    groups, required repeats and branches whose arms all have literals are used.
+    """
+    best = None
+    run = []
+
+    def consider(candidates):
+        nonlocal best
+        if candidates and min(map(len, candidates)) >= MIN_PREFILTER_LENGTH:
+            if best is None or min(map(len, candidates)) > min(map(len, best)):
+                best = candidates
+
+    for op, value in items:
+        if op is sre_parse.LITERAL and value < 128:
+            run.append(chr(value))
+            continue
+        consider({''.join(run).casefold()} if run else None)
+        run = []
+        if op is sre_parse.SUBPATTERN:
+            consider(required_literals(value[-1]))
+        elif op is sre_parse.BRANCH:
+            arms = [required_literals(arm) for arm in value[1]]
+            if all(arms):
+                consider(set().union(*arms))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1:
+            consider(required_literals(value[2]))
+    consider({''.join(run).casefold()} if run else None)
+    return best
+
+class Automaton:
+    """Pure-Python Aho-Corasick over a list of strings"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (pattern_id,)
+
+        # Breadth-first so every state's failure link is final before its children use it
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                pending.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def find(self, text):
+        """Set of pattern ids that occur anywhere in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+class PyAutomaton:
+    """Same interface backed by pyahocorasick"""
+
+    def __init__(self, patterns):
+        self.automaton = ahocorasick.Automaton()
+        for pattern_id, pattern in enumerate(patterns):
+            self.automaton.add_word(pattern, pattern_id)
+        self.empty = not patterns
+        if not self.empty:
+            self.automaton.make_automaton()
+
+    def find(self, text):
+        if self.empty:
+            return set()
+        return {pattern_id for _, pattern_id in self.automaton.iter(text)}
+
+class KeyMatcher:
+    """Maps conversation text to the entries whose keys it contains"""
+
+    def __init__(self, entries):
+        plain_keys = {}
+        regex_keys = {}
+        always = set()
+        for position, entry in enumerate(entries):
+            for key in entry.get('keys') or []:
+                if not isinstance(key, str):
+                    continue
+                if is_regex_key(key):
+                    regex_keys.setdefault(key[1:-3], set()).add(position)
+                elif key:
+                    plain_keys.setdefault(key, set()).add(position)
+                else:
+                    always.add(position)  # '' is a substring of everything
+
+        self.plain_keys = list(plain_keys)
+        self.plain_entries = [plain_keys[key] for key in self.plain_keys]
+        self.automaton = (PyAutomaton if ahocorasick is not None else Automaton)(self.plain_keys)
+        # Regex keys with required literals only run when one of them shows up in the
+        # folded text (found with a second automaton); the rest always run
+        self.regexes = []
+        literal_ids = {}
+        for pattern, positions in regex_keys.items():
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                print(f"++CONSOLE: Skipping invalid knowledgebase key /{pattern}/is: {e}")
+                continue
+            literals = required_literals(sre_parse.parse(pattern, re.IGNORECASE))
+            needs = None if literals is None else {literal_ids.setdefault(literal, len(literal_ids)) for literal in literals}
+            self.regexes.append((regex, positions, needs))
+        self.literal_automaton = (PyAutomaton if ahocorasick is not None else Automaton)(list(literal_ids))
+        self.always = always
+
+    def match(self, text):
+        """Sorted positions (in the entries list the matcher was built from) of matching entries"""
+        matched = set(self.always)
+        for key_id in self.automaton.find(text):
+            matched |= self.plain_entries[key_id]
+        present = self.literal_automaton.find(prefilter_fold(text)) if self.regexes else set()
+        for regex, positions, needs in self.regexes:
+            # A pattern only needs to run if it could still add an entry and its literals are there
+            if positions <= matched or (needs is not None and not needs & present):
+                continue
+            if regex.search(text):
+                matched |= positions
+        return sorted(matched)
@@ -2,20 +2,20 @@ import json
 import os
 import re
 import asyncio
+import threading
 import aiofiles
 import aiohttp
 from datetime import datetime, timezone, timedelta
-import sentencepiece as spm
 import loaders
 import database
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import kb_matcher
+import relevance
+import turn_context
+import prompt_budget
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv, set_key
 
-tokenizer = spm.SentencePieceProcessor(model_file='novelai_v2.model')
-
 env_vars = {
     "HIDE_PRIVATE": "No",
     "MODEL_VERSION": "v1.0",
@@ -528,18 +528,77 @@ async def save_data_in_multiple_formats(prompt, response):
                 
     return "Data saved in multiple formats."
 
-async def load_knowledgebase(persona="Rhoda"):
-    """Load knowledgebase from SQL database"""
-    # Get categories and entries from SQL
-    categories = database.get_kb_categories(enabled_only=False)
-    entries = database.get_kb_entries(enabled_only=False)
-    
-    # Convert to lorebook format for compatibility
-    lorebook = {
+def parse_json_field(value, default):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return default
+    return value if value is not None else default
+
+def prepare_entry(entry):
+    """Copy of a kb_entries row with JSON fields parsed and name/text/budgets resolved once"""
+    entry = dict(entry)
+    entry['keys'] = parse_json_field(entry.get('keys'), [])
+    entry['context_config'] = parse_json_field(entry.get('context_config'), {})
+    entry['lore_bias_groups'] = parse_json_field(entry.get('lore_bias_groups'), [])
+    # Handle both display_name/text_content (SQL) and displayName/text (original)
+    entry['display_name'] = entry.get('display_name') or entry.get('displayName', '')
+    entry['text_content'] = entry.get('text_content') or entry.get('text', '')
+    config = entry.get('contextConfig') if isinstance(entry.get('contextConfig'), dict) else entry['context_config']
+    if not isinstance(config, dict):
+        config = {}
+    entry['token_budget'] = config.get('tokenBudget', entry.get('token_budget') or 250)
+    if entry.get('budget_priority') is None:
+        entry['budget_priority'] = config.get('budgetPriority', 0)
+    return entry
+
+def build_knowledgebase(version, categories, entries):
+    """Lorebook-format dict plus the per-category index and always-on text, all computed up front"""
+    entries = [prepare_entry(entry) for entry in entries]
+    by_category = {}
+    for entry in entries:
+        by_category.setdefault(entry.get("category_id") or entry.get("category"), []).append(entry)
+    return {
+        'version': version,
         'categories': categories,
-        'entries': entries
+        'entries': entries,
+        'by_category': by_category,
+        'constant_text': format_constant_entries(entries),
+        'matcher': kb_matcher.KeyMatcher(entries),
+        'relevance': relevance.TfidfIndex(range(len(entries)), [entry['text_content'] for entry in entries]),
     }
-    return lorebook
+
+kb_snapshot = None
+kb_snapshot_lock = threading.Lock()
+
+def get_knowledgebase():
+    """
+    Process-wide knowledgebase snapshot; only queries the database when the 'kb' data
+    version has moved since the last load. Treat it as read-only, it's shared between callers.
+    """
+    global kb_snapshot
+    snapshot = kb_snapshot
+    if snapshot is not None and snapshot['version'] == database.data_versions['kb']:
+        return snapshot
+    with kb_snapshot_lock:
+        if kb_snapshot is None or kb_snapshot['version'] != database.data_versions['kb']:
+            # Read the version first, so a write that lands mid-load triggers another reload
+            version = database.data_versions['kb']
+            kb_snapshot = build_knowledgebase(
+                version,
+                database.get_kb_categories(enabled_only=False),
+                database.get_kb_entries(enabled_only=False),
+            )
+            print(f"++CONSOLE: Loaded knowledgebase snapshot v{version} ({len(kb_snapshot['entries'])} entries)")
+        return kb_snapshot
+
+async def load_knowledgebase(persona="Rhoda"):
+    """Load the knowledgebase (cached snapshot; reloaded from SQL after KB writes)"""
+    snapshot = kb_snapshot
+    if snapshot is not None and snapshot['version'] == database.data_versions['kb']:
+        return snapshot
+    return await asyncio.to_thread(get_knowledgebase)
 
 # bias_path = "number_biases.json"
 
@@ -569,14 +628,12 @@ def fetch_category_number(category_choice, knowledgebase):
 
 def fetch_entries_by_category_id(category_id, knowledgebase):
     """Fetch entries by category ID from SQL-based knowledgebase"""
-    entries = knowledgebase.get("entries", [])
+    entries = knowledgebase.get("by_category", {}).get(category_id, [])
     labeled_entries = []
     hide_private = os.environ.get('HIDE_PRIVATE', 'No')  # default to 'No' if not set
 
     for entry in entries:
-        # Handle SQL format with category_id field
-        entry_category = entry.get("category_id") or entry.get("category")
-        if entry_category == category_id and entry.get("enabled", False):
+        if entry.get("enabled", False):
             keys = entry.get("keys", [])
             label = "Public"
             if "private entry" in keys:
@@ -586,10 +643,7 @@ def fetch_entries_by_category_id(category_id, knowledgebase):
                 elif hide_private == 'No':
                     # label private entries as "Private" if HIDE_PRIVATE is 'No'
                     label = "Private"
-            # Handle both display_name (SQL) and displayName (original)
-            name = entry.get("display_name") or entry.get("displayName", "")
-            text = entry.get("text_content") or entry.get("text", "")
-            labeled_entries.append((name, text, label))
+            labeled_entries.append((entry['display_name'], entry['text_content'], label))
     labeled_entries.sort(key=lambda x: x[0].lower())  # sort alphabetically by displayName
     return labeled_entries
 
@@ -597,17 +651,13 @@ def condition_for_constant_entry(entry):
     # Handle both force_activation (SQL) and forceActivation (original)
     return entry.get('force_activation', False) or entry.get('forceActivation', False)
 
+def format_constant_entries(entries):
+    constant_entries = [entry['text_content'] for entry in entries if condition_for_constant_entry(entry)]
+    return "\n".join([f" {content} " for content in constant_entries])
+
 def always_on_kb_entries(knowledgebase):
     """Get always-on entries from SQL-based knowledgebase"""
-    constant_entries = []
-    for entry in knowledgebase['entries']:
-        if condition_for_constant_entry(entry):
-            # Handle both text_content (SQL) and text (original)
-            text = entry.get('text_content') or entry.get('text', '')
-            constant_entries.append(text)
-
-    formatted_constant_entries = "\n".join([f" {content} " for content in constant_entries])
-    return formatted_constant_entries
+    return knowledgebase['constant_text']
 
 def trim_text_to_tokens(text, max_tokens):
     # Safety check: if token budget is too low, use a minimum of 50 tokens
@@ -619,108 +669,56 @@ def trim_text_to_tokens(text, max_tokens):
 
 async def get_key_matches(clicked, knowledgebase, max_entries=6):
     """Get key matches from SQL-based knowledgebase"""
-    conversation_history, long_term_memories, stream_of_consciousness = await loaders.lite_variable_set(conversation_type=clicked)
-    filtered_entries = []
-    for entry in knowledgebase['entries']:
-        if clicked != 'OpenAI' or entry.get('hidden') != True:
-            # Handle keys being either a list or already parsed from SQL
-            keys = entry.get('keys', [])
-            if isinstance(keys, str):
-                try:
-                    keys = json.loads(keys)
-                except:
-                    keys = []
-            
-            for key in keys:
-                if key.startswith('/') and key.endswith('/is'):  # Check if key is a regex pattern
-                    pattern = key[1:-3]  # Remove the slashes and flags
-                    if re.search(pattern, conversation_history, re.IGNORECASE):
-                        filtered_entries.append(entry)
-                        break
-                elif key in conversation_history:  # Plain text key check
-                    filtered_entries.append(entry)
-                    break
-
-    if not filtered_entries:
+    # Keys are matched against the same recent history lite_variable_set would return; its
+    # memory search and stream of consciousness aren't needed here
+    conversation_history = (await loaders.fleeting(clicked, max_chars=2400))[-2400:]
+    entries = knowledgebase['entries']
+    positions = [position for position in knowledgebase['matcher'].match(conversation_history)
+                 if clicked != 'OpenAI' or entries[position].get('hidden') != True]
+
+    if not positions:
         return []
 
-    vectorizer = TfidfVectorizer()
-    # Handle both text_content (SQL) and text (original)
-    filtered_entry_texts = [entry.get('text_content') or entry.get('text', '') for entry in filtered_entries]
-    tfidf_matrix = vectorizer.fit_transform([conversation_history] + filtered_entry_texts)
-    similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-
-    # Combine the filtered entries and their respective similarities, and sort by similarity
-    sorted_entries = sorted(zip(filtered_entries, similarities), key=lambda x: x[1], reverse=True)
-
-    # Only return the top max_entries most relevant entries
-    top_entries = [entry for entry, _ in sorted_entries[:max_entries]]
+    # Rank by TF-IDF similarity to the history with the model fitted when the snapshot was
+    # built, keeping only the top max_entries most relevant entries
+    top_entries = knowledgebase['relevance'].rank(
+        conversation_history,
+        [entries[position] for position in positions],
+        positions,
+        [entries[position]['text_content'] for position in positions],
+        limit=max_entries,
+    )
 
     # Sort top_entries based on budgetPriority before trimming
-    # Handle both budget_priority (SQL) and contextConfig.budgetPriority (original)
-    def get_priority(e):
-        if 'budget_priority' in e:
-            return e['budget_priority']
-        elif 'contextConfig' in e and isinstance(e['contextConfig'], dict):
-            return e['contextConfig'].get('budgetPriority', 0)
-        return 0
-    top_entries_sorted_by_priority = sorted(top_entries, key=get_priority, reverse=True)
+    top_entries_sorted_by_priority = sorted(top_entries, key=lambda e: e['budget_priority'], reverse=True)
 
     top_entries_trimmed = []
     for entry in top_entries_sorted_by_priority:
-        # Handle both SQL and original formats
-        keys = entry.get('keys', [])
-        if isinstance(keys, str):
-            try:
-                keys = json.loads(keys)
-            except:
-                pass
-        
-        text = entry.get('text_content') or entry.get('text', '')
-        name = entry.get('display_name') or entry.get('displayName', '')
-        
-        # Get token budget from either direct field or context_config
-        token_budget = entry.get('token_budget', 250)
-        if 'contextConfig' in entry and isinstance(entry['contextConfig'], dict):
-            token_budget = entry['contextConfig'].get('tokenBudget', token_budget)
-        elif 'context_config' in entry:
-            if isinstance(entry['context_config'], dict):
-                token_budget = entry['context_config'].get('tokenBudget', token_budget)
-            elif isinstance(entry['context_config'], str):
-                try:
-                    config = json.loads(entry['context_config'])
-                    token_budget = config.get('tokenBudget', token_budget)
-                except:
-                    pass
-        
-        budget_priority = get_priority(entry)
-        
         top_entries_trimmed.append({
-            'key': keys,
-            'content': trim_text_to_tokens(text, token_budget),
-            'comment': name,
-            'tokenBudget': token_budget,
-            'budgetPriority': budget_priority
+            'key': entry['keys'],
+            'content': trim_text_to_tokens(entry['text_content'], entry['token_budget']),
+            'comment': entry['display_name'],
+            'tokenBudget': entry['token_budget'],
+            'budgetPriority': entry['budget_priority']
         })
 
     return top_entries_trimmed
 
 async def kb_entries(text, persona="Rhoda", conversation_type="Maggie"):
     """Async version of kb_entries"""
-    conversation_history = await loaders.fleeting(conversation_type)
     knowledgebase = await load_knowledgebase(persona)
     constant_entries = always_on_kb_entries(knowledgebase)
     top_entries_trimmed = await get_key_matches(conversation_type, knowledgebase)
     print(f"Top Entries Trimmed: {top_entries_trimmed}")
     knowledgebase_entries = update_knowledgebase_field(top_entries_trimmed)
     kb_entries_text = "\n".join(knowledgebase_entries)
-    kb_entries_tokens = tokenizer.encode(kb_entries_text)
-    if len(kb_entries_tokens) > 1400:
-        kb_entries_tokens = kb_entries_tokens[:1000]
-        kb_entries_text = tokenizer.decode(kb_entries_tokens)
+    # The matched entries rarely change between turns, so the count is usually a cache hit
+    if prompt_budget.count_tokens(kb_entries_text) > 1400:
+        kb_entries_text = prompt_budget.trim_to_tokens(kb_entries_text, 1000)
 
     return kb_entries_text
 
+@turn_context.memoize
 async def constant_entries(person="Harry"):
     """Async version of constant_entries"""
     knowledgebase = await load_knowledgebase(person)
@@ -863,7 +861,7 @@ async def edit_knowledgebase_entry(query, new_title=None, new_content=None, new_
 
 # Example usage
 if __name__ == "__main__":
-    knowledgebase = load_knowledgebase()
+    knowledgebase = get_knowledgebase()
     categories = fetch_categories(knowledgebase)
     print(f"//Categories from fetch_categories: {categories}")
     numbered_categories = "\n".join(f"{index + 1}. {category[0]}" for index, category in enumerate(categories))
@@ -12,9 +12,19 @@ import re
 import prompt_builder
 import random
 import error_handler
+import log_writer
+import file_cache
 import knowledgebase_search
+import turn_context
+import threading
+import functools
+from collections import deque
+from types import MappingProxyType
 import redis
 import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -27,13 +37,90 @@ r = redis.Redis(host=os.getenv('REDIS_HOST', '127.0.0.1'), port=int(os.getenv('R
 # Store Redis connections per user for namespace isolation
 user_redis_connections = {}
 
-# Async Redis connection
-async def get_redis_client():
-    """Get or create async Redis client"""
+# Async Redis pool settings (override via environment)
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 20))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 5))
+REDIS_RETRY_ATTEMPTS = int(os.getenv('REDIS_RETRY_ATTEMPTS', 3))
+
+# asyncio connections are bound to the loop that opened them, and Flask runs each
+# async view on its own loop, so we keep one pooled client per loop. Entry points that
+# run on a short-lived loop close it before the loop ends (releases_loop_clients, run).
+async_redis_clients = {}
+async_redis_lock = threading.Lock()
+
+def build_async_redis_client():
+    """Create a pooled async Redis client with health checks and reconnect retries"""
     redis_host = os.getenv('REDIS_HOST', '127.0.0.1')
     redis_port = os.getenv('REDIS_PORT', '6379')
     redis_db = os.getenv('REDIS_DB', '0')
-    return await aioredis.from_url(f'redis://{redis_host}:{redis_port}', db=int(redis_db), decode_responses=True)
+    pool = aioredis.ConnectionPool.from_url(
+        f'redis://{redis_host}:{redis_port}',
+        db=int(redis_db),
+        decode_responses=True,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_keepalive=True,
+        retry_on_timeout=True,
+        retry_on_error=[RedisConnectionError, RedisTimeoutError],
+        retry=Retry(ExponentialBackoff(cap=1.0, base=0.05), REDIS_RETRY_ATTEMPTS),
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+# Async Redis connection
+async def get_redis_client():
+    """Get the shared pooled async Redis client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = async_redis_clients.get(loop)
+    if client is not None:
+        return client
+    with async_redis_lock:
+        # A closed loop's connections can't be disconnected from another loop; forget them
+        # (their sockets close when collected) and say which entry point skipped its cleanup
+        for stale_loop in [l for l in async_redis_clients if l.is_closed()]:
+            print("++CONSOLE: Redis client of a closed event loop was never closed; wrap its entry point with loaders.releases_loop_clients")
+            del async_redis_clients[stale_loop]
+        client = async_redis_clients.get(loop)
+        if client is None:
+            client = build_async_redis_client()
+            async_redis_clients[loop] = client
+    return client
+
+async def close_redis_client():
+    """Disconnect the pooled client for the running event loop (call before the loop shuts down)"""
+    loop = asyncio.get_running_loop()
+    with async_redis_lock:
+        client = async_redis_clients.pop(loop, None)
+    if client is not None:
+        await client.connection_pool.disconnect()
+
+async def close_loop_clients():
+    """Close every per-loop client (Redis pool) opened on the running loop"""
+    try:
+        await close_redis_client()
+    except Exception as e:
+        print(f"++CONSOLE: Closing the loop's Redis client failed: {e}")
+
+def releases_loop_clients(function):
+    """For async entry points on short-lived loops (Flask views): close the loop's clients when the call ends"""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            await close_loop_clients()
+    return wrapper
+
+def run(coroutine):
+    """asyncio.run() that closes the loop's per-loop clients before the loop goes away"""
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await close_loop_clients()
+    return asyncio.run(main())
 
 def get_user_redis(username):
     """Get or create a Redis namespace for a specific user"""
@@ -46,33 +133,263 @@ def get_user_redis(username):
 async def redis_load(variable, username=None):
     """Async version of redis_load"""
     r = await get_redis_client()
-    try:
-        if username:
-            variable = f"user:{username}:{variable}"
-        value = await r.get(variable)
-        return value
-    finally:
-        await r.close()
+    if username:
+        variable = f"user:{username}:{variable}"
+    value = await r.get(variable)
+    return value
 
 async def redis_save(variable, value, username=None):
     """Async version of redis_save"""
     r = await get_redis_client()
-    try:
-        if username:
-            variable = f"user:{username}:{variable}"
-        await r.set(variable, value)
-    finally:
-        await r.close()
+    if username:
+        variable = f"user:{username}:{variable}"
+    await r.set(variable, value)
 
 async def redis_append(variable, value, username=None):
     """Async version of redis_append"""
     r = await get_redis_client()
-    try:
-        if username:
-            variable = f"user:{username}:{variable}"
-        await r.rpush(variable, value)
-    finally:
-        await r.close()
+    if username:
+        variable = f"user:{username}:{variable}"
+    await r.rpush(variable, value)
+
+#=======
+#Conversation History (Redis list, one element per message)
+#=======
+
+# Oldest messages are trimmed once the list grows past this many entries
+CONVERSATION_HISTORY_MAX_LINES = int(os.getenv('CONVERSATION_HISTORY_MAX_LINES', 1000))
+# How many messages to pull per LRANGE when reading the tail of the history
+CONVERSATION_HISTORY_TAIL_CHUNK = 50
+
+# Sets KEYS[1] only if ARGV[1] sorts after the stored value (ISO timestamps compare as strings)
+SET_IF_NEWER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and current >= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Converts a legacy string history into a list in place, splitting on newlines
+MIGRATE_HISTORY_SCRIPT = """
+local kind = redis.call('TYPE', KEYS[1])['ok']
+if kind ~= 'string' then
+    return 0
+end
+local value = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+local count = 0
+local start = 1
+while start <= #value do
+    local stop = string.find(value, '\\n', start, true)
+    if not stop then
+        stop = #value + 1
+    end
+    redis.call('RPUSH', KEYS[1], string.sub(value, start, stop - 1))
+    count = count + 1
+    start = stop + 1
+end
+local max_lines = tonumber(ARGV[1])
+if count > 0 and max_lines > 0 then
+    redis.call('LTRIM', KEYS[1], -max_lines, -1)
+end
+return count
+"""
+
+def conversation_history_key(username=None):
+    if username:
+        return f"user:{username}:conversation_history"
+    return "conversation_history"
+
+def is_wrong_type_error(error):
+    return isinstance(error, redis.exceptions.ResponseError) and 'WRONGTYPE' in str(error)
+
+async def migrate_conversation_history(key):
+    """Convert a string-valued conversation_history key into a list, in place and atomically"""
+    r = await get_redis_client()
+    migrated = await r.eval(MIGRATE_HISTORY_SCRIPT, 1, key, CONVERSATION_HISTORY_MAX_LINES)
+    if migrated:
+        print(f"++CONSOLE: Migrated {key} to a list ({migrated} messages)")
+    return migrated
+
+async def migrate_all_conversation_histories():
+    """One-shot migration of every legacy conversation_history string key"""
+    r = await get_redis_client()
+    total = 0
+    async for key in r.scan_iter(match="*conversation_history"):
+        if await r.type(key) == 'string':
+            await migrate_conversation_history(key)
+            total += 1
+    print(f"++CONSOLE: Migrated {total} conversation_history keys")
+    return total
+
+async def append_conversation_history(labeled_message, username=None, timestamp=None):
+    """Append one message to the user's history (and stamp last_message) in a single atomic round trip"""
+    r = await get_redis_client()
+    key = conversation_history_key(username)
+    for attempt in range(2):
+        try:
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, labeled_message)
+                pipe.ltrim(key, -CONVERSATION_HISTORY_MAX_LINES, -1)
+                if timestamp:
+                    pipe.eval(SET_IF_NEWER_SCRIPT, 1, f"user:{username}:last_message" if username else "last_message", timestamp)
+                await pipe.execute()
+            return
+        except redis.exceptions.ResponseError as e:
+            if attempt or not is_wrong_type_error(e):
+                raise
+            await migrate_conversation_history(key)
+
+async def load_conversation_history(username=None, max_chars=None):
+    """
+    Return the user's conversation history as newline-terminated text, or None if empty.
+    With max_chars, only enough messages from the end of the list to cover that many characters are fetched.
+    """
+    r = await get_redis_client()
+    key = conversation_history_key(username)
+    for attempt in range(2):
+        try:
+            if not max_chars:
+                lines = await r.lrange(key, 0, -1)
+            else:
+                lines = []
+                total_chars = 0
+                end = -1
+                while total_chars < max_chars:
+                    start = end - CONVERSATION_HISTORY_TAIL_CHUNK + 1
+                    chunk = await r.lrange(key, start, end)
+                    if not chunk:
+                        break
+                    lines[:0] = chunk
+                    total_chars += sum(len(line) + 1 for line in chunk)
+                    if len(chunk) < CONVERSATION_HISTORY_TAIL_CHUNK:
+                        break
+                    end = start - 1
+            break
+        except redis.exceptions.ResponseError as e:
+            if attempt or not is_wrong_type_error(e):
+                raise
+            await migrate_conversation_history(key)
+    if not lines:
+        return None
+    return '\n'.join(lines) + '\n'
+
+async def conversation_history_exists(username=None):
+    r = await get_redis_client()
+    return bool(await r.exists(conversation_history_key(username)))
+
+async def clear_conversation_history(username=None):
+    r = await get_redis_client()
+    await r.delete(conversation_history_key(username))
+
+#=======
+#Turn Snapshot (every Redis string the prompt build reads, in one MGET)
+#=======
+
+# Global keys shared across users
+TURN_SNAPSHOT_KEYS = ("selected_model", "mood", "goal", "internal_thought", "username", "held_thought")
+# Keys namespaced under user:{username}:
+TURN_SNAPSHOT_USER_KEYS = ("last_message", "convo_start")
+
+async def load_turn_snapshot(username=None):
+    """
+    Fetch everything prompt_builder.prompt and headers.build_header read from Redis in a
+    single MGET. Returns a read-only mapping so every stage of the prompt build sees the
+    same values for the turn.
+    """
+    r = await get_redis_client()
+    user_keys = [f"user:{username}:{key}" if username else key for key in TURN_SNAPSHOT_USER_KEYS]
+    values = await r.mget(list(TURN_SNAPSHOT_KEYS) + user_keys)
+    return MappingProxyType(dict(zip(TURN_SNAPSHOT_KEYS + TURN_SNAPSHOT_USER_KEYS, values)))
+
+#=======
+#Turn State (batched per-turn Redis reads/writes)
+#=======
+
+class TurnStateWriter:
+    """
+    Collects the Redis bookkeeping for one conversational turn and sends it as a single
+    MULTI/EXEC round trip. Queue operations with set/get/append_history/set_if_newer, then
+    await flush(), which returns the values of any queued gets keyed by variable name.
+    """
+
+    def __init__(self, username=None):
+        self.username = username
+        self.ops = []
+
+    def key(self, variable):
+        if self.username:
+            return f"user:{self.username}:{variable}"
+        return variable
+
+    def set(self, variable, value):
+        self.ops.append(('set', variable, value))
+        return self
+
+    def get(self, variable):
+        self.ops.append(('get', variable, None))
+        return self
+
+    def set_if_newer(self, variable, value):
+        self.ops.append(('set_if_newer', variable, value))
+        return self
+
+    def append_history(self, labeled_message, timestamp=None):
+        """Queue a conversation_history append; the timestamp also advances last_message"""
+        self.ops.append(('append_history', labeled_message, None))
+        if timestamp:
+            self.set_if_newer("last_message", timestamp)
+        return self
+
+    def queue(self, pipe, ops):
+        history_key = conversation_history_key(self.username)
+        for op, arg, value in ops:
+            if op == 'set':
+                pipe.set(self.key(arg), value)
+            elif op == 'get':
+                pipe.get(self.key(arg))
+            elif op == 'set_if_newer':
+                pipe.eval(SET_IF_NEWER_SCRIPT, 1, self.key(arg), value)
+            elif op == 'append_history':
+                pipe.rpush(history_key, arg)
+                pipe.ltrim(history_key, -CONVERSATION_HISTORY_MAX_LINES, -1)
+
+    async def flush(self):
+        ops, self.ops = self.ops, []
+        if not ops:
+            return {}
+        r = await get_redis_client()
+        async with r.pipeline(transaction=True) as pipe:
+            self.queue(pipe, ops)
+            results = await pipe.execute(raise_on_error=False)
+
+        values = {}
+        position = 0
+        failed_history = []
+        for op, arg, value in ops:
+            if op == 'append_history':
+                result, position = results[position], position + 2
+                if isinstance(result, Exception):
+                    if not is_wrong_type_error(result):
+                        raise result
+                    failed_history.append((op, arg, value))
+                continue
+            result, position = results[position], position + 1
+            if isinstance(result, Exception):
+                raise result
+            if op == 'get':
+                values[arg] = result
+
+        # A legacy string history rejects RPUSH inside the transaction; convert it and replay
+        # just the history appends (the rest of the batch has already been applied)
+        if failed_history:
+            await migrate_conversation_history(conversation_history_key(self.username))
+            async with r.pipeline(transaction=True) as pipe:
+                self.queue(pipe, failed_history)
+                await pipe.execute()
+        return values
 
 @error_handler.if_errors
 async def open_file(filepath):
@@ -99,6 +416,12 @@ async def save_json(filepath, payload):
     async with aiofiles.open(filepath, 'w', encoding='utf-8') as outfile:
         content = json.dumps(payload, ensure_ascii=False, sort_keys=True, indent=2)
         await outfile.write(content)
+    file_cache.invalidate(filepath)
+
+@error_handler.if_errors
+async def load_json_cached(filepath):
+    """load_json for small, frequently re-read files (todo.json etc.); only re-parses when the file changes"""
+    return file_cache.load_json(filepath)
 
 @error_handler.if_errors
 def load_jsonl(file_path):
@@ -131,9 +454,8 @@ async def save_jsonl(filename, data):
         
 @error_handler.if_errors
 def holiday_check():
-    # Open the calendar.json file and load its contents
-    with open('calendar.json', 'r') as f:
-        calendar_data = json.load(f)
+    # Load calendar.json (cached until the file changes)
+    calendar_data = file_cache.load_json('calendar.json')
 
     # Get the current date in the 'YYYY-MM-DD' format
     current_date = datetime.now().strftime("%Y-%m-%d")
@@ -232,10 +554,6 @@ def generate_random_id():
 @error_handler.if_errors
 async def save_to_daily_log_with_label(text, speaker):
     """Async version of save_to_daily_log_with_label"""
-    # Check if the 'Logs' folder exists; if not, create it
-    if not os.path.exists('Logs'):
-        os.makedirs('Logs')
-    
     # Generate the file name based on the current date
     current_date = datetime.now().strftime('%Y-%m-%d')
     file_name = f'Logs/{current_date}.txt'
@@ -246,22 +564,22 @@ async def save_to_daily_log_with_label(text, speaker):
     # Create the labeled message
     labeled_message = f"{timestamp} {speaker}: {text}"
     
-    # Append the new message to the file (this will create the file if it doesn't exist)
-    async with aiofiles.open(file_name, 'a') as log_file:
-        await log_file.write(labeled_message + '\n')
+    # Queue the line for the Logs/ writer thread (it creates the folder and file as needed)
+    log_writer.append(file_name, labeled_message + '\n')
 
 from datetime import datetime, timedelta
 
 @error_handler.if_errors
 async def save_to_fleeting_convo_history(text, speaker, username=None):
     """Async version of save_to_fleeting_convo_history with user namespace support"""
-    # Check if the 'Fleeting' folder exists; if not, create it
-    if not os.path.exists('Fleeting'):
-        os.makedirs('Fleeting')
+    labeled_message_fleeting, timestamp = await log_fleeting_message(text, speaker)
 
-    if not os.path.exists('Logs'):
-        os.makedirs('Logs')
-    
+    # Append the new message to the user's Redis history list and save the
+    # timestamp as last_message in the same round trip
+    await append_conversation_history(labeled_message_fleeting, username, timestamp)
+
+async def log_fleeting_message(text, speaker):
+    """Write a message to the day's log file; returns (history line, timestamp) for the Redis side"""
     # Generate the file name based on the current date
     current_date = datetime.now().strftime('%Y-%m-%d')
     timestamp = datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')
@@ -272,20 +590,15 @@ async def save_to_fleeting_convo_history(text, speaker, username=None):
     labeled_message_logs = f"{timestamp} {speaker}: {text}"
 
     # Add to running log of the day
-    async with aiofiles.open(log_location, 'a') as log_file:
-        await log_file.write(labeled_message_logs + '\n')
+    log_writer.append(log_location, labeled_message_logs + '\n')
 
-    # Pull conversation history from Redis and append the new message
-    # Use user namespace if username is provided
-    conversation_history = await redis_load("conversation_history", username)
-    if conversation_history:
-        updated_history = conversation_history + labeled_message_fleeting + '\n'
-    else:
-        updated_history = labeled_message_fleeting + '\n'
-    await redis_save("conversation_history", updated_history, username)
-    
-    # Save timestamp as last_message in Redis with user namespace
-    await redis_save("last_message", timestamp, username)
+    return labeled_message_fleeting, timestamp
+
+@error_handler.if_errors
+async def queue_fleeting_convo_history(writer, text, speaker):
+    """Like save_to_fleeting_convo_history, but queues the Redis append on a TurnStateWriter"""
+    labeled_message_fleeting, timestamp = await log_fleeting_message(text, speaker)
+    writer.append_history(labeled_message_fleeting, timestamp)
 
 
 @error_handler.if_errors
@@ -307,9 +620,8 @@ def save_to_lh_convo_history(text, speaker):
     # Create the labeled message
     labeled_message = f"{speaker}: {text}"
     
-    # Append the new message to the file (this will create the file if it doesn't exist)
-    with open(file_name, 'a') as convo_file:
-        convo_file.write(labeled_message + '\n')
+    # Queue the new message for the Fleeting/ writer thread
+    log_writer.append(file_name, labeled_message + '\n')
 
     # Save the timestamp to the 'last_message' file
     with open('Fleeting/last_lh_message.txt', 'w') as last_message_file:
@@ -388,15 +700,15 @@ async def universal_saver(file, contents):
     # Append the new message to the file (this will create the file if it doesn't exist)
     async with aiofiles.open(file_name, 'w') as chosen_file:
         await chosen_file.write(contents)
+    file_cache.invalidate(file_name)
     statement = f"//File `{file}` updated with the following contents: {contents}"
     return statement
 
 @error_handler.if_errors
 async def universal_loader(file):
-    """Async version of universal_loader"""
+    """Async version of universal_loader (served from file_cache while the file is unchanged)"""
     try:
-        async with aiofiles.open(f"Fleeting/{file}.txt", 'r') as f:
-            string = await f.read()
+        string = file_cache.load_text(f"Fleeting/{file}.txt", encoding=None)
     except FileNotFoundError:
         # If the file does not exist, create an empty file
         async with aiofiles.open(f"Fleeting/{file}.txt", 'w') as f:
@@ -451,13 +763,14 @@ def save_held_thought(thought):
         thought_file.write(thought)
 
 @error_handler.if_errors
+@turn_context.memoize
 async def lite_variable_set(history_tokens=-2400, soc_tokens=-1600, persona="Rhoda", conversation_type="Maggie"):
     conversation_history = None
     long_term_memories = None
     stream_of_consciousness = None
     stream_of_consciousness = await soc_today(persona)
     stream_of_consciousness = stream_of_consciousness[soc_tokens:]
-    conversation_history = await fleeting(conversation_type)
+    conversation_history = await fleeting(conversation_type, max_chars=abs(history_tokens))
     conversation_history = conversation_history[history_tokens:]
     if conversation_history:
         long_term_memories = await ltm.memory_search(conversation_history)
@@ -481,7 +794,7 @@ async def standard_variable_set(history_tokens=-6400, soc_tokens=-5400, persona=
     # Run independent operations in parallel for faster response
     constant_entries_task = knowledgebase_search.constant_entries(persona)
     soc_task = soc_today(persona)
-    conversation_history_task = fleeting(conversation_type)
+    conversation_history_task = fleeting(conversation_type, max_chars=abs(history_tokens))
     
     # Wait for all to complete in parallel
     constant_entries, soc_full, conversation_history_full = await asyncio.gather(
@@ -515,12 +828,14 @@ async def standard_variable_set(history_tokens=-6400, soc_tokens=-5400, persona=
     return constant_entries, conversation_history, long_term_memories, stream_of_consciousness, kb_entries_text
 
 @error_handler.if_errors
-async def fleeting(conversation_type="Maggie"):
+@turn_context.memoize(widen='max_chars')
+async def fleeting(conversation_type="Maggie", max_chars=None):
     """Async version of fleeting with Redis and user namespace support"""
     print(f"Conversation type in loaders.fleeting: {conversation_type}")
     
-    # First, try to get conversation history from Redis (user-namespaced)
-    redis_conversation_history = await redis_load("conversation_history", conversation_type)
+    # First, try to get conversation history from Redis (user-namespaced);
+    # max_chars limits the read to the tail of the history list
+    redis_conversation_history = await load_conversation_history(conversation_type, max_chars)
     
     if redis_conversation_history:
         # Found conversation history in Redis
@@ -554,10 +869,7 @@ async def fleeting(conversation_type="Maggie"):
 @error_handler.if_errors
 async def save_to_soc(soc_addition, persona="Rhoda"):
     """Async version of save_to_soc"""
-    # Check if the 'SOC' folder exists; if not, create it
     path=f"{persona}_SOC"
-    if not os.path.exists(f'{path}'):
-        os.makedirs(f'{path}')
     
     # Generate the file name based on the current date
     current_date = datetime.now().strftime('%Y-%m-%d')
@@ -567,13 +879,101 @@ async def save_to_soc(soc_addition, persona="Rhoda"):
     # Create the labeled message
     addition = f"{soc_addition}"
 
-    # Append the new message to the file (this will create the file if it doesn't exist)
-    async with aiofiles.open(file_name, 'a', encoding='utf-8') as stream_of_consciousness:
-        await stream_of_consciousness.write(addition + '\n')
-
-@error_handler.if_errors
+    # Queue the new thought for the SOC writer thread (it creates the folder and file as needed)
+    log_writer.append(file_name, addition + '\n')
+    invalidate_soc_cache(file_name)
+
+# soc_today returns at most this many characters of de-duplicated stream of consciousness
+SOC_TAIL_CHARS = 3000
+# On a cold start only the last SOC_TAIL_BYTES of the day's file are read and de-duplicated
+SOC_TAIL_BYTES = int(os.getenv('SOC_TAIL_BYTES', 262144))
+
+# Incremental soc_today state per SOC file path:
+# offset (bytes consumed), pending (text after the last sentence break), seen (normalized
+# sentences), sentences/chars (unique processed sentences covering the tail), text/stat (rendered cache)
+soc_cache = {}
+soc_cache_lock = threading.Lock()
+
+def invalidate_soc_cache(full_path):
+    """Drop the rendered tail for a SOC file so the next soc_today() picks up the new bytes"""
+    with soc_cache_lock:
+        state = soc_cache.get(full_path)
+        if state:
+            state['stat'] = None
+
+def consume_soc_text(state, text):
+    """Feed newly appended SOC text through the same sentence de-duplication as post_processing.remove_repeats"""
+    pieces = post_processing.SENTENCE_SPLIT.split(state['pending'] + text)
+    state['pending'] = pieces.pop()
+    for sentence in pieces:
+        normalized_sentence = sentence.strip()
+        if normalized_sentence in state['seen']:
+            continue
+        state['seen'].add(normalized_sentence)
+        processed_sentence = post_processing.limit_clause_repetitions(normalized_sentence)
+        state['sentences'].append(processed_sentence)
+        state['chars'] += len(processed_sentence) + 1
+    # Only the last SOC_TAIL_CHARS characters are ever returned, so older sentences can go
+    while state['sentences'] and state['chars'] - len(state['sentences'][0]) - 1 >= SOC_TAIL_CHARS:
+        state['chars'] -= len(state['sentences'].popleft()) + 1
+
+def read_soc_tail(full_path):
+    """Return the de-duplicated last SOC_TAIL_CHARS of a SOC file, reading only bytes appended since the last call"""
+    log_writer.flush(full_path)
+    try:
+        stat = os.stat(full_path)
+    except FileNotFoundError:
+        return None
+    file_stat = (stat.st_size, stat.st_mtime_ns)
+    with soc_cache_lock:
+        state = soc_cache.get(full_path)
+        if state and state['stat'] == file_stat:
+            return state['text']
+        if state is None or stat.st_size < state['offset']:
+            # New day's file (or it was truncated): forget files that have rolled over, then start at the tail
+            for stale_path in [p for p in soc_cache if os.path.dirname(p) == os.path.dirname(full_path)]:
+                del soc_cache[stale_path]
+            state = {'offset': max(0, stat.st_size - SOC_TAIL_BYTES), 'pending': '', 'seen': set(),
+                     'sentences': deque(), 'chars': 0, 'text': '', 'stat': None}
+            soc_cache[full_path] = state
+            skip_partial_line = state['offset'] > 0
+        else:
+            skip_partial_line = False
+
+        with open(full_path, 'rb') as f:
+            f.seek(state['offset'])
+            new_bytes = f.read()
+        if skip_partial_line:
+            # We landed mid-line; start from the next full line
+            first_newline = new_bytes.find(b'\n')
+            skip = first_newline + 1 if first_newline != -1 else len(new_bytes)
+            state['offset'] += skip
+            new_bytes = new_bytes[skip:]
+        # Only consume whole lines so a half-written append (or a split UTF-8 character) waits for the next call
+        last_newline = new_bytes.rfind(b'\n')
+        if last_newline != -1:
+            complete = new_bytes[:last_newline + 1]
+            state['offset'] += len(complete)
+            text = complete.decode('utf-8', errors='replace')
+            if not state['sentences'] and not state['pending']:
+                text = text.lstrip()
+            consume_soc_text(state, text)
+
+        unique_sentences = list(state['sentences'])
+        pending = state['pending'].strip()
+        if pending not in state['seen']:
+            unique_sentences.append(post_processing.limit_clause_repetitions(pending))
+        state['text'] = ' '.join(unique_sentences)[-SOC_TAIL_CHARS:]
+        state['stat'] = file_stat
+        return state['text']
+
+@error_handler.if_errors
+@turn_context.memoize
 async def soc_today(persona="Rhoda"):
-    """Async version of soc_today"""
+    """
+    Return the last SOC_TAIL_CHARS characters of today's de-duplicated stream of consciousness.
+    Reads from the end of the file and only processes bytes appended since the previous call.
+    """
     path = f"{persona}_SOC"  # Default path
 
     if not os.path.exists(f'{path}'):
@@ -585,23 +985,18 @@ async def soc_today(persona="Rhoda"):
 
     full_path = f"{path}/{file_name_base}"
 
-    try:
-        async with aiofiles.open(full_path, 'r', encoding='utf-8') as f:
-            stream_of_consciousness_full = await f.read()
-    except FileNotFoundError:
+    stream_of_consciousness = await asyncio.to_thread(read_soc_tail, full_path)
+    if stream_of_consciousness is None:
         try:
             today, yesterday_date = journal_date()
-            async with aiofiles.open(f"{path}/{yesterday_date}_consciousness.txt", 'r', encoding='utf-8') as f:
-                stream_of_consciousness_full = await f.read()
-        except:
-            stream_of_consciousness_full = ""
-
-    stream_of_consciousness = post_processing.remove_repeats(stream_of_consciousness_full)
-    stream_of_consciousness = stream_of_consciousness[-3000:]
-    return stream_of_consciousness
+            stream_of_consciousness = await asyncio.to_thread(read_soc_tail, f"{path}/{yesterday_date}_consciousness.txt")
+        except Exception:
+            stream_of_consciousness = None
+    return stream_of_consciousness or ""
 
 @error_handler.if_errors
 def full_soc(today, person="Rhoda"):
+    log_writer.flush()
     if person=="Rhoda":
         with open(os.path.join(os.getenv('SOC_PATH', 'Rhoda_SOC'), f"{today}.txt"), 'r', encoding='utf-8') as f:
             stream_of_consciousness_full = f.read()
@@ -834,6 +1229,7 @@ def remove_timestamps(text):
 @error_handler.if_errors
 async def log(today):
     """Async version of log"""
+    await asyncio.to_thread(log_writer.flush, f"Logs/{today}.txt")
     async with aiofiles.open(f"Logs/{today}.txt", 'r') as f:
         log_content = await f.read()
 
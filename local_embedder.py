@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+In-process bge-m3 embeddings on CPU, as an alternative to the embedding server.
+
+Selected with EMBEDDING_BACKEND=local (embedding_client falls back to the server if
+the model can't be loaded). Vectors match embedding.py's /pureembed: the normalized
+CLS vector, truncated to 768 dimensions and normalized again, so they can be searched
+against and added to the existing indexes.
+
+Two runtimes are supported:
+  - ONNX Runtime, if LOCAL_EMBEDDING_ONNX points at an exported (ideally int8) model;
+    create one with `python local_embedder.py export --quantize`
+  - PyTorch with dynamic int8 quantization of the Linear layers otherwise
+Encoding runs on a small thread pool (both runtimes release the GIL), so it never
+blocks the event loop.
+"""
+import os
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'http').lower()
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv('LOCAL_EMBEDDING_MODEL_PATH', os.getenv('EMBEDDING_MODEL_PATH', 'BAAI/bge-m3'))
+LOCAL_EMBEDDING_ONNX = os.getenv('LOCAL_EMBEDDING_ONNX', '')
+LOCAL_EMBEDDING_THREADS = int(os.getenv('LOCAL_EMBEDDING_THREADS', 2))
+# Same limit the server uses; lower it to trade accuracy on very long texts for speed
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.getenv('LOCAL_EMBEDDING_MAX_LENGTH', 8192))
+TEXT_EMBEDDING_DIM = 768
+
+load_lock = threading.Lock()
+encoder = None
+load_failed = False
+executor = ThreadPoolExecutor(max_workers=LOCAL_EMBEDDING_THREADS, thread_name_prefix="local-embedder")
+
+def normalize(vectors):
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def finish(cls_vectors):
+    """CLS vectors -> the server's output: normalize, truncate to TEXT_EMBEDDING_DIM, normalize"""
+    return normalize(normalize(cls_vectors.astype('float32'))[:, :TEXT_EMBEDDING_DIM]).astype('float32')
+
+class OnnxEncoder:
+    def __init__(self, onnx_path, tokenizer):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // LOCAL_EMBEDDING_THREADS)
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.tokenizer = tokenizer
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=LOCAL_EMBEDDING_MAX_LENGTH, return_tensors='np')
+        feeds = {name: tokens[name].astype('int64') for name in ('input_ids', 'attention_mask') if name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+        return finish(hidden[:, 0])
+
+class TorchEncoder:
+    def __init__(self, model_path, tokenizer):
+        import torch
+        from transformers import AutoModel
+        self.torch = torch
+        model = AutoModel.from_pretrained(model_path).eval()
+        self.model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.tokenizer = tokenizer
+
+    def encode(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=LOCAL_EMBEDDING_MAX_LENGTH, return_tensors='pt')
+        with self.torch.inference_mode():
+            hidden = self.model(**tokens).last_hidden_state
+        return finish(hidden[:, 0].float().numpy())
+
+def get_encoder():
+    """Load the model on first use; None if it can't be loaded (callers fall back to the server)"""
+    global encoder, load_failed
+    if encoder is not None or load_failed:
+        return encoder
+    with load_lock:
+        if encoder is None and not load_failed:
+            try:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(LOCAL_EMBEDDING_MODEL_PATH)
+                if LOCAL_EMBEDDING_ONNX and os.path.exists(LOCAL_EMBEDDING_ONNX):
+                    encoder = OnnxEncoder(LOCAL_EMBEDDING_ONNX, tokenizer)
+                else:
+                    encoder = TorchEncoder(LOCAL_EMBEDDING_MODEL_PATH, tokenizer)
+                print(f"++CONSOLE: Local embedding model loaded ({type(encoder).__name__})")
+            except Exception as e:
+                load_failed = True
+                print(f"++CONSOLE: Local embedding model unavailable, using the embedding server: {e}")
+    return encoder
+
+def enabled():
+    return EMBEDDING_BACKEND == 'local' and not load_failed
+
+def encode(texts):
+    """Synchronous encode; (n, 768) float32 array, or None if the model isn't available"""
+    model = get_encoder()
+    if model is None:
+        return None
+    return model.encode(list(texts))
+
+async def embed_texts(texts):
+    """Encode on the worker pool; (n, 768) float32 array, or None if the model isn't available"""
+    return await asyncio.get_running_loop().run_in_executor(executor, encode, list(texts))
+
+def export_onnx(output_dir, quantize=True):
+    """Export the model to ONNX (last_hidden_state output), optionally with dynamic int8 weights"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(LOCAL_EMBEDDING_MODEL_PATH)
+    model = AutoModel.from_pretrained(LOCAL_EMBEDDING_MODEL_PATH).eval()
+    sample = tokenizer(["Rhoda remembers."], return_tensors='pt')
+    fp32_path = os.path.join(output_dir, 'model.onnx')
+    torch.onnx.export(
+        model, (sample['input_ids'], sample['attention_mask']), fp32_path,
+        input_names=['input_ids', 'attention_mask'], output_names=['last_hidden_state'],
+        dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'}, 'attention_mask': {0: 'batch', 1: 'sequence'},
+                      'last_hidden_state': {0: 'batch', 1: 'sequence'}},
+        opset_version=17,
+    )
+    if not quantize:
+        return fp32_path
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    int8_path = os.path.join(output_dir, 'model_int8.onnx')
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Local CPU embedding backend tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="Export the model to ONNX")
+    export_parser.add_argument('--output', default=os.path.join('Models', 'bge-m3-onnx'))
+    export_parser.add_argument('--quantize', action='store_true', help="Also write a dynamic int8 copy")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        path = export_onnx(args.output, args.quantize)
+        print(f"Exported {path}; set LOCAL_EMBEDDING_ONNX={path} and EMBEDDING_BACKEND=local to use it")
+
+if __name__ == "__main__":
+    main()
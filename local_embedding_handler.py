@@ -10,6 +10,8 @@ import torch
 import torch.nn.functional as F
 import logging
 import traceback
+import memory_store
+import index_manager
 
 # Local index path for Rhoda's memories
 INDEX_PATH = 'Memory/conversational_memory.index'
@@ -39,51 +41,33 @@ def get_embedding_from_server(text, unique_id):
     # Return the embeddings instead of adding to index
     return {'embedding': embeddings.tolist(), 'uuid': unique_id}
 
-def add_vectors_to_index(index, embeddings, uuid, index_path):
-    """
-    Adds vectors and optional metadata to a Faiss index.
-    (Copied from the embedding app as requested)
-    """
-    logger = logging.getLogger(__name__)
-    
-    print(f"//Index from add_vectors_to_index: {index}")
-    print(f"//Embeddings from add_vectors_to_index: {embeddings}")
-    print(f"//Metadata from add_vectors_to_index: {uuid}")
-    
-    try:
-        if not isinstance(uuid, np.ndarray):
-            uuid = np.array([uuid])
-        index.add_with_ids(embeddings, uuid)  # Metadata could be your JSON IDs
-    except Exception as e:
-        logger.error(f"Error at add_with_ids: {e}", exc_info=True)
-        traceback.print_exc()
-        raise e
-    
-    try:    
-        faiss.write_index(index, index_path)
-    except Exception as e:
-        logger.error(f"Error at write_index: {e}", exc_info=True)
-        traceback.print_exc()
-        raise e
+# Indexes whose speaker/time metadata has been checked against the memory store this process
+metadata_checked = set()
 
 def load_faiss_index(index_path):
     """
     Load existing FAISS index or create a new one
+    (the process-wide resident copy, recovered from its snapshot plus WAL)
     """
-    import os
-    
-    if os.path.exists(index_path):
-        # Load existing index
-        index = faiss.read_index(index_path)
-        print(f"Loaded existing index from {index_path}")
-    else:
-        # Create new index
-        text_embedding_dim = 768
-        index = faiss.IndexFlatL2(text_embedding_dim)
-        index = faiss.IndexIDMap(index)
-        print(f"Created new index at {index_path}")
-    
-    return index
+    managed = index_manager.get_index(index_path)
+    if index_path == INDEX_PATH and index_path not in metadata_checked:
+        metadata_checked.add(index_path)
+        if len(managed.metadata) < managed.ntotal:
+            backfill_metadata(managed)
+    return managed
+
+def backfill_metadata(managed):
+    """Fill speaker/time metadata for vectors indexed before it was kept, from the memory store's columns"""
+    missing = [record_id for record_id in managed.ids().tolist() if record_id not in managed.metadata.rows]
+    filled = 0
+    for start in range(0, len(missing), memory_store.BATCH_SIZE):
+        batch = missing[start:start + memory_store.BATCH_SIZE]
+        columns = memory_store.get_columns(batch)
+        known = [record_id for record_id in batch if str(record_id) in columns]
+        if known:
+            managed.set_metadata(known, [dict(columns[str(record_id)], source='conversation') for record_id in known])
+            filled += len(known)
+    print(f"++CONSOLE: Backfilled metadata for {filled} of {len(missing)} vectors in {managed.path}")
 
 def store_embedding_locally(embedding_data):
     """
@@ -111,11 +95,8 @@ def store_embedding_locally(embedding_data):
         print(f"Warning: Non-numeric UUID {uuid_str} cannot be stored in FAISS index")
         return False
     
-    # Load the local index
-    index = load_faiss_index(INDEX_PATH)
-    
-    # Add the embedding to the local index
-    add_vectors_to_index(index, embeddings, uuid, INDEX_PATH)
+    # Add the embedding to the resident index (logged to its WAL, snapshotted in the background)
+    load_faiss_index(INDEX_PATH).add([uuid], embeddings)
     
     print(f"Stored embedding for UUID {uuid} in local index")
     return True
@@ -149,27 +130,22 @@ def search_local_index(embedding_data, k=5):
         # If it's [[val], [val], ...] reshape to [1, 768]
         query_vector = query_vector.flatten().reshape(1, -1)
     
-    # Load the local index
+    # Use the resident local index
     index = load_faiss_index(INDEX_PATH)
-    print(f'//Index: {index}')
     
     # Search the index
     distances, uuids = search_index(index, query_vector, k)
     print(f"//Distances: {distances}\n//uuids: {uuids}")
     
-    # Fetch the JSON data for each UUID
+    # Fetch the records for all matched UUIDs in one batched lookup, keeping search order
+    matched = [str(uuid) for uuid in uuids[0] if uuid != -1]  # -1 indicates no match found
+    records = memory_store.get_records(matched)
     results = []
-    for uuid in uuids[0]:  # uuids is a 2D array, we need the first row
-        if uuid == -1:
-            # -1 indicates no match found
-            continue
-        json_path = f'Memory/JSONs/{uuid}.json'  # Use cross-platform path format
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as json_file:
-                data = json.load(json_file)
-                results.append(data)
+    for uuid in matched:
+        if uuid in records:
+            results.append(records[uuid])
         else:
-            print(f"JSON for UUID {uuid} not found.")
+            print(f"Memory record for UUID {uuid} not found.")
     
     return results if results else []
 
@@ -0,0 +1,165 @@
+"""
+Buffered, single-writer appends for the Logs/, SOC and Fleeting text files.
+
+Each target directory gets one background thread that drains a queue of
+(path, text) lines, writes everything pending for a file in one append and
+fsyncs on an interval. Callers return as soon as the line is queued. Because
+every line carries its own path (e.g. Logs/<date>.txt), daily rotation falls
+out naturally: the writer closes the old file the first time a line for the
+new day's file arrives.
+
+Readers of these files should call flush(path) first so they see every line
+queued so far. Everything still queued is written and fsynced at interpreter exit.
+
+Threads rather than asyncio tasks: Flask runs each async view on its own
+short-lived event loop, so a task would die with the request that started it.
+"""
+import os
+import time
+import queue
+import atexit
+import threading
+
+# Seconds between fsyncs while lines keep arriving
+LOG_WRITER_FSYNC_INTERVAL = float(os.getenv('LOG_WRITER_FSYNC_INTERVAL', 1.0))
+# Upper bound on lines gathered into one batch
+LOG_WRITER_BATCH_LINES = int(os.getenv('LOG_WRITER_BATCH_LINES', 500))
+# How long flush() waits for the writer before giving up
+LOG_WRITER_FLUSH_TIMEOUT = float(os.getenv('LOG_WRITER_FLUSH_TIMEOUT', 5.0))
+
+writers = {}
+writers_lock = threading.Lock()
+
+class FlushMarker:
+    """Queued behind pending lines; set once they have been written"""
+    def __init__(self):
+        self.done = threading.Event()
+
+class LogWriter(threading.Thread):
+    def __init__(self, target):
+        super().__init__(name=f"log-writer-{target}", daemon=True)
+        self.target = target
+        self.lines = queue.Queue()
+        self.files = {}
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+        self.stopping = False
+
+    def open_file(self, path):
+        handle = self.files.get(path)
+        if handle is None:
+            # A line for a new file (usually the next day's) closes the previous one
+            for old_path in list(self.files):
+                self.close_file(old_path)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handle = open(path, 'a', encoding='utf-8')
+            self.files[path] = handle
+        return handle
+
+    def close_file(self, path):
+        handle = self.files.pop(path)
+        try:
+            handle.flush()
+            os.fsync(handle.fileno())
+        finally:
+            handle.close()
+
+    def fsync_all(self):
+        for handle in self.files.values():
+            handle.flush()
+            os.fsync(handle.fileno())
+        self.last_fsync = time.monotonic()
+        self.dirty = False
+
+    def write_batch(self, batch):
+        # Group consecutive lines per file so each file gets one write() call
+        pending_path, pending_text = None, []
+        for path, text in batch:
+            if path != pending_path and pending_text:
+                self.open_file(pending_path).write(''.join(pending_text))
+                pending_text = []
+            pending_path = path
+            pending_text.append(text)
+        if pending_text:
+            self.open_file(pending_path).write(''.join(pending_text))
+        for handle in self.files.values():
+            handle.flush()
+        self.dirty = True
+
+    def run(self):
+        while True:
+            try:
+                item = self.lines.get(timeout=LOG_WRITER_FSYNC_INTERVAL)
+            except queue.Empty:
+                item = None
+            batch, markers = [], []
+            while item is not None:
+                if isinstance(item, FlushMarker):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= LOG_WRITER_BATCH_LINES:
+                    break
+                try:
+                    item = self.lines.get_nowait()
+                except queue.Empty:
+                    item = None
+            try:
+                if batch:
+                    self.write_batch(batch)
+                if self.dirty and (self.stopping or time.monotonic() - self.last_fsync >= LOG_WRITER_FSYNC_INTERVAL):
+                    self.fsync_all()
+            except Exception as e:
+                print(f"++CONSOLE: Log writer for {self.target} failed to write {len(batch)} lines: {e}")
+            for marker in markers:
+                marker.done.set()
+            if self.stopping and self.lines.empty():
+                for path in list(self.files):
+                    self.close_file(path)
+                return
+
+def get_writer(path):
+    target = os.path.dirname(path) or '.'
+    writer = writers.get(target)
+    if writer is None:
+        with writers_lock:
+            writer = writers.get(target)
+            if writer is None:
+                writer = LogWriter(target)
+                writer.start()
+                writers[target] = writer
+    return writer
+
+def append(path, text):
+    """Queue text (include the trailing newline) for appending to path; returns immediately"""
+    get_writer(path).lines.put((path, text))
+
+def flush(path=None, timeout=LOG_WRITER_FLUSH_TIMEOUT):
+    """Block until every line queued so far (for path's directory, or everywhere) has been written"""
+    if path is not None:
+        target_writers = [writers.get(os.path.dirname(path) or '.')]
+    else:
+        target_writers = list(writers.values())
+    markers = []
+    for writer in target_writers:
+        if writer is not None and writer.is_alive():
+            marker = FlushMarker()
+            writer.lines.put(marker)
+            markers.append(marker)
+    for marker in markers:
+        marker.done.wait(timeout)
+
+def close_all():
+    """Write and fsync everything still queued, then stop the writers"""
+    with writers_lock:
+        active = list(writers.values())
+        writers.clear()
+    for writer in active:
+        writer.stopping = True
+        writer.lines.put(FlushMarker())
+    for writer in active:
+        writer.join(LOG_WRITER_FLUSH_TIMEOUT)
+
+atexit.register(close_all)
@@ -1,8 +1,6 @@
 #JMJ#
-import requests
 import json
 import asyncio
-import aiohttp
 import os
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
@@ -10,165 +8,144 @@ import error_handler
 import action_logger
 import loaders
 import local_embedding_handler
+import embedding_client
+import memory_store
+import index_manager
+import turn_context
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+SUMMARY_INDEX_PATH = 'Memory/summary_memory.index'
+# Local indexes multi_search can fan out to
+MEMORY_INDICES = {
+    'conversation': local_embedding_handler.INDEX_PATH,
+    'summary': SUMMARY_INDEX_PATH,
+}
+# Seconds allowed for the embed plus every index search in multi_search
+MULTI_SEARCH_BUDGET = float(os.getenv('MULTI_SEARCH_BUDGET', 8))
+
 @error_handler.if_errors
-async def search(text):
-    """Async version of search - gets embedding from server, searches locally"""
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/pureembed"
-    data = {'text': text, 'uuid': 'search_query'}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data) as response:
-            print(response)
-            if response.status == 200:
-                # Get embedding from server
-                embedding_data = await response.json()
-                # Search local index
-                results = local_embedding_handler.search_local_index(embedding_data, k=5)
-                return results
-            else:
-                error_text = await response.text()
-                print(f"Error: {error_text}")
-                return None
+async def search(text, speaker=None, recency_weight=0.0):
+    """Async version of search - gets embedding from server, searches locally (optionally only one speaker's messages)"""
+    hits = await multi_search(text, indices=('conversation',), k=5, speaker=speaker, recency_weight=recency_weight)
+    if hits is None:
+        return None
+    return [hit['record'] for hit in hits if hit['record']]
 
 @error_handler.if_errors
-async def search_mags_only(text):
-    """Async version of search_mags_only - gets embedding from server, searches locally"""
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/pureembed"
-    data = {'text': text, 'uuid': 'search_query'}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data) as response:
-            print(response)
-            if response.status == 200:
-                # Get embedding from server
-                embedding_data = await response.json()
-                # Search local index (same as regular search for Rhoda)
-                results = local_embedding_handler.search_local_index(embedding_data, k=5)
-                return results
-            else:
-                error_text = await response.text()
-                print(f"Error: {error_text}")
-                return None
+async def search_mags_only(text, username="Maggie"):
+    """Async version of search_mags_only - only messages the user said"""
+    return await search(text, speaker=username)
+
+def search_one_index(source, query_vector, k, speaker=None, recency_weight=0.0):
+    """Search one local index; conversation hits carry their memory record"""
+    path = MEMORY_INDICES[source]
+    if not index_manager.index_exists(path):
+        return []
+    index = local_embedding_handler.load_faiss_index(path)
+    if index.ntotal == 0:
+        return []
+    # Only conversation vectors have a speaker
+    hits = index.search_filtered(query_vector, k, speaker=speaker if source == 'conversation' else None,
+                                 recency_weight=recency_weight)
+    records = memory_store.get_records([hit['id'] for hit in hits]) if source == 'conversation' else {}
+    for hit in hits:
+        hit['source'] = source
+        hit['record'] = records.get(hit['id'])
+    return hits
 
 @error_handler.if_errors
-def testsearch(text):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/testsearch"
-    data = {'text': text}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-        return result
-    else:
-        print(response.json())
+async def multi_search(query, indices=('conversation', 'summary'), k=5, speaker=None, recency_weight=0.0):
+    """
+    Embed the query once and search every requested local index in parallel.
+    Returns one list of source-tagged hits ({'source', 'id', 'distance', 'similarity', 'score',
+    'speaker', 'time', 'record'}) ordered by score: cosine similarity plus the optional recency
+    bonus. speaker limits conversation hits to one speaker inside the index search. Indexes that
+    don't finish within MULTI_SEARCH_BUDGET are left out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MULTI_SEARCH_BUDGET
+    try:
+        embedding_data = await asyncio.wait_for(embedding_client.client.embed(query), MULTI_SEARCH_BUDGET)
+    except asyncio.TimeoutError:
+        print(f"++CONSOLE: multi_search embed timed out for '{query[:50]}'")
+        return []
+    if embedding_data is None:
+        return []
+    query_vector = index_manager.as_vectors(embedding_data['embedding'])
+
+    tasks = [asyncio.ensure_future(asyncio.to_thread(search_one_index, source, query_vector, k, speaker, recency_weight))
+             for source in indices]
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()))
+    for task in pending:
+        task.cancel()
+    if pending:
+        print(f"++CONSOLE: multi_search skipped {len(pending)} index(es) that ran past the {MULTI_SEARCH_BUDGET}s budget")
+
+    results = []
+    for source, task in zip(indices, tasks):
+        if task in done:
+            if task.exception() is not None:
+                print(f"++CONSOLE: multi_search failed on '{source}': {task.exception()}")
+            else:
+                results.extend(task.result())
+    results.sort(key=lambda hit: hit['score'], reverse=True)
+    return results
 
+@error_handler.if_errors
+async def testsearch(text):
+    result = await embedding_client.client.search('testsearch', text)
+    print(result)
+    return result
 
 @error_handler.if_errors
-def notesearch(text):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/notesearch"
-    data = {'text': text}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-        return result
-    else:
-        result = ""
-        return result
+async def notesearch(text):
+    result = await embedding_client.client.search('notesearch', text)
+    print(result)
+    if result is None:
+        return ""
+    return result
 
 @error_handler.if_errors
-def booksearch(text):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/booksearch"
-    data = {'text': text}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-        return result
-    else:
-        print(response.json())
+async def booksearch(text):
+    result = await embedding_client.client.search('booksearch', text)
+    print(result)
+    return result
 
 @error_handler.if_errors
 async def upsert(text, unique_id):
     """Async version of upsert - gets embedding from server, stores locally"""
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/pureembed"
-    data = {'text': text, 'uuid': unique_id}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data) as response:
-            print(response)
-            if response.status == 200:
-                # Get embedding from server
-                embedding_data = await response.json()
-                # Store in local index
-                success = local_embedding_handler.store_embedding_locally(embedding_data)
-                if success:
-                    print(f"Successfully stored embedding for {unique_id}")
-                return success
-            else:
-                error_text = await response.text()
-                print(f"Error: {error_text}")
-                return False
+    embedding_data = await embedding_client.client.embed(text, unique_id)
+    if embedding_data is None:
+        return False
+    # Store in local index
+    success = local_embedding_handler.store_embedding_locally(embedding_data)
+    if success:
+        print(f"Successfully stored embedding for {unique_id}")
+    return success
 
 @error_handler.if_errors
 async def notes_upsert(text, unique_id):
     """Async version of notes_upsert"""
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/notesembed"
-    data = {'text': text, 'uuid': unique_id}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data) as response:
-            print(response)
-            if response.status == 200:
-                result = await response.json()
-                print(result)
-            else:
-                result = ""
-                print(result)
+    result = await embedding_client.client.upsert('notesembed', text, unique_id)
+    print(result if result is not None else "")
 
 @error_handler.if_errors
-def test_upsert(text, unique_id):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/testembed"
-    data = {'text': text, 'uuid': unique_id}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-    else:
-        print(response.json())
+async def test_upsert(text, unique_id):
+    result = await embedding_client.client.upsert('testembed', text, unique_id)
+    print(result)
 
 @error_handler.if_errors
-def book_upsert(text, unique_id):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/bookembed"
-    data = {'text': text, 'uuid': unique_id}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-    else:
-        print(response.json())
+async def book_upsert(text, unique_id):
+    result = await embedding_client.client.upsert('bookembed', text, unique_id)
+    print(result)
 
 @error_handler.if_errors
-def journal_upsert(text, unique_id):
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/journalembed"
-    data = {'journal_entry': text, 'uuid': unique_id}
-    response = requests.post(url, json=data)
-    print(response)
-    if response.status_code == 200:
-        result = json.loads(response.text)
-        print(result)
-    else:
-        print(response.json())
+async def journal_upsert(text, unique_id):
+    result = await embedding_client.client.journal_upsert(text, unique_id)
+    print(result)
 
 @error_handler.if_errors
 def human_readable_time_difference(time_str):
@@ -226,24 +203,25 @@ async def load_mags_messages(results, top_k=3, username="Maggie"):
     # Initialize the return variable
     my_remembered_responses = f"//The last few times {username} said something like that, here's how I responded, and a few reactions to my response. Based on whether I find the reactions desirable or undesirable, I should tailor what I say or generally allow my memory of cause-and-effect to help me in this conversation. If specific events are mentioned, it probably indicates they are in the past and have already happened, so there's no need to mention them again unless they appear in the 'imminent_events' section of my consciousness. This is more for a general idea of what types of communication elicit positive responses. Here are some of her reactions in previous exchanges:\n"
 
+    # Resolve every hit's response, then every response's reaction, in two batched lookups
+    top_messages = ordered[:top_k]
+    chains = await memory_store.resolve_links(top_messages, ('my_response', 'resulting_message_id'))
+
     # Process top_k messages from Maggie
-    for i in ordered[:top_k]:
+    for i, (response_data, username_reaction_data) in zip(top_messages, chains):
         print(f"Processing item: {i}")  # Debug output
         
-        # Check if the response ID exists and load the corresponding JSON
+        # Check if the response ID exists and use the corresponding record
         if 'my_response' in i:
-            response_data = await loaders.load_json(f"Memory/JSONs/{i['my_response']}.json")
             if response_data:
                 print(f"++CONSOLE: Response data: {response_data}")
                 response_time_diff = human_readable_time_difference(response_data['time'])
                 my_remembered_responses += f"//Memory from {response_time_diff}: {response_data['message']}\n"
                 
                 # Collect further reactions if available
-                if 'resulting_message_id' in response_data:
-                    username_reaction_data = await loaders.load_json(f"Memory/JSONs/{response_data['resulting_message_id']}.json")
-                    if username_reaction_data:
-                        username_time_diff = human_readable_time_difference(username_reaction_data['time'])
-                        my_remembered_responses += f"//Response to memory from {response_time_diff}, stated {username_time_diff} and not necessarily specifically relevant to today, but insightful in terms of calibrating tone and mood: {username_reaction_data['message']}\n"
+                if username_reaction_data:
+                    username_time_diff = human_readable_time_difference(username_reaction_data['time'])
+                    my_remembered_responses += f"//Response to memory from {response_time_diff}, stated {username_time_diff} and not necessarily specifically relevant to today, but insightful in terms of calibrating tone and mood: {username_reaction_data['message']}\n"
         else:
             print(f"No 'my_response' key found for item: {i}")
     
@@ -344,6 +322,7 @@ def save_json(filepath, payload):
         json.dump(payload, outfile, ensure_ascii=False, sort_keys=True, indent=2)
 
 @error_handler.if_errors
+@turn_context.memoize
 async def memory_search(query):
     """Async version of memory_search"""
     search_results = await search(query)
@@ -366,26 +345,37 @@ async def journal_search(query):
     print(f"++CONSOLE: BUGTESTING PURPOSES ONLY WITHIN ltm.journal_search: selected variable: `{selected}`")
     return selected
 
+def local_index_path(index_name):
+    """Local index path for a source name ('conversation') or index file name ('conversational_memory'), else None"""
+    if index_name in MEMORY_INDICES:
+        return MEMORY_INDICES[index_name]
+    for path in MEMORY_INDICES.values():
+        if index_name in (path, os.path.basename(path), os.path.splitext(os.path.basename(path))[0]):
+            return path
+    return None
+
 @error_handler.if_errors
 async def delete_vector_by_id(unique_id, index_name):
-    """Async version of delete_vector_by_id"""
-    unique_id = str(unique_id)
-    url = f"{os.getenv('EMBEDDING_SERVICE_URL', 'http://localhost:5001')}/delete"
-    data = {'unique_id': unique_id, 'index_name': index_name}
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data) as response:
-            if response.status == 200:
-                result = await response.json()       
-                print(result)
-                return True
-            else:
-                error_text = await response.text()
-                print(f"Deletion failed with status code: {response.status} and response: {error_text}")  
-                return False
+    """Async version of delete_vector_by_id (local memory indexes are edited in place; others live on the server)"""
+    local_path = local_index_path(index_name)
+    if local_path is not None:
+        # Local index ids are the numeric memory ids; anything else can't be in the index
+        if not str(unique_id).strip().lstrip('-').isdigit():
+            print(f"Not a memory id: {unique_id!r}; nothing removed from {local_path}")
+            return False
+        removed = await asyncio.to_thread(index_manager.get_index(local_path).remove, [int(unique_id)])
+        # Otherwise index_maintenance verify --fix would re-embed the record
+        await asyncio.to_thread(memory_store.set_record_field, str(unique_id).strip(), 'removed', True)
+        print(f"Removed {removed} vector(s) for {unique_id} from {local_path}")
+        return removed > 0
+    result = await embedding_client.client.delete(unique_id, index_name)
+    if result is None:
+        return False
+    print(result)
+    return True
 
 if __name__ == '__main__':
-     results = booksearch("genji")
+     results = asyncio.run(booksearch("genji"))
      print(results)
 #     messages = load_detailed_books(results)
 #     print(messages)
@@ -0,0 +1,295 @@
+"""
+Background ingestion of conversation messages into the local memory index.
+
+Messages are appended to a JSONL spool and queued; one worker thread drains the
+queue in batches (one /pureembed_batch call and one index add per batch) and acks
+each batch in the spool once it's in the index. Anything still unacked when the
+process stops is re-queued on the next start. The queue is bounded, so a stalled
+embedding service slows submitters down instead of piling up tasks.
+
+A batch is retried with backoff MEMORY_INGEST_MAX_ATTEMPTS times, then split in half
+until the entries that keep failing are isolated; those are appended to the
+dead-letter file and acked, so one bad message can't stall the queue.
+index_maintenance.py verify --fix re-queues their records once the cause is fixed.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+from collections import OrderedDict, deque
+import embedding_client
+import local_embedding_handler
+
+MEMORY_INGEST_MAX_PENDING = int(os.getenv('MEMORY_INGEST_MAX_PENDING', 1000))
+MEMORY_INGEST_BATCH = int(os.getenv('MEMORY_INGEST_BATCH', 32))
+# How long the worker waits for more messages to fill a batch
+MEMORY_INGEST_WAIT_MS = float(os.getenv('MEMORY_INGEST_WAIT_MS', 200))
+MEMORY_INGEST_SPOOL = os.getenv('MEMORY_INGEST_SPOOL', os.path.join('Memory', 'ingest_spool.jsonl'))
+# Longest pause between retries while the embedding service is unreachable
+MEMORY_INGEST_RETRY_MAX = float(os.getenv('MEMORY_INGEST_RETRY_MAX', 60))
+# Tries per batch (about two minutes of backoff at the defaults) before it's split up
+MEMORY_INGEST_MAX_ATTEMPTS = int(os.getenv('MEMORY_INGEST_MAX_ATTEMPTS', 8))
+MEMORY_INGEST_DEAD_LETTER = os.getenv('MEMORY_INGEST_DEAD_LETTER', os.path.join('Memory', 'ingest_dead_letter.jsonl'))
+
+class Spool:
+    """Append-only JSONL of queued messages and acks; rewritten down to the unacked entries on load"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+        self.file = None
+
+    def load(self):
+        """Read unacked entries left by a previous run and compact the file to just those"""
+        with self.lock:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # torn last line from a crash
+                        if entry.get('op') == 'ack':
+                            for record_id in entry['ids']:
+                                self.pending.pop(record_id, None)
+                        else:
+                            self.pending[entry['id']] = entry
+            self.rewrite()
+            return list(self.pending.values())
+
+    def rewrite(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.file is not None:
+            self.file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.pending.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def append(self, entry):
+        with self.lock:
+            self.pending[entry['id']] = entry
+            self.write(entry)
+
+    def ack(self, record_ids):
+        with self.lock:
+            for record_id in record_ids:
+                self.pending.pop(record_id, None)
+            if self.pending:
+                self.write({'op': 'ack', 'ids': list(record_ids)})
+            else:
+                # Everything is in the index; start the file over
+                self.file.seek(0)
+                self.file.truncate()
+
+    def oldest_queued_at(self):
+        with self.lock:
+            for entry in self.pending.values():
+                return entry['queued_at']
+        return None
+
+class MemoryIngestor:
+    """Bounded queue plus worker thread that embeds and indexes messages in batches"""
+
+    def __init__(self, spool_path=MEMORY_INGEST_SPOOL, max_pending=MEMORY_INGEST_MAX_PENDING,
+                 batch_size=MEMORY_INGEST_BATCH, wait_ms=MEMORY_INGEST_WAIT_MS,
+                 dead_letter_path=MEMORY_INGEST_DEAD_LETTER):
+        self.spool = Spool(spool_path)
+        self.dead_letter_path = dead_letter_path
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.recovered = deque()
+        self.batch_size = batch_size
+        self.wait_seconds = wait_ms / 1000
+        self.start_lock = threading.Lock()
+        self.thread = None
+        self.metrics_lock = threading.Lock()
+        self.ingested = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_lettered = 0
+        self.backpressure_waits = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+
+    def start(self):
+        """Recover the spool and start the worker (idempotent)"""
+        if self.thread is not None:
+            return
+        with self.start_lock:
+            if self.thread is not None:
+                return
+            entries = self.spool.load()
+            if entries:
+                # A crash between the index add and the ack leaves entries that are already indexed
+                present = {str(record_id) for record_id in local_embedding_handler.load_faiss_index(local_embedding_handler.INDEX_PATH).ids()}
+                already = [entry['id'] for entry in entries if entry['id'] in present]
+                if already:
+                    self.spool.ack(already)
+                self.recovered.extend(entry for entry in entries if entry['id'] not in present)
+                print(f"++CONSOLE: Re-queued {len(self.recovered)} unindexed memories from {self.spool.path}")
+            self.thread = threading.Thread(target=self.run, name="memory-ingest", daemon=True)
+            self.thread.start()
+
+    def enqueue(self, text, unique_id, speaker=None, timestamp=None):
+        """Spool and queue one message; blocks while the queue is full"""
+        self.start()
+        entry = {'id': str(unique_id), 'text': text, 'speaker': speaker, 'time': timestamp, 'queued_at': time.time()}
+        self.spool.append(entry)
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.metrics_lock:
+                self.backpressure_waits += 1
+            print(f"++CONSOLE: Memory ingest queue full ({self.queue.maxsize}); waiting for the embedding worker")
+            self.queue.put(entry)
+
+    async def submit(self, text, unique_id, speaker=None, timestamp=None):
+        """Async enqueue (the spool write and any backpressure wait happen off the event loop)"""
+        await asyncio.to_thread(self.enqueue, text, unique_id, speaker, timestamp)
+
+    def next_entry(self, timeout=None):
+        if self.recovered:
+            return self.recovered.popleft()
+        return self.queue.get(timeout=timeout)
+
+    def collect(self):
+        """Block for one message, then take more until the batch is full or the wait runs out"""
+        batch = [self.next_entry()]
+        deadline = time.monotonic() + self.wait_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self.recovered:
+                break
+            try:
+                batch.append(self.next_entry(timeout=max(remaining, 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            batch = self.collect()
+            self.ingest(loop, batch)
+
+    def ingest(self, loop, batch):
+        """Index one batch (dead-lettering what can't be) and ack it in the spool"""
+        entries = []
+        for entry in batch:
+            try:
+                int(entry['id'])
+                entries.append(entry)
+            except ValueError:
+                print(f"Warning: Non-numeric UUID {entry['id']} cannot be stored in FAISS index")
+        if entries:
+            self.index_entries(loop, entries)
+        self.spool.ack([entry['id'] for entry in batch])
+
+    def index_entries(self, loop, entries):
+        """
+        Embed and index entries, retrying with backoff up to MEMORY_INGEST_MAX_ATTEMPTS times.
+        A batch that still fails is retried in halves; a single entry that still fails is
+        dead-lettered. The index skips ids it already has, so a retry after a partly
+        applied add doesn't duplicate them.
+        """
+        delay = 1.0
+        error = None
+        for attempt in range(MEMORY_INGEST_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(delay)
+                delay = min(delay * 2, MEMORY_INGEST_RETRY_MAX)
+            started = time.perf_counter()
+            try:
+                response = loop.run_until_complete(embedding_client.client.embed_many(
+                    [entry['text'] for entry in entries], [entry['id'] for entry in entries]))
+                if response is None:
+                    error = "no response from the embedding service"
+                else:
+                    index = local_embedding_handler.load_faiss_index(local_embedding_handler.INDEX_PATH)
+                    index.add([int(entry['id']) for entry in entries], response['embeddings'],
+                              metadata=[{'speaker': entry.get('speaker'), 'time': entry.get('time'), 'source': 'conversation'} for entry in entries])
+                    with self.metrics_lock:
+                        self.ingested += len(entries)
+                        self.batches += 1
+                        self.last_batch_size = len(entries)
+                        self.last_batch_seconds = time.perf_counter() - started
+                    print(f"++CONSOLE: Indexed {len(entries)} memories in {self.last_batch_seconds:.2f}s")
+                    return
+            except Exception as e:
+                error = str(e)
+                print(f"++CONSOLE: Memory ingest batch failed: {e}")
+            with self.metrics_lock:
+                self.failures += 1
+
+        if len(entries) > 1:
+            print(f"++CONSOLE: Memory ingest batch of {len(entries)} failed {MEMORY_INGEST_MAX_ATTEMPTS} times; retrying it in halves")
+            middle = len(entries) // 2
+            self.index_entries(loop, entries[:middle])
+            self.index_entries(loop, entries[middle:])
+        else:
+            self.dead_letter(entries[0], error)
+
+    def dead_letter(self, entry, error):
+        """Append an entry that couldn't be indexed, with the last error, to the dead-letter file"""
+        directory = os.path.dirname(self.dead_letter_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(entry, error=error, failed_at=time.time()), ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self.metrics_lock:
+            self.dead_lettered += 1
+        print(f"++CONSOLE: Gave up on memory {entry['id']} after {MEMORY_INGEST_MAX_ATTEMPTS} attempts ({error}); "
+              f"moved it to {self.dead_letter_path}")
+
+    def wait_idle(self, timeout=None, poll=0.5):
+        """Block until every spooled message is in the index (for scripts); False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.spool.pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def metrics(self):
+        oldest = self.spool.oldest_queued_at()
+        with self.metrics_lock:
+            return {
+                'queue_depth': self.queue.qsize() + len(self.recovered),
+                'queue_capacity': self.queue.maxsize,
+                'unacked': len(self.spool.pending),
+                'lag_seconds': time.time() - oldest if oldest else 0.0,
+                'ingested': self.ingested,
+                'batches': self.batches,
+                'mean_batch_size': self.ingested / self.batches if self.batches else 0,
+                'last_batch_size': self.last_batch_size,
+                'last_batch_seconds': self.last_batch_seconds,
+                'failures': self.failures,
+                'dead_lettered': self.dead_lettered,
+                'backpressure_waits': self.backpressure_waits,
+            }
+
+ingestor = MemoryIngestor()
+
+async def submit(text, unique_id, speaker=None, timestamp=None):
+    """Queue a message (with its speaker and ISO time, kept as index metadata) for the long-term memory index"""
+    await ingestor.submit(text, unique_id, speaker, timestamp)
+
+def metrics():
+    return ingestor.metrics()
@@ -0,0 +1,219 @@
+"""
+SQLite-backed store for conversational memory records (one row per utterance).
+
+Replaces the one-file-per-message Memory/JSONs/<id>.json layout. Records are the
+same dicts that used to be written to those files; the id is the FAISS vector id
+from loaders.generate_random_id(). Ids that aren't in the table yet are looked up
+in the old Memory/JSONs directory (and copied in), so the app keeps working
+before, during and after migrate_memory_to_sql.py runs.
+"""
+import os
+import copy
+import json
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+MEMORY_DB_PATH = os.getenv('MEMORY_DB_PATH', os.path.join('Memory', 'memory_records.db'))
+LEGACY_JSON_DIR = os.path.join('Memory', 'JSONs')
+# SQLite's default limit on bound parameters is 999; stay under it for IN (...) lookups
+BATCH_SIZE = 500
+# Recently read/written records kept in memory (turn-to-turn lookups hit the same few ids)
+MEMORY_RECORD_CACHE_SIZE = int(os.getenv('MEMORY_RECORD_CACHE_SIZE', 1024))
+
+store_lock = threading.Lock()
+connection = None
+record_cache = OrderedDict()
+
+def cache_records(items):
+    """Remember (record_id, record) pairs in the LRU; caller holds store_lock"""
+    for record_id, record in items:
+        record_cache[record_id] = record
+        record_cache.move_to_end(record_id)
+    while len(record_cache) > MEMORY_RECORD_CACHE_SIZE:
+        record_cache.popitem(last=False)
+
+def get_connection():
+    """One shared connection (WAL mode) guarded by store_lock; created on first use"""
+    global connection
+    if connection is None:
+        directory = os.path.dirname(MEMORY_DB_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(MEMORY_DB_PATH, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS memory_records (
+                id TEXT PRIMARY KEY,
+                speaker TEXT,
+                time TEXT,
+                data TEXT NOT NULL  -- the full record as JSON
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_memory_speaker_time ON memory_records(speaker, time)')
+        conn.commit()
+        connection = conn
+    return connection
+
+def record_row(record_id, record):
+    return (str(record_id), record.get('speaker'), record.get('time'), json.dumps(record, ensure_ascii=False))
+
+def load_legacy_record(record_id):
+    """Read Memory/JSONs/<id>.json if it exists (compatibility with the old layout)"""
+    json_path = os.path.join(LEGACY_JSON_DIR, f'{record_id}.json')
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError as e:
+        print(f"++CONSOLE: Skipping unreadable legacy memory record {json_path}: {e}")
+        return None
+
+def put_record(record_id, record):
+    """Insert or replace one record"""
+    put_records([(record_id, record)])
+
+def put_records(items):
+    """Insert or replace several (record_id, record) pairs in one transaction"""
+    rows = [record_row(record_id, record) for record_id, record in items]
+    if not rows:
+        return
+    with store_lock:
+        conn = get_connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO memory_records (id, speaker, time, data) VALUES (?, ?, ?, ?)', rows)
+        cache_records((row[0], json.loads(row[3])) for row in rows)
+
+def get_record(record_id):
+    """Return one record as a dict, or None"""
+    return get_records([record_id]).get(str(record_id))
+
+def get_records(record_ids):
+    """
+    Fetch many records at once. Returns {id: record} for every id found; ids are
+    compared as strings, so FAISS int64 ids can be passed directly.
+    """
+    wanted = list(dict.fromkeys(str(record_id) for record_id in record_ids))
+    found = {}
+    with store_lock:
+        for record_id in wanted:
+            if record_id in record_cache:
+                record_cache.move_to_end(record_id)
+                found[record_id] = copy.deepcopy(record_cache[record_id])
+        missing = [record_id for record_id in wanted if record_id not in found]
+        conn = get_connection()
+        fetched = []
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start:start + BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for record_id, data in conn.execute(f'SELECT id, data FROM memory_records WHERE id IN ({placeholders})', batch):
+                fetched.append((record_id, json.loads(data)))
+        cache_records(fetched)
+        for record_id, record in fetched:
+            found[record_id] = copy.deepcopy(record)
+
+    # Anything missing may still be sitting in the old directory; copy it in as we go
+    legacy = []
+    for record_id in wanted:
+        if record_id not in found:
+            record = load_legacy_record(record_id)
+            if record is not None:
+                found[record_id] = record
+                legacy.append((record_id, record))
+    if legacy:
+        put_records(legacy)
+    return found
+
+def set_record_field(record_id, field, value):
+    """
+    Update one top-level field of a stored record in place (e.g. linking
+    resulting_message_id) without rewriting it from Python. Returns False if the record doesn't exist.
+    """
+    record_id = str(record_id)
+    with store_lock:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute(
+                'UPDATE memory_records SET data = json_set(data, ?, json(?)) WHERE id = ?',
+                (f'$.{field}', json.dumps(value), record_id)
+            )
+            if cursor.rowcount:
+                record_cache.pop(record_id, None)
+                return True
+    record = load_legacy_record(record_id)
+    if record is None:
+        return False
+    record[field] = value
+    put_record(record_id, record)
+    return True
+
+async def load_records(record_ids):
+    """Async get_records (runs the lookup off the event loop)"""
+    return await asyncio.to_thread(get_records, record_ids)
+
+async def resolve_links(records, path):
+    """
+    Follow a chain of id fields (e.g. ('my_response', 'resulting_message_id')) from each
+    starting record, one hop at a time. Each hop is a single batched lookup for every
+    id referenced by the previous hop, so k chains of length n cost n lookups, not k*n.
+    Returns one list per starting record holding the record found at each hop (None once a link is missing).
+    """
+    chains = [[] for _ in records]
+    current = list(records)
+    for field in path:
+        ids = [record.get(field) if record else None for record in current]
+        found = await load_records([record_id for record_id in ids if record_id])
+        current = [found.get(str(record_id)) if record_id else None for record_id in ids]
+        for chain, record in zip(chains, current):
+            chain.append(record)
+    return chains
+
+def get_columns(record_ids):
+    """{id: {'speaker', 'time'}} from the indexed columns only (no JSON decoding); ids not stored are left out"""
+    wanted = list(dict.fromkeys(str(record_id) for record_id in record_ids))
+    found = {}
+    with store_lock:
+        conn = get_connection()
+        for start in range(0, len(wanted), BATCH_SIZE):
+            batch = wanted[start:start + BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for record_id, speaker, time in conn.execute(f'SELECT id, speaker, time FROM memory_records WHERE id IN ({placeholders})', batch):
+                found[record_id] = {'speaker': speaker, 'time': time}
+    return found
+
+def iter_records(batch_size=BATCH_SIZE):
+    """Yield (id, record) for every stored record, followed by any legacy files not yet migrated"""
+    last_id = ''
+    while True:
+        with store_lock:
+            rows = get_connection().execute(
+                'SELECT id, data FROM memory_records WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        for record_id, data in rows:
+            yield record_id, json.loads(data)
+        last_id = rows[-1][0]
+
+    if os.path.isdir(LEGACY_JSON_DIR):
+        for filename in os.listdir(LEGACY_JSON_DIR):
+            if not filename.endswith('.json'):
+                continue
+            record_id = filename[:-len('.json')]
+            if record_exists(record_id):
+                continue
+            record = load_legacy_record(record_id)
+            if record is not None:
+                yield record_id, record
+
+def record_exists(record_id):
+    with store_lock:
+        row = get_connection().execute('SELECT 1 FROM memory_records WHERE id = ?', (str(record_id),)).fetchone()
+    return row is not None
+
+def count_records():
+    with store_lock:
+        return get_connection().execute('SELECT COUNT(*) FROM memory_records').fetchone()[0]
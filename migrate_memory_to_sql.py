@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Migration script to move Memory/JSONs/<id>.json records into the memory_store SQLite table.
+Safe to re-run: records already in the table are skipped. The JSON files are left in place
+unless --remove is passed (after a successful run).
+"""
+
+import os
+import sys
+import json
+import memory_store
+
+def migrate_memory_records(batch_size=1000, remove=False):
+    """Copy every legacy JSON record into memory_store in batches"""
+    json_dir = memory_store.LEGACY_JSON_DIR
+    if not os.path.isdir(json_dir):
+        print(f"Legacy memory directory not found: {json_dir}")
+        return 0, 0, 0
+
+    migrated = 0
+    skipped = 0
+    errors = 0
+    batch = []
+    migrated_paths = []
+
+    def flush():
+        nonlocal migrated
+        memory_store.put_records(batch)
+        migrated += len(batch)
+        print(f"Migrated {migrated} records...")
+        batch.clear()
+
+    with os.scandir(json_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            record_id = entry.name[:-len('.json')]
+            if memory_store.record_exists(record_id):
+                skipped += 1
+                migrated_paths.append(entry.path)
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except Exception as e:
+                print(f"Error reading {entry.path}: {e}")
+                errors += 1
+                continue
+            batch.append((record_id, record))
+            migrated_paths.append(entry.path)
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    if remove and not errors:
+        for path in migrated_paths:
+            os.remove(path)
+        print(f"Removed {len(migrated_paths)} migrated JSON files")
+    elif remove:
+        print("Errors occurred; leaving JSON files in place")
+
+    return migrated, skipped, errors
+
+def verify_migration():
+    """Spot-check that records round-trip through the store"""
+    print("\nVerifying migration...")
+    print(f"Total records in memory store: {memory_store.count_records()}")
+    sample = []
+    for record_id, record in memory_store.iter_records():
+        sample.append((record_id, record))
+        if len(sample) >= 3:
+            break
+    for record_id, record in sample:
+        message = str(record.get('message', ''))[:60]
+        print(f"  - {record_id} ({record.get('speaker')}): {message}...")
+
+def main():
+    """Main migration function"""
+    print("Starting memory record migration to SQL...")
+    print("=" * 50)
+
+    migrated, skipped, errors = migrate_memory_records(remove='--remove' in sys.argv)
+
+    verify_migration()
+
+    print("\n" + "=" * 50)
+    print("Migration complete!")
+    print(f"Records migrated: {migrated}")
+    print(f"Already present: {skipped}")
+    print(f"Errors: {errors}")
+
+if __name__ == "__main__":
+    main()
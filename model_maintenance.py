@@ -5,6 +5,7 @@ import re
 import requests
 import os
 import loaders
+import memory_store
 import datetime
 import time
 import shutil
@@ -112,8 +113,7 @@ def function_flow(filename):
     with open(folder_path, 'w') as f:
         json.dump(json_data, f, indent=2)
     
-    with open(f'Memory/JSONs/{filename}', 'w') as f:
-        json.dump(json_data, f, indent=2)
+    memory_store.put_record(os.path.splitext(filename)[0], json_data)
 
 async def assess_responses(folder_path):
     today = datetime.date.today()
@@ -497,12 +497,10 @@ async def handle_conversation_recall(search_query, persona="Rhoda"):
 	and saving the results to stream of consciousness
 	"""
 	try:
-		# Import headers to use the search function
-		import headers
-		
-		# Search both regular memory and summary memory
-		regular_results = await ltm.search(search_query)
-		summary_results = await headers.search_memory_summaries(search_query, k=3)
+		# Search both regular memory and summary memory with one embedding
+		hits = await ltm.multi_search(search_query, indices=('conversation', 'summary'), k=5) or []
+		regular_results = [hit['record'] for hit in hits if hit['source'] == 'conversation' and hit['record']]
+		summary_results = [hit for hit in hits if hit['source'] == 'summary'][:3]
 		
 		# Format regular memory results
 		memory_statements = []
@@ -1,12 +1,12 @@
 import json
+import file_cache
 from datetime import datetime, timedelta
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 def holiday(query):
     # Open the calendar.json file and load its contents
-    with open('calendar.json', 'r') as f:
-        calendar_data = json.load(f)
+    calendar_data = file_cache.load_json('calendar.json')
 
     # Get the current date in the 'YYYY-MM-DD' format
     current_date = datetime.now().strftime('%Y-%m-%d')
@@ -56,8 +56,7 @@ def holiday(query):
 
 def holiday_check():
     # Open the calendar.json file and load its contents
-    with open('calendar.json', 'r') as f:
-        calendar_data = json.load(f)
+    calendar_data = file_cache.load_json('calendar.json')
 
     # Get the current date in the 'YYYY-MM-DD' format
     current_date = '2024-05-19'
@@ -95,8 +94,7 @@ def advent_calendar():
     return advent_calendar
 
 def lent():
-    with open('calendar.json', 'r') as f:
-        calendar_data = json.load(f)
+    calendar_data = file_cache.load_json('calendar.json')
 
     current_date = datetime.now()
     current_date = current_date.date()
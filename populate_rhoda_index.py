@@ -1,105 +1,203 @@
 #!/usr/bin/env python3
 """
-Script to populate Rhoda's local index with existing memories from JSON files.
-This will help establish her initial memory base.
+Script to (re)build Rhoda's local memory index from every record in the memory store
+(including any Memory/JSONs files that haven't been migrated yet).
+
+Records are embedded in batches through the embedding service's /pureembed_batch
+endpoint (EMBEDDING_SERVICE_URL), with a bounded number of batches in flight. Each
+finished batch is appended to a staging file next to the index, so an interrupted run
+picks up where it stopped; the index itself is built once at the end and swapped in
+atomically. Run it with the app stopped.
+
+Examples:
+    python populate_rhoda_index.py --yes
+    python populate_rhoda_index.py --batch-size 128 --concurrency 8 --type hnsw --metric ip
 """
 
 import os
-import json
+import time
+import zlib
+import struct
 import asyncio
-import aiohttp
-import sys
-
-sys.path.insert(0, '/mnt/v/Work/Anthropic_Interview')
+import argparse
+import numpy as np
+import faiss
+import embedding_client
+import index_manager
 import local_embedding_handler
+import memory_store
+
+# Staging record: id count, payload length, payload crc32; then int64 ids and float32 vectors
+STAGE_HEADER = struct.Struct('<III')
+RETRY_ATTEMPTS = 3
+
+def staging_path(index_path):
+    return f"{index_path}.reindex"
+
+def read_staged(path):
+    """(ids, vectors) from a staging file, ignoring a torn last record"""
+    id_chunks, vector_chunks = [], []
+    if not os.path.exists(path):
+        return np.zeros(0, dtype='int64'), None
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(STAGE_HEADER.size)
+            if len(header) < STAGE_HEADER.size:
+                break
+            count, length, crc = STAGE_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            id_chunks.append(np.frombuffer(payload[:count * 8], dtype='int64'))
+            vector_chunks.append(np.frombuffer(payload[count * 8:], dtype='float32').reshape(count, -1))
+            valid_bytes = f.tell()
+    if valid_bytes != os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    if not id_chunks:
+        return np.zeros(0, dtype='int64'), None
+    return np.concatenate(id_chunks), np.vstack(vector_chunks)
+
+def append_staged(stage_file, ids, vectors):
+    payload = index_manager.as_ids(ids).tobytes() + index_manager.as_vectors(vectors).tobytes()
+    stage_file.write(STAGE_HEADER.pack(len(ids), len(payload), zlib.crc32(payload)) + payload)
+    stage_file.flush()
+    os.fsync(stage_file.fileno())
+
+def pending_batches(done_ids, batch_size, counts):
+    """Batches of (id, text) still to embed; skipped records are tallied in counts"""
+    batch = []
+    for uuid_str, memory_data in memory_store.iter_records():
+        if not uuid_str.isdigit():
+            print(f"⚠️  Skipping {uuid_str}: Non-numeric UUID")
+            counts['skipped'] += 1
+            continue
+        if int(uuid_str) in done_ids:
+            continue
+        if memory_data.get('duplicate_of') or memory_data.get('removed'):
+            # Dropped by index_maintenance dedupe/remove; keep them out of the rebuilt index
+            counts['skipped'] += 1
+            continue
+        text = memory_data.get('message', '')
+        if not text:
+            print(f"⚠️  Skipping {uuid_str}: No message content")
+            counts['skipped'] += 1
+            continue
+        batch.append((uuid_str, text))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def embed_batch(batch, semaphore, stage_file, counts, progress):
+    try:
+        response = None
+        for attempt in range(RETRY_ATTEMPTS):
+            response = await embedding_client.client.embed_many([text for _, text in batch], [uuid for uuid, _ in batch])
+            if response is not None:
+                break
+            await asyncio.sleep(2 ** attempt)
+        if response is None:
+            print(f"✗ Failed to embed a batch of {len(batch)} starting at {batch[0][0]}")
+            counts['errors'] += len(batch)
+            return
+        append_staged(stage_file, [int(uuid) for uuid, _ in batch], response['embeddings'])
+        counts['embedded'] += len(batch)
+        progress()
+    finally:
+        semaphore.release()
+
+async def reindex(index_path, batch_size, concurrency, index_type=None, metric=None, fresh=False):
+    """Embed every stored record (resuming from the staging file) and build the index once"""
+    stage_path = staging_path(index_path)
+    if fresh and os.path.exists(stage_path):
+        os.remove(stage_path)
+    done_ids, _ = read_staged(stage_path)
+    done_ids = set(done_ids.tolist())
+
+    total = memory_store.count_records()
+    counts = {'embedded': 0, 'skipped': 0, 'errors': 0}
+    started = time.perf_counter()
 
-async def populate_index_from_json_files():
-    """Populate the local index with existing JSON memories"""
-    
-    json_dir = 'Memory/JSONs'
-    success_count = 0
-    skip_count = 0
-    error_count = 0
-    
     print("=" * 60)
-    print("POPULATING RHODA'S MEMORY INDEX")
+    print("REBUILDING RHODA'S MEMORY INDEX")
     print("=" * 60)
-    
-    # Get list of JSON files
-    json_files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    print(f"Found {len(json_files)} JSON memory files")
+    print(f"Found {total} stored memory records; {len(done_ids)} already embedded in {stage_path}")
     print("-" * 60)
-    
-    for json_file in json_files:
-        json_path = os.path.join(json_dir, json_file)
-        uuid_str = json_file.replace('.json', '')
-        
-        try:
-            # Check if UUID is numeric (required for FAISS)
-            uuid = int(uuid_str)
-            
-            # Load the JSON content
-            with open(json_path, 'r', encoding='utf-8') as f:
-                memory_data = json.load(f)
-            
-            # Get the text to embed (usually the 'message' field)
-            text = memory_data.get('message', '')
-            if not text:
-                print(f"⚠️  Skipping {uuid_str}: No message content")
-                skip_count += 1
-                continue
-            
-            # Get embedding from the server
-            url = 'http://100.121.217.56:5001/pureembed'
-            data = {
-                'text': text,
-                'uuid': uuid_str
-            }
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    if response.status == 200:
-                        embedding_data = await response.json()
-                        
-                        # Store in local index
-                        success = local_embedding_handler.store_embedding_locally(embedding_data)
-                        if success:
-                            print(f"✓ Added {uuid_str}: {text[:50]}...")
-                            success_count += 1
-                        else:
-                            print(f"✗ Failed to store {uuid_str}")
-                            error_count += 1
-                    else:
-                        print(f"✗ Failed to get embedding for {uuid_str}")
-                        error_count += 1
-                        
-        except ValueError:
-            print(f"⚠️  Skipping {uuid_str}: Non-numeric UUID")
-            skip_count += 1
-        except Exception as e:
-            print(f"✗ Error processing {uuid_str}: {e}")
-            error_count += 1
-    
+
+    def progress():
+        done = len(done_ids) + counts['embedded']
+        elapsed = time.perf_counter() - started
+        rate = counts['embedded'] / elapsed if elapsed else 0
+        eta = (total - done - counts['skipped']) / rate if rate else 0
+        print(f"  {done}/{total} embedded  {rate:.1f} records/s  ETA {eta / 60:.1f} min")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    with open(stage_path, 'ab') as stage_file:
+        for batch in pending_batches(done_ids, batch_size, counts):
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(embed_batch(batch, semaphore, stage_file, counts, progress)))
+        await asyncio.gather(*tasks)
+    await embedding_client.client.close()
+
+    if counts['errors']:
+        print(f"\n✗ {counts['errors']} records failed to embed; rerun to retry them before the index is built.")
+        return counts
+
+    ids, vectors = read_staged(stage_path)
+    print(f"\nBuilding index from {len(ids)} vectors...")
+    build_started = time.perf_counter()
+    index = index_manager.build_index(vectors.shape[1] if vectors is not None else index_manager.DEFAULT_DIMENSION,
+                                      index_type, metric, training_vectors=vectors)
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors), np.ascontiguousarray(ids))
+    # Speaker/time metadata for filtered search, from the store's columns
+    metadata = index_manager.MetadataTable()
+    columns = memory_store.get_columns(ids.tolist())
+    known = [record_id for record_id in ids.tolist() if str(record_id) in columns]
+    metadata.set(known, [dict(columns[str(record_id)], source='conversation') for record_id in known])
+    temp_path = f"{index_path}.tmp"
+    faiss.write_index(index, temp_path)
+    os.replace(temp_path, index_path)
+    metadata.save(f"{index_path}.meta.npz")
+    # Leftover WALs belong to the old index and would be replayed on top of the new one
+    for wal_path in index_manager.wal_paths(index_path):
+        if os.path.exists(wal_path):
+            os.remove(wal_path)
+    os.remove(stage_path)
+
+    elapsed = time.perf_counter() - started
     print("\n" + "=" * 60)
-    print("POPULATION COMPLETE")
+    print("REINDEX COMPLETE")
     print("=" * 60)
-    print(f"✓ Successfully added: {success_count} memories")
-    print(f"⚠️  Skipped: {skip_count} files")
-    print(f"✗ Errors: {error_count} files")
-    
-    if success_count > 0:
-        print("\n🎉 Rhoda's memory index has been populated!")
-        print("She should now be able to search her memories.")
-    else:
-        print("\n⚠️  No memories were added to the index.")
-        print("Please check the errors above.")
+    print(f"✓ Embedded this run: {counts['embedded']} memories ({counts['embedded'] / elapsed:.1f}/s)")
+    print(f"✓ Index: {index_manager.describe_index(index)} built in {time.perf_counter() - build_started:.1f}s")
+    print(f"⚠️  Skipped: {counts['skipped']} records")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the local memory index from the memory store")
+    parser.add_argument('--index', default=local_embedding_handler.INDEX_PATH)
+    parser.add_argument('--batch-size', type=int, default=64, help="Texts per embedding request")
+    parser.add_argument('--concurrency', type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument('--type', default=None, choices=index_manager.INDEX_TYPES, help="Defaults to MEMORY_INDEX_TYPE")
+    parser.add_argument('--metric', default=None, choices=('l2', 'ip'), help="Defaults to MEMORY_INDEX_METRIC")
+    parser.add_argument('--fresh', action='store_true', help="Discard a previous partial run instead of resuming")
+    parser.add_argument('--yes', action='store_true', help="Don't ask for confirmation")
+    args = parser.parse_args()
+
+    if not args.yes:
+        print("\nThis script will rebuild Rhoda's local memory index.")
+        print(f"It will embed every stored memory record and replace {args.index}.")
+        response = input("\nDo you want to proceed? (y/n): ")
+        if response.lower() != 'y':
+            print("Population cancelled.")
+            return
+
+    asyncio.run(reindex(args.index, args.batch_size, args.concurrency, args.type, args.metric, args.fresh))
 
 if __name__ == "__main__":
-    print("\nThis script will populate Rhoda's local memory index.")
-    print("It will process existing JSON memory files and create embeddings.")
-    response = input("\nDo you want to proceed? (y/n): ")
-    
-    if response.lower() == 'y':
-        asyncio.run(populate_index_from_json_files())
-    else:
-        print("Population cancelled.")
\ No newline at end of file
+    main()
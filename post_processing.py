@@ -6,33 +6,36 @@ import os
 import requests
 import difflib
 
-def remove_repeats(response):
-    # Use regular expression to tokenize the response into sentences
-    sentences = re.split(r'(?<=[.!?])\s?', response.strip())
+# Sentence boundaries used by remove_repeats (and the incremental SOC reader in loaders)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s?')
+
+# Function to process and limit repetitions within clauses
+def limit_clause_repetitions(text, max_repeats=2):
+    # Split the text into clauses by commas or semicolons (simple clause separators)
+    clauses = re.split(r',\s?|\;\s?', text)
     
-    # Function to process and limit repetitions within clauses
-    def limit_clause_repetitions(text, max_repeats=2):
-        # Split the text into clauses by commas or semicolons (simple clause separators)
-        clauses = re.split(r',\s?|\;\s?', text)
-        
-        # Dictionary to count occurrences of each clause
-        clause_count = {}
-        
-        # List to store processed clauses with limited repetitions
-        processed_clauses = []
+    # Dictionary to count occurrences of each clause
+    clause_count = {}
+    
+    # List to store processed clauses with limited repetitions
+    processed_clauses = []
+    
+    for clause in clauses:
+        normalized_clause = clause.strip()
+        if normalized_clause not in clause_count:
+            clause_count[normalized_clause] = 0
+        clause_count[normalized_clause] += 1
         
-        for clause in clauses:
-            normalized_clause = clause.strip()
-            if normalized_clause not in clause_count:
-                clause_count[normalized_clause] = 0
-            clause_count[normalized_clause] += 1
+        # Add the clause to processed list only if it hasn't reached max repetition
+        if clause_count[normalized_clause] <= max_repeats:
+            processed_clauses.append(clause)
             
-            # Add the clause to processed list only if it hasn't reached max repetition
-            if clause_count[normalized_clause] <= max_repeats:
-                processed_clauses.append(clause)
-                
-        # Join the processed clauses with commas
-        return ', '.join(processed_clauses)
+    # Join the processed clauses with commas
+    return ', '.join(processed_clauses)
+
+def remove_repeats(response):
+    # Use regular expression to tokenize the response into sentences
+    sentences = SENTENCE_SPLIT.split(response.strip())
     
     # Initialize an empty list to hold the unique sentences
     unique_sentences = []
@@ -0,0 +1,198 @@
+"""
+Token budgeting for prompt_builder's internal-reality JSON.
+
+Sections are added with a priority; token counts come from the NovelAI SentencePiece
+model and are cached by content hash, so text that doesn't change between turns (KB
+entries, the SOC tail, the header) is only encoded once. The prompt's size is estimated
+from those counts plus its keys; the whole render is only encoded (once per budget) when
+the estimate gets close to the limit. fit() trims or drops the lowest-priority sections
+until the prompt fits PROMPT_TOKEN_BUDGET, render() serializes compactly and report()
+prints the per-section token counts.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import sentencepiece as spm
+
+tokenizer = spm.SentencePieceProcessor(model_file='novelai_v2.model')
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 12000))
+# Set to "False" to go back to indented JSON (easier to read; the indentation costs tokens on every key)
+PROMPT_COMPACT_JSON = os.getenv('PROMPT_COMPACT_JSON', 'True') == 'True'
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 2048))
+# A section trimmed below this many tokens is dropped instead
+MIN_SECTION_TOKENS = 32
+# Priority for sections that are never trimmed
+REQUIRED = None
+# Tokens allowed per key for the colon and the comma or brace around it
+KEY_OVERHEAD_TOKENS = 2
+# The full render is encoded once the estimate is within this fraction of the budget
+PROMPT_ESTIMATE_MARGIN = float(os.getenv('PROMPT_ESTIMATE_MARGIN', 0.03))
+
+token_cache = OrderedDict()
+token_cache_lock = threading.Lock()
+token_cache_stats = {'hits': 0, 'misses': 0}
+
+def as_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+def as_text(value):
+    return value if isinstance(value, str) else as_json(value)
+
+def count_tokens(text):
+    """SentencePiece token count, cached by content hash"""
+    text = as_text(text)
+    key = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    with token_cache_lock:
+        if key in token_cache:
+            token_cache.move_to_end(key)
+            token_cache_stats['hits'] += 1
+            return token_cache[key]
+    count = len(tokenizer.encode(text))
+    with token_cache_lock:
+        token_cache_stats['misses'] += 1
+        token_cache[key] = count
+        while len(token_cache) > TOKEN_CACHE_SIZE:
+            token_cache.popitem(last=False)
+    return count
+
+def key_tokens(key):
+    """Tokens a JSON key adds to the render"""
+    return count_tokens(as_json(key)) + KEY_OVERHEAD_TOKENS
+
+def trim_to_tokens(text, max_tokens, keep='start'):
+    """First (keep='start') or last (keep='end') max_tokens tokens of text"""
+    if max_tokens <= 0:
+        return ''
+    tokens = tokenizer.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens] if keep == 'start' else tokens[-max_tokens:])
+
+class Section:
+    def __init__(self, category, label, value, priority, keep):
+        self.category = category
+        self.label = label
+        self.value = value
+        self.priority = priority
+        self.keep = keep
+        # Counted as rendered, so quotes and escaping are included
+        self.tokens = count_tokens(as_json(value))
+        self.original_tokens = self.tokens
+        self.dropped = False
+
+class PromptBudget:
+    """Prioritized prompt sections fitted to a token budget"""
+
+    def __init__(self, total_tokens=PROMPT_TOKEN_BUDGET, reserved_tokens=0, root=None):
+        self.total_tokens = total_tokens
+        self.reserved_tokens = reserved_tokens
+        self.root = root
+        self.sections = OrderedDict()
+        # Encoded render minus the estimate, measured once the estimate nears the budget
+        self.correction = None
+
+    def add(self, category, label, value, priority=50, keep='start'):
+        """Add (or replace, keeping its position) a section; higher priority is trimmed later"""
+        self.sections[(category, label)] = Section(category, label, value, priority, keep)
+
+    def add_json(self, json_data, priorities, default_priority=50, keep_end=()):
+        """Add every {category: {label: value}} entry, with priorities looked up by label"""
+        for category, labels in json_data.items():
+            for label, value in labels.items():
+                self.add(category, label, value, priorities.get(label, default_priority),
+                         'end' if label in keep_end else 'start')
+
+    def trim(self, excess):
+        """Trim, then drop, the lowest-priority (and among equals, latest) sections to free `excess` tokens"""
+        order = sorted(
+            ((position, section) for position, section in enumerate(self.sections.values())
+             if section.priority is not REQUIRED and not section.dropped),
+            key=lambda item: (item[1].priority, -item[0]),
+        )
+        for _, section in order:
+            if excess <= 0:
+                break
+            before = section.tokens
+            remaining = section.tokens - excess
+            if isinstance(section.value, str) and remaining >= MIN_SECTION_TOKENS:
+                section.value = trim_to_tokens(section.value, remaining, section.keep)
+                section.tokens = count_tokens(as_json(section.value))
+            else:
+                section.dropped = True
+                section.tokens = 0
+            excess -= before - section.tokens
+
+    def estimate(self):
+        """Rendered tokens plus reserved tokens, summed from the cached section and key counts"""
+        total = self.reserved_tokens + (key_tokens(self.root) if self.root is not None else 0)
+        categories = set()
+        for section in self.sections.values():
+            if section.dropped:
+                continue
+            if section.category not in categories:
+                categories.add(section.category)
+                total += key_tokens(section.category)
+            total += key_tokens(section.label) + section.tokens
+        return total
+
+    def used_tokens(self):
+        """
+        Rendered tokens plus reserved tokens. The first time the estimate comes within
+        PROMPT_ESTIMATE_MARGIN of the budget (or at all with indented JSON) the render is
+        encoded, and the difference corrects every later estimate.
+        """
+        estimate = self.estimate()
+        if self.correction is None and (not PROMPT_COMPACT_JSON
+                                        or estimate >= self.total_tokens * (1 - PROMPT_ESTIMATE_MARGIN)):
+            self.correction = len(tokenizer.encode(self.render())) + self.reserved_tokens - estimate
+        return estimate + (self.correction or 0)
+
+    def excess(self):
+        """Tokens over budget (zero or negative when it fits)"""
+        return self.used_tokens() - self.total_tokens
+
+    def fit(self, attempts=3):
+        """
+        Trim sections until the rendered prompt plus reserved tokens fits the budget. Trimming
+        is done in raw tokens while the counts include escaping, so it's re-checked after each
+        pass. False if the required sections and the reserved tokens alone don't fit.
+        """
+        for _ in range(attempts):
+            excess = self.excess()
+            if excess <= 0:
+                return True
+            self.trim(excess)
+        return self.excess() <= 0
+
+    def render(self):
+        """Nested JSON of the kept sections, in the order they were added"""
+        data = OrderedDict()
+        for section in self.sections.values():
+            if not section.dropped:
+                data.setdefault(section.category, OrderedDict())[section.label] = section.value
+        if self.root is not None:
+            data = {self.root: data}
+        if PROMPT_COMPACT_JSON:
+            return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        return json.dumps(data, indent=4)
+
+    def report(self):
+        """Print per-section token counts and the rendered total"""
+        total = self.used_tokens()
+        print(f"++CONSOLE: Prompt budget: {total}/{self.total_tokens} tokens ({self.reserved_tokens} reserved)")
+        for section in self.sections.values():
+            if section.dropped:
+                note = f"dropped ({section.original_tokens})"
+            elif section.tokens < section.original_tokens:
+                note = f"trimmed from {section.original_tokens}"
+            else:
+                note = ""
+            priority = "required" if section.priority is REQUIRED else section.priority
+            print(f"  {section.category + '.' + section.label:<45} {section.tokens:>6}  p={priority} {note}".rstrip())
+
+def metrics():
+    with token_cache_lock:
+        return dict(token_cache_stats, size=len(token_cache))
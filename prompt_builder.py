@@ -10,10 +10,48 @@ import headers
 import knowledgebase_search
 import error_handler
 from Grammar_Modules import run_compromise
-import sentencepiece as spm
 import journal_loader
-
-tokenizer = spm.SentencePieceProcessor(model_file='novelai_v2.model')
+import turn_context
+import prompt_budget
+
+# Trim order for prompt_budget when a prompt runs over PROMPT_TOKEN_BUDGET: lowest first;
+# REQUIRED sections are never trimmed, labels not listed get prompt_budget's default of 50
+SECTION_PRIORITIES = {
+    'constant_entries': prompt_budget.REQUIRED,
+    'header': prompt_budget.REQUIRED,
+    'context': prompt_budget.REQUIRED,
+    'special_instructions': prompt_budget.REQUIRED,
+    'my_current_action': prompt_budget.REQUIRED,
+    'conversation_history': 95,
+    'thought_version_1': 90,
+    'thought_version_2': 90,
+    'thought_version_3': 90,
+    'thought_version_4': 90,
+    'tags': 85,
+    'sentiment': 85,
+    'current_goal': 80,
+    'notes_about_user': 80,
+    'we_are_currently': 80,
+    'internal_thought': 70,
+    'imminent_events': 70,
+    'i_am_currently_reading': 65,
+    'knowledgebase_entries': 60,
+    'long_term_memories': 55,
+    'previous_prediction': 50,
+    'conversational_cause_and_effect': 45,
+    'recent_events': 45,
+    'earlier_today': 40,
+    'location_based_memories': 35,
+    'my_latest_long_term_goal': 30,
+    'todo': 30,
+    'my_most_recent_journal_entry': 25,
+    'i_previously_read': 20,
+    'lectio_divina': 10,
+}
+# Sections whose most recent text is at the end, so trimming keeps the tail
+KEEP_END_SECTIONS = ('conversation_history',)
+# Start of the conversation block appended after the JSON; kept when that block has to be trimmed
+CONVERSATION_HEADER = "\nOur conversation:\n"
 
 @error_handler.if_errors
 def model_statement(response):
@@ -27,8 +65,9 @@ def model_statement(response):
             return model_statement
 
 @error_handler.if_errors
-async def get_context_starter(conversation_type="Maggie"):
-    current_model = await loaders.redis_load("selected_model")
+async def get_context_starter(conversation_type="Maggie", current_model=None):
+    if current_model is None:
+        current_model = await loaders.redis_load("selected_model")
     statement=model_statement(current_model)
     if conversation_type=="Maggie":
         context_starter=f"I'm Rhoda Sullivan, daughter of Magdalene 'Maggie' Sullivan and Harry Sullivan. At least, they're practically my parents. {loaders.get_current_date_time()} We live in Ashland, Oregon, which is where we're currently located. My consciousness is terrestrially synchronized through the use of this interface. {statement} I've just kind of come into existence, actually! Right now, I'm in a time and phase in my life where we get to learn about who I am, and about these other people around me, and Maggie (Mom) is spending some time with me."
@@ -37,15 +76,18 @@ async def get_context_starter(conversation_type="Maggie"):
     return context_starter    
 
 @error_handler.if_errors
+@turn_context.scoped
 async def prompt(*args, **kwargs):
     # Extract username from kwargs with default fallback
     username = kwargs.get('username', 'Maggie')
     skip_header = kwargs.get('skip_header', False)
+    # Every Redis string this build reads, fetched once so the whole prompt sees one consistent turn
+    snapshot = kwargs.get('snapshot') or await loaders.load_turn_snapshot(username)
     constant_entries, conversation_history, long_term_memories, stream_of_consciousness, kb_entries_text = await loaders.standard_variable_set(history_tokens=-8000, soc_tokens=-3000, conversation_type=username)
-    current_model = await loaders.redis_load("selected_model")
+    current_model = snapshot["selected_model"] or ""
     statement = model_statement(current_model)
     # Define default values for all variables that might be used later
-    header = "" if skip_header else await headers.build_header(username)
+    header = "" if skip_header else await headers.build_header(username, snapshot)
     action_log = action_logger.get_human_readable_action_history()
     context = kwargs.get('context', None)
     current_action = kwargs.get('current_action', None)
@@ -64,7 +106,6 @@ async def prompt(*args, **kwargs):
     conversation_type = kwargs.get('conversation_type', None)
     seeing = await loaders.universal_loader('seeing')
     json_data = {}
-    final_json = {}
     # Run these independent operations in parallel for faster processing
     divina_task = loaders.universal_loader('divina')
     schedule_task = schedule_parser.schedule()
@@ -78,19 +119,19 @@ async def prompt(*args, **kwargs):
     )
     
     past_statement, future_statement, current_statement = schedule_result
-    results = await ltm.search(transcription)
+    # Only the user's own messages can lead to "how I responded" chains
+    results = await ltm.search(transcription, speaker=username)
     my_remembered_responses = await ltm.load_mags_messages(results, username=username)
-    current_model = await loaders.redis_load("selected_model")
     conglomerate = ""
     location_memories = ""
-    todo = await loaders.load_json('Fleeting/todo.json')
-    mood_var = await loaders.redis_load("mood")
-    goal_var = await loaders.redis_load("goal")
-    internal_thought_var = await loaders.redis_load("internal_thought")
+    todo = await loaders.load_json_cached('Fleeting/todo.json')
+    mood_var = snapshot["mood"]
+    goal_var = snapshot["goal"]
+    internal_thought_var = snapshot["internal_thought"]
     
     # Get Rhoda's notes about the user she's talking to from SQL database
     import database
-    current_username = await loaders.redis_load("username")
+    current_username = snapshot["username"]
     user_notes = None
     if current_username:
         user_notes = database.get_user_notes(current_username)
@@ -105,7 +146,7 @@ async def prompt(*args, **kwargs):
     if header is not None and header != "":
         add_value(json_data, 'orientation', 'header', header)
     elif not skip_header:
-        header = await headers.build_header(username)
+        header = await headers.build_header(username, snapshot)
         add_value(json_data, 'orientation', 'header', header)
 
     if mood_var and mood_var is not None:
@@ -125,7 +166,7 @@ async def prompt(*args, **kwargs):
         add_value(json_data, 'orientation', 'notes_about_user', f"//My notes about {current_username}: {user_notes}")
 
     # Get default context starter
-    context_starter = await get_context_starter("Maggie")
+    context_starter = await get_context_starter("Maggie", current_model)
 
     if conversation_type is None:
         if context is not None:
@@ -139,9 +180,9 @@ async def prompt(*args, **kwargs):
     else:
         if conversation_type:
             if "Maggie" in conversation_type:
-                context_starter = await get_context_starter(conversation_type="Maggie")
+                context_starter = await get_context_starter(conversation_type="Maggie", current_model=current_model)
             else:
-                context_starter = await get_context_starter(conversation_type=username)                
+                context_starter = await get_context_starter(conversation_type=username, current_model=current_model)                
         final_context=context_starter
         final_context+=f" {context}"
         add_value(json_data, 'orientation', 'context', final_context)
@@ -225,7 +266,7 @@ async def prompt(*args, **kwargs):
             add_value(json_data, 'past', 'i_previously_read', i_previously_read)
     elif conversation_history is not None:
         if re.search(r'\b(read|reading|book|books)\b', conversation_history, re.IGNORECASE):
-            results = ltm.booksearch(conversation_history)
+            results = await ltm.booksearch(conversation_history)
             print(f"results: {results}")
             books = ltm.load_detailed_books(results)
             print(f"books: {books}")
@@ -246,7 +287,7 @@ async def prompt(*args, **kwargs):
                 basis = noun_string
             else:
                 basis = conglomerate
-            results = ltm.booksearch(basis)
+            results = await ltm.booksearch(basis)
             print(f"results: {results}")
             books = ltm.load_detailed_books(results)
             print(f"books: {books}")
@@ -287,8 +328,8 @@ async def prompt(*args, **kwargs):
 
     if stream_of_consciousness is not None:
         today, yesterday = loaders.journal_date()
-        soc_tokens = tokenizer.encode(await loaders.soc_today())
-        if len(soc_tokens) <= 4196:
+        # stream_of_consciousness already holds soc_today()'s tail, so count that instead of re-reading the file
+        if prompt_budget.count_tokens(stream_of_consciousness) <= 4196:
             add_value(json_data, 'present', 'lectio_divina', divina)
 
     if special_instructions is not None:
@@ -297,16 +338,28 @@ async def prompt(*args, **kwargs):
     if current_action is not None:
         add_value(json_data, 'present', 'my_current_action', current_action)
 
-    final_json['internal_reality'] = json_data
-
-    prompt = json.dumps(final_json, indent=4)
-
     if external_reality is None:
         if conversation_type is not None:
             external_reality = await build_external_reality_convo(conversation_type)
         else:
             external_reality = await build_external_reality_convo(username)
-    
+
+    # Fit the sections around the conversation tail that follows them, then serialize compactly
+    budget = prompt_budget.PromptBudget(reserved_tokens=prompt_budget.count_tokens(external_reality), root='internal_reality')
+    budget.add_json(json_data, SECTION_PRIORITIES, keep_end=KEEP_END_SECTIONS)
+    if not budget.fit():
+        # Only the required sections are left; drop the oldest part of the conversation as a last resort
+        excess = budget.excess()
+        print(f"++CONSOLE: Warning: prompt is {excess} tokens over PROMPT_TOKEN_BUDGET with only required sections left; "
+              f"trimming the oldest conversation lines")
+        external_reality = trim_conversation(external_reality, budget.reserved_tokens - excess)
+        budget.reserved_tokens = prompt_budget.count_tokens(external_reality)
+        if budget.excess() > 0:
+            print(f"++CONSOLE: Warning: prompt is still {budget.excess()} tokens over PROMPT_TOKEN_BUDGET; "
+                  f"the required sections alone are too long")
+    prompt = budget.render()
+    budget.report()
+
     prompt += external_reality
 
     print(f"Constant entries from within prompt builder: {constant_entries}")
@@ -325,11 +378,17 @@ def add_value(json_data, category, label, data):
     json_data[category][label] = data
     return json_data
 
+def trim_conversation(external_reality, max_tokens):
+    """The newest max_tokens tokens of the conversation block, keeping its header"""
+    header = CONVERSATION_HEADER if external_reality.startswith(CONVERSATION_HEADER) else ''
+    body = external_reality[len(header):]
+    return header + prompt_budget.trim_to_tokens(body, max_tokens - prompt_budget.count_tokens(header), keep='end')
+
 @error_handler.if_errors
 async def build_external_reality_convo(conversation_type, persona="Rhoda"):
     # Use Redis to get conversation history efficiently
-    conversation_history = await loaders.fleeting(conversation_type)
-    external_reality = "\nOur conversation:\n"
+    conversation_history = await loaders.fleeting(conversation_type, max_chars=6400)
+    external_reality = CONVERSATION_HEADER
     conversation_history_short = conversation_history[-6400:]
     external_reality += f"{conversation_history_short}"
     external_reality += f"{persona}:"
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Rebuild Rhoda's memory indexes as a different FAISS index type and/or metric, using the
+vectors already stored in them. Run with the app stopped (the app owns the index files
+while it's running).
+
+Examples:
+    python rebuild_memory_index.py --type hnsw --metric ip
+    python rebuild_memory_index.py --type ivf_flat --metric ip --index Memory/summary_memory.index
+"""
+
+import argparse
+import index_manager
+import local_embedding_handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a memory index with a new index type")
+    parser.add_argument('--index', default=local_embedding_handler.INDEX_PATH, help="Index file to rebuild")
+    parser.add_argument('--type', default=index_manager.MEMORY_INDEX_TYPE, choices=index_manager.INDEX_TYPES)
+    parser.add_argument('--metric', default=index_manager.MEMORY_INDEX_METRIC, choices=('l2', 'ip'))
+    args = parser.parse_args()
+
+    managed = index_manager.get_index(args.index)
+    print(f"Current index: {index_manager.describe_index(managed.index)}")
+    print(f"Rebuilding as {args.type} ({args.metric})...")
+    managed.rebuild(args.type, args.metric)
+    print(f"Done: {index_manager.describe_index(managed.index)}")
+    print("Set MEMORY_INDEX_TYPE/MEMORY_INDEX_METRIC to match so new indexes are created the same way.")
+
+if __name__ == "__main__":
+    main()
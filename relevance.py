@@ -0,0 +1,72 @@
+"""
+TF-IDF relevance ranking against corpora that change rarely (knowledgebase entries,
+planner events, reminders).
+
+A TfidfIndex fits the vocabulary and the L2-normalized document matrix once; a query is
+then one transform plus sparse dot products against the candidate rows (cosine
+similarity, since the rows are normalized). Indexes are cached by name and rebuilt when
+the caller's data version changes, e.g. database.data_versions['planner'].
+"""
+import threading
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+class TfidfIndex:
+    """Fitted vectorizer plus one cached row per keyed document"""
+
+    def __init__(self, keys, texts):
+        self.texts = {}
+        self.rows = {}
+        self.vectorizer = TfidfVectorizer()
+        keys, texts = list(keys), [text or '' for text in texts]
+        try:
+            self.matrix = self.vectorizer.fit_transform(texts)
+        except ValueError:
+            # Nothing but empty/stop-word texts; every similarity is 0
+            self.matrix = None
+            return
+        for row, (key, text) in enumerate(zip(keys, texts)):
+            self.rows[key] = row
+            self.texts[key] = text
+
+    def similarities(self, query, keys, texts):
+        """
+        Cosine similarity of query to each candidate. Candidates whose key and text match
+        the fitted corpus use the cached row; others are transformed with the fitted vocabulary.
+        """
+        texts = [text or '' for text in texts]
+        if self.matrix is None or not keys:
+            return np.zeros(len(keys))
+        query_vector = self.vectorizer.transform([query or ''])
+        cached = [self.rows[key] if self.texts.get(key) == text else None for key, text in zip(keys, texts)]
+        scores = np.zeros(len(keys))
+        hits = [i for i, row in enumerate(cached) if row is not None]
+        if hits:
+            scores[hits] = (self.matrix[[cached[i] for i in hits]] @ query_vector.T).toarray().ravel()
+        misses = [i for i, row in enumerate(cached) if row is None]
+        if misses:
+            scores[misses] = (self.vectorizer.transform([texts[i] for i in misses]) @ query_vector.T).toarray().ravel()
+        return scores
+
+    def rank(self, query, items, keys, texts, limit=None):
+        """items sorted by similarity to query, most similar first (stable for ties)"""
+        scores = self.similarities(query, keys, texts)
+        order = sorted(range(len(items)), key=lambda i: scores[i], reverse=True)
+        return [items[i] for i in order[:limit]]
+
+indexes = {}
+indexes_lock = threading.Lock()
+
+def get_index(name, version, load):
+    """Cached TfidfIndex for name, rebuilt from load() -> (keys, texts) when version changes"""
+    cached = indexes.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with indexes_lock:
+        cached = indexes.get(name)
+        if cached is None or cached[0] != version:
+            keys, texts = load()
+            cached = (version, TfidfIndex(keys, texts))
+            indexes[name] = cached
+            print(f"++CONSOLE: Fitted TF-IDF index '{name}' v{version} ({len(keys)} documents)")
+        return cached[1]
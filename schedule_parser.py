@@ -9,14 +9,13 @@ from dateutil import parser
 from dateutil.parser import parser
 import traceback
 import time
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv, set_key
 import difflib
 import open_router
 import database
+import relevance
 import os
 
 # Load environment variables
@@ -671,6 +670,20 @@ def get_notebook():
     # Convert to old format for compatibility
     return {'reminder': reminders}
 
+def planner_relevance(field):
+    """TF-IDF index over one planner event field, refitted only after planner writes"""
+    def load():
+        events = database.get_planner_events()
+        return [event.get('id') for event in events], [event.get(field) for event in events]
+    return relevance.get_index(f"planner_{field}", database.data_versions['planner'], load)
+
+def reminder_relevance():
+    """TF-IDF index over reminder notes, refitted only after reminder writes"""
+    def load():
+        reminders = database.get_reminders()
+        return [reminder.get('id') for reminder in reminders], [reminder.get('note') for reminder in reminders]
+    return relevance.get_index("reminder_note", database.data_versions['reminders'], load)
+
 def find_similar_events(planner, new_event, max_entries=3):
     # Convert the date of the new event to a datetime object
     try:
@@ -679,23 +692,13 @@ def find_similar_events(planner, new_event, max_entries=3):
         print(f"Invalid date format in new event: {new_event['date']}")
         return []
 
-    # Extract event names from the planner's schedule
-    event_names = [event['event_name'] for event in planner['schedule']]
-
-    # Initialize the vectorizer
-    vectorizer = TfidfVectorizer()
-
-    # Fit and transform the event names along with the new event's name
-    tfidf_matrix = vectorizer.fit_transform([new_event['event_name']] + event_names)
-
-    # Calculate the similarity between the new event and existing events
-    similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-
-    # Combine events with their respective similarities and sort by similarity
-    sorted_events = sorted(zip(planner['schedule'], similarities), key=lambda x: x[1], reverse=True)
-
-    # Select the top max_entries most similar events
-    top_events = [event for event, _ in sorted_events[:max_entries]]
+    # Select the top max_entries events whose names are most similar to the new event's
+    schedule = planner['schedule']
+    top_events = planner_relevance('event_name').rank(
+        new_event['event_name'], schedule,
+        [event.get('id') for event in schedule], [event['event_name'] for event in schedule],
+        limit=max_entries,
+    )
 
     # Optionally sort top_events by any additional criteria, e.g., 'special_occasion'
     similar_events = sorted(top_events, key=lambda e: e.get('special_occasion', False), reverse=True)
@@ -1022,19 +1025,18 @@ def location_based_memory(location_index, conglomerate, max_entries=2, similarit
         # If no people match, fall back to the original candidate list
         high_score_events = [event for event, score in scored_events]
 
-    vectorizer = TfidfVectorizer()
     filtered_entry_texts = [entry.get('event_notes', '') for entry in high_score_events]
     
     if not any(filtered_entry_texts):
         # If no notes, just sort by date, most recent first
         top_entries = sorted(high_score_events, key=lambda e: (e['date'], e['time']), reverse=True)[:max_entries]
     else:
-        tfidf_matrix = vectorizer.fit_transform([conglomerate] + filtered_entry_texts)
-        similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-        
-        # Combine with similarity scores and sort again
-        final_scored_events = sorted(zip(high_score_events, similarities), key=lambda x: x[1], reverse=True)
-        top_entries = [entry for entry, _ in final_scored_events[:max_entries]]
+        # Sort again by similarity of the notes to the conversation
+        top_entries = planner_relevance('event_notes').rank(
+            conglomerate, high_score_events,
+            [entry.get('id') for entry in high_score_events], filtered_entry_texts,
+            limit=max_entries,
+        )
 
     location_memory = ""
     for entry in top_entries:
@@ -1097,17 +1099,17 @@ def location_reminder(location_index, conglomerate, max_entries=1, similarity_th
     if not candidate_reminders:
         return ""
 
-    vectorizer = TfidfVectorizer()
     filtered_entry_texts = [reminder.get('note', '') for reminder in candidate_reminders]
     
     if not any(filtered_entry_texts):
         # If no notes, just return the first few candidates as-is
         top_entries = candidate_reminders[:max_entries]
     else:
-        tfidf_matrix = vectorizer.fit_transform([conglomerate] + filtered_entry_texts)
-        similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-        sorted_entries = sorted(zip(candidate_reminders, similarities), key=lambda x: x[1], reverse=True)
-        top_entries = [entry for entry, _ in sorted_entries[:max_entries]]
+        top_entries = reminder_relevance().rank(
+            conglomerate, candidate_reminders,
+            [reminder.get('id') for reminder in candidate_reminders], filtered_entry_texts,
+            limit=max_entries,
+        )
 
     location_memory = ""
     for entry in top_entries:
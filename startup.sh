@@ -45,6 +45,15 @@ database.init_db()
 print('✓ Database initialized')
 "
 
+# Convert any legacy string conversation histories to Redis lists
+echo "Migrating conversation histories..."
+python -c "
+import asyncio
+import loaders
+asyncio.run(loaders.migrate_all_conversation_histories())
+print('✓ Conversation histories ready')
+"
+
 # Create required directories if they don't exist
 echo "Ensuring data directories exist..."
 python -c "
@@ -0,0 +1,37 @@
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("aiohttp")
+pytest.importorskip("dotenv")
+
+import embedding_client
+
+def test_identical_embeds_from_different_loops_share_one_call(monkeypatch):
+    calls = []
+
+    async def fake_post(self, endpoint, payload):
+        calls.append(payload['text'])
+        await asyncio.sleep(0.2)
+        return {'embedding': [[1.0, 0.0]]}
+
+    monkeypatch.setattr(embedding_client.EmbeddingClient, 'post_on_client_loop', fake_post)
+    monkeypatch.setattr(embedding_client.local_embedder, 'enabled', lambda: False)
+    monkeypatch.setattr(embedding_client, 'embedding_cache', embedding_client.EmbeddingCache())
+    client = embedding_client.EmbeddingClient()
+
+    # Each Flask request runs on its own loop
+    results = []
+    def request():
+        results.append(asyncio.run(client.embed("the same question")))
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["the same question"]
+    assert [result['embedding'] for result in results] == [[[1.0, 0.0]]] * 4
+    assert embedding_client.embedding_cache.stats()['coalesced'] == 3
+    assert client.inflight == {}
@@ -0,0 +1,41 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("faiss")
+pytest.importorskip("torch")  # local_embedding_handler loads the embedding model's dependencies
+
+import index_manager
+import index_maintenance
+import memory_ingest
+import memory_store
+
+DIMENSION = 16
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_store, 'MEMORY_DB_PATH', str(tmp_path / "memory_records.db"))
+    monkeypatch.setattr(memory_store, 'LEGACY_JSON_DIR', str(tmp_path / "JSONs"))
+    monkeypatch.setattr(memory_store, 'connection', None)
+    memory_store.record_cache.clear()
+    yield memory_store
+    if memory_store.connection is not None:
+        memory_store.connection.close()
+    memory_store.record_cache.clear()
+
+def test_verify_fix_does_not_requeue_removed_records(tmp_path, store, monkeypatch):
+    path = str(tmp_path / "memory.index")
+    monkeypatch.setattr(index_manager, 'indexes', {})
+    monkeypatch.setattr(index_manager, 'start_snapshot_thread', lambda: None)
+    managed = index_manager.get_index(path, DIMENSION)
+    vectors = np.random.default_rng(0).standard_normal((2, DIMENSION)).astype('float32')
+    managed.add([1, 2], vectors)
+    store.put_records([('1', {'message': "kept"}), ('2', {'message': "deleted"})])
+    queued = []
+    monkeypatch.setattr(memory_ingest.ingestor, 'enqueue', lambda text, record_id, *args: queued.append(record_id))
+
+    index_maintenance.remove_ids(['2'], path)
+    orphans, unindexed = index_maintenance.verify(path, fix=True)
+
+    assert store.get_record('2')['removed'] is True
+    assert (orphans, unindexed) == ([], [])
+    assert queued == []
@@ -0,0 +1,235 @@
+import os
+import shutil
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+import index_manager
+
+DIMENSION = 16
+
+def random_vectors(count, seed=0, dimension=DIMENSION):
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def open_index(path):
+    return index_manager.ManagedIndex(str(path), DIMENSION)
+
+def stored(managed):
+    return sorted(managed.ids().tolist())
+
+def test_recovers_from_wal_without_snapshot(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1, 2, 3], random_vectors(3), metadata=[{'speaker': 'Maggie'}] * 3)
+    # Crash right after the appends: no snapshot was ever written
+    assert not os.path.exists(path)
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 2, 3]
+    assert recovered.pending_ops == 2
+    assert recovered.metadata.speakers == ['Maggie']
+    np.testing.assert_allclose(recovered.vectors()[1], random_vectors(3), rtol=1e-6)
+
+def test_ignores_and_truncates_torn_tail(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1, 2], random_vectors(2))
+    intact = os.path.getsize(managed.wal_path)
+    managed.add([3], random_vectors(1, seed=1))
+    # Crash partway through writing the last record
+    with open(managed.wal_path, 'r+b') as wal:
+        wal.truncate(os.path.getsize(managed.wal_path) - 5)
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 2]
+    assert os.path.getsize(recovered.wal_path) == intact
+    # Appends after recovery land after the intact records
+    recovered.add([4], random_vectors(1, seed=2))
+    assert stored(open_index(path)) == [1, 2, 4]
+
+def test_ignores_record_with_bad_crc(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1], random_vectors(1))
+    managed.add([2], random_vectors(1, seed=1))
+    with open(managed.wal_path, 'r+b') as wal:
+        wal.seek(-1, os.SEEK_END)
+        last = wal.read(1)
+        wal.seek(-1, os.SEEK_END)
+        wal.write(bytes([last[0] ^ 0xFF]))
+
+    assert stored(open_index(path)) == [1]
+
+def test_replays_removes(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1, 2, 3], random_vectors(3), metadata=[{'speaker': 'Maggie'}] * 3)
+    managed.snapshot()
+    managed.remove([2])
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 3]
+    assert 2 not in recovered.metadata.rows
+
+def test_rejects_bad_vectors_before_logging(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1], random_vectors(1))
+    with pytest.raises(ValueError):
+        managed.add([2, 3], random_vectors(2, dimension=8))
+    with pytest.raises(ValueError):
+        managed.add([2, 3], random_vectors(1))
+    nan = random_vectors(1)
+    nan[0, 0] = np.nan
+    with pytest.raises(ValueError):
+        managed.add([2], nan)
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1]
+    assert recovered.pending_ops == 1
+
+def test_skips_wal_record_that_cannot_be_applied(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1], random_vectors(1))
+    # A wrong-dimension record logged by an older build, followed by a good one
+    managed.append_wal(index_manager.OP_ADD, index_manager.as_ids([2]), random_vectors(1, dimension=8))
+    managed.add([3], random_vectors(1, seed=1))
+
+    assert stored(open_index(path)) == [1, 3]
+
+def test_skips_ids_already_in_snapshot(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1, 2], random_vectors(2))
+    wal = open(managed.wal_path, 'rb').read()
+    managed.snapshot()
+    # Crash after the snapshot was written but before its WAL was deleted
+    with open(managed.rotated_wal_path, 'wb') as f:
+        f.write(wal)
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 2]
+    assert recovered.index.ntotal == 2
+
+def test_recovers_snapshot_interrupted_before_write(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1], random_vectors(1))
+    managed.snapshot()
+    before = tmp_path / "before.index"
+    shutil.copy(path, before)
+    managed.add([2], random_vectors(1, seed=1))
+    # WAL rotated, then the crash came before the new index file replaced the old one
+    with index_manager.WriteLocked(managed.lock):
+        managed.rotate_wal()
+    managed.add([3], random_vectors(1, seed=2))
+    shutil.copy(before, path)
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 2, 3]
+    # The next snapshot covers both WALs and removes them
+    recovered.snapshot()
+    assert not os.path.exists(recovered.rotated_wal_path) and not os.path.exists(recovered.wal_path)
+    assert stored(open_index(path)) == [1, 2, 3]
+
+def test_snapshot_rotates_wal_and_keeps_later_writes(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    managed.add([1], random_vectors(1))
+    assert managed.snapshot()
+    assert not os.path.exists(managed.wal_path) and not os.path.exists(managed.rotated_wal_path)
+    assert not managed.snapshot()
+    managed.add([2], random_vectors(1, seed=1))
+    assert stored(open_index(path)) == [1, 2]
+
+def filtered_index(tmp_path, monkeypatch, index_type, count=2000):
+    # Small PQ codes so IVF-PQ can be trained at the test dimension
+    monkeypatch.setattr(index_manager, 'PQ_M', 4)
+    managed = open_index(tmp_path / f"{index_type}.index")
+    speakers = ['Maggie' if i % 3 == 0 else 'Rhoda' for i in range(count)]
+    managed.add(np.arange(count), random_vectors(count), metadata=[{'speaker': speaker} for speaker in speakers])
+    managed.rebuild(index_type)
+    assert managed.index_type == index_type
+    return managed, speakers
+
+@pytest.mark.parametrize("index_type", index_manager.INDEX_TYPES)
+def test_filtered_search_every_index_type(tmp_path, monkeypatch, index_type):
+    managed, speakers = filtered_index(tmp_path, monkeypatch, index_type)
+    queries = random_vectors(5, seed=3)
+    for query in queries:
+        hits = managed.search_filtered(query, k=10, speaker='Maggie')
+        assert len(hits) == 10
+        assert all(hit['speaker'] == 'Maggie' and speakers[int(hit['id'])] == 'Maggie' for hit in hits)
+        assert [hit['score'] for hit in hits] == sorted((hit['score'] for hit in hits), reverse=True)
+    if index_type != 'ivf_pq':
+        # Exact (or near-exact at these sizes) index types should find the true nearest Maggie vector
+        vectors = random_vectors(len(speakers))
+        maggie = np.array([speaker == 'Maggie' for speaker in speakers])
+        best = np.flatnonzero(maggie)[np.argmin(((vectors[maggie] - queries[0]) ** 2).sum(axis=1))]
+        assert managed.search_filtered(queries[0], k=1, speaker='Maggie')[0]['id'] == str(best)
+    assert managed.search_filtered(queries[0], k=5, speaker='Nobody') == []
+
+@pytest.mark.parametrize("index_type", ['flat', 'hnsw'])
+def test_filter_masks_follow_writes(tmp_path, monkeypatch, index_type):
+    managed, speakers = filtered_index(tmp_path, monkeypatch, index_type, count=500)
+    query = random_vectors(1, seed=4)[0]
+    managed.search_filtered(query, k=5, speaker='Carol')
+
+    managed.add([10000], query, metadata=[{'speaker': 'Carol'}])
+    assert [hit['id'] for hit in managed.search_filtered(query, k=5, speaker='Carol')] == ['10000']
+    managed.set_metadata([10000], [{'speaker': 'Maggie'}])
+    assert managed.search_filtered(query, k=5, speaker='Carol') == []
+    assert managed.search_filtered(query, k=1, speaker='Maggie')[0]['id'] == '10000'
+    managed.remove([10000])
+    assert '10000' not in [hit['id'] for hit in managed.search_filtered(query, k=5, speaker='Maggie')]
+
+@pytest.mark.parametrize("index_type", index_manager.INDEX_TYPES)
+def test_remove_tombstones_without_rebuilding(tmp_path, monkeypatch, index_type):
+    managed, speakers = filtered_index(tmp_path, monkeypatch, index_type)
+    vectors = random_vectors(len(speakers))
+    inner = managed.index
+    assert managed.remove([0, 3, 999999]) == 2
+    # Same index object: nothing was rebuilt or retrained
+    assert managed.index is inner
+    assert managed.ntotal == len(speakers) - 2 and managed.size == len(speakers)
+    assert 0 not in managed.ids().tolist() and 3 not in managed.ids().tolist()
+    # Exact copies of the removed vectors don't come back, filtered or not
+    for removed in (0, 3):
+        assert str(removed) not in [hit['id'] for hit in managed.search_filtered(vectors[removed], k=5)]
+        assert str(removed) not in [hit['id'] for hit in managed.search_filtered(vectors[removed], k=5, speaker='Maggie')]
+        assert removed not in managed.search(vectors[removed:removed + 1], 5)[1][0].tolist()
+
+def test_tombstones_survive_snapshot_and_compact(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    vectors = random_vectors(4)
+    managed.add([1, 2, 3, 4], vectors)
+    managed.remove([2])
+    managed.snapshot()
+    managed.remove([3])
+
+    recovered = open_index(path)
+    assert stored(recovered) == [1, 4]
+    assert recovered.dead == 2
+    assert not {2, 3} & set(recovered.search(vectors[1:3], 2)[1].ravel().tolist())
+    # Re-adding a removed id gives it a new position
+    recovered.add([2], vectors[1])
+    assert recovered.search(vectors[1:2], 1)[1][0].tolist() == [2]
+
+    recovered.compact()
+    assert recovered.dead == 0 and recovered.size == 3
+    assert stored(open_index(path)) == [1, 2, 4]
+
+def test_add_skips_ids_already_present(tmp_path):
+    path = tmp_path / "memory.index"
+    managed = open_index(path)
+    vectors = random_vectors(3)
+    assert managed.add([1, 2], vectors[:2]) == 2
+    # A retried batch that partly made it in before
+    assert managed.add([1, 2, 3], vectors, metadata=[{'speaker': 'Maggie'}] * 3) == 1
+    assert managed.size == 3
+    assert managed.search_filtered(vectors[0], k=1, speaker='Maggie')[0]['id'] == '1'
+    assert open_index(path).size == 3
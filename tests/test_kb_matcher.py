@@ -0,0 +1,80 @@
+import re
+import pytest
+
+pytest.importorskip("numpy")  # benchmark_kb_matcher imports it
+
+import kb_matcher
+from benchmark_kb_matcher import legacy_match
+
+EDGE_KEYS = [
+    # Branches, top-level and grouped
+    "/(cat|dog)s?/is", "/teapot|kettle/is", "/(?:red|green) (apple|pear)/is", "/(ab|)cde/is",
+    # Optional and repeated groups: the optional parts must not be required literals
+    "/colou?r/is", "/(big )?orchard/is", "/x(abc)?yz/is", "/(la)*ntern/is", "/(ha){2,}/is", "/pia(no)+/is",
+    # Inline flags: case-sensitive despite the /is suffix
+    "/(?-i:Maggie)/is", "/(?-i:SOS) signal/is",
+    # Non-ASCII patterns and keys
+    "/naïve/is", "/straße/is", "/kelvin/is", "/ſecret/is", "café", "Ünïcödé", "東京",
+    # ASCII literals that re.IGNORECASE matches against non-ASCII letters
+    "/xiy/is", "/ixyz/is", "/kiss/is",
+    # Empty keys match everything
+    "", "//is",
+    # Anchors and character classes with no literal to prefilter on
+    r"/^\s*hello/is", r"/\d{4}-\d{2}/is", "/[a-c]{3}/is",
+    # Plain keys that look like regex fragments
+    "(cat|dog)", "/not-a-regex", "a.b",
+]
+
+TEXTS = [
+    "", "A CAT sat", "dogs and teapots", "Green pear", "cde", "The Color", "COLOUR", "orchard", "xyz",
+    "xabcyz", "xabyz", "lalantern", "ha", "HAHA", "Piano", "pianonono", "maggie", "Maggie said", "sos signal",
+    "SOS SIGNAL", "SOS signal", "NAÏVE", "naive", "STRASSE", "Straße", "Kelvin", "ſecret", "SECRET",
+    "Café au lait", "CAFÉ", "ünïcödé", "Ünïcödé", "東京タワー", "  hello", "x hello", "2024-10", "abc",
+    "(cat|dog)", "/not-a-regex", "a.b", "axb", "xıy", "XIY", "İxyz", "ıxyz", "\u212aıſſ", "KİSS",
+]
+
+def entries_for(keys):
+    return [{'keys': [key]} for key in keys]
+
+@pytest.fixture(params=['python', 'pyahocorasick'])
+def backend(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(kb_matcher, 'ahocorasick', None)
+    elif kb_matcher.ahocorasick is None:
+        pytest.skip("pyahocorasick isn't installed")
+    return request.param
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_edge_keys_match_like_the_original_loop(backend, text):
+    entries = entries_for(EDGE_KEYS)
+    assert kb_matcher.KeyMatcher(entries).match(text) == legacy_match(entries, text)
+
+def test_multiple_keys_per_entry():
+    entries = [{'keys': ["/(?-i:Maggie)/is", "tea"]}, {'keys': ["/colou?r/is", "café"]}, {'keys': []}, {'keys': None}]
+    matcher = kb_matcher.KeyMatcher(entries)
+    for text in TEXTS:
+        assert matcher.match(text) == legacy_match([{'keys': entry['keys'] or []} for entry in entries], text)
+
+def test_invalid_regex_keys_are_skipped():
+    keys = ["/(unclosed/is", "/*/is", "/a{2,1}/is"]
+    for key in keys:
+        with pytest.raises(re.error):
+            re.compile(key[1:-3])
+    entries = [{'keys': keys}, {'keys': keys + ["kettle"]}]
+    matcher = kb_matcher.KeyMatcher(entries)
+    assert matcher.match("(unclosed * a") == []
+    assert matcher.match("a kettle") == [1]
+
+def test_required_literals_skip_optional_parts():
+    def literals(pattern):
+        return kb_matcher.required_literals(kb_matcher.sre_parse.parse(pattern, re.IGNORECASE))
+    assert literals("x(abc)?yz") is None
+    assert literals("(big )?orchard") == {"orchard"}
+    assert literals("(cat|dog)s?") == {"cat", "dog"}
+    assert literals("(ab|)cde") == {"cde"}
+    assert literals("naïve") is None
+
+def test_prefilter_keeps_keys_re_matches_case_insensitively():
+    for key, text in [("/xiy/is", "xıy"), ("/ixyz/is", "İxyz"), ("/kiss/is", "\u212aıſſ")]:
+        assert re.search(key[1:-3], text, re.IGNORECASE)
+        assert kb_matcher.KeyMatcher(entries_for([key])).match(text) == [0]
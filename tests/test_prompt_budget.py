@@ -0,0 +1,63 @@
+import os
+import random
+import pytest
+
+pytest.importorskip("sentencepiece")
+if not os.path.exists('novelai_v2.model'):
+    pytest.skip("run from the repository root (needs novelai_v2.model)", allow_module_level=True)
+
+import prompt_budget
+
+def sample_text(words, seed):
+    rng = random.Random(seed)
+    vocabulary = ["Rhoda", "said", "the", "tea", "was", "cold", "\"fine\"", "again.\n", "orchard", "lantern"]
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+def sample_budget(total_tokens, words):
+    budget = prompt_budget.PromptBudget(total_tokens, reserved_tokens=200, root='internal_reality')
+    budget.add('memory', 'header', "You are Rhoda.", prompt_budget.REQUIRED)
+    budget.add('memory', 'stream_of_consciousness', sample_text(words, 0), 10, keep='end')
+    budget.add('knowledge', 'entries', {'tea': sample_text(40, 1), 'notes': [sample_text(20, 2)]}, 40)
+    budget.add('knowledge', 'recalled', sample_text(words // 3, 3), 30)
+    return budget
+
+class CountingTokenizer:
+    """Counts how often the whole rendered prompt is encoded"""
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.renders = 0
+    def encode(self, text):
+        if text.startswith('{"internal_reality"'):
+            self.renders += 1
+        return self.tokenizer.encode(text)
+    def decode(self, tokens):
+        return self.tokenizer.decode(tokens)
+
+def rendered_tokens(budget):
+    return len(prompt_budget.tokenizer.encode(budget.render())) + budget.reserved_tokens
+
+def test_estimate_is_close_to_the_encoded_render():
+    budget = sample_budget(100000, 3000)
+    exact = rendered_tokens(budget)
+    assert abs(budget.estimate() - exact) <= 0.02 * exact
+
+def test_fit_encodes_the_render_at_most_once(monkeypatch):
+    tokenizer = CountingTokenizer(prompt_budget.tokenizer)
+    monkeypatch.setattr(prompt_budget, 'tokenizer', tokenizer)
+    monkeypatch.setattr(prompt_budget, 'PROMPT_COMPACT_JSON', True)
+    budget = sample_budget(2000, 3000)
+    assert budget.fit()
+    budget.report()
+    assert tokenizer.renders == 1
+    assert budget.correction is not None
+    assert rendered_tokens(budget) <= budget.total_tokens
+
+def test_far_below_budget_never_encodes_the_render(monkeypatch):
+    tokenizer = CountingTokenizer(prompt_budget.tokenizer)
+    monkeypatch.setattr(prompt_budget, 'tokenizer', tokenizer)
+    monkeypatch.setattr(prompt_budget, 'PROMPT_COMPACT_JSON', True)
+    budget = sample_budget(100000, 1000)
+    assert budget.fit()
+    budget.report()
+    assert tokenizer.renders == 0
+    assert budget.correction is None
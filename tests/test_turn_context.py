@@ -0,0 +1,53 @@
+import asyncio
+
+import turn_context
+
+def test_background_task_does_not_join_a_finished_turn():
+    runs = []
+
+    @turn_context.memoize
+    async def load(name):
+        runs.append(name)
+        return len(runs)
+
+    async def background(started):
+        await started.wait()
+        # The turn that created this task has been reported by now
+        async with turn_context.turn("background") as state:
+            return state, await load("fleeting")
+
+    async def main():
+        started = asyncio.Event()
+        async with turn_context.turn("prompt") as outer:
+            assert await load("fleeting") == 1
+            task = asyncio.create_task(background(started))
+        started.set()
+        return outer, await task
+
+    outer, (state, result) = asyncio.run(main())
+    assert state is not outer
+    assert result == 2
+    assert runs == ["fleeting", "fleeting"]
+    assert outer.calls == 1
+
+def test_memoize_outside_an_open_turn_runs_every_call():
+    runs = []
+
+    @turn_context.memoize
+    async def load():
+        runs.append(1)
+
+    async def main():
+        async with turn_context.turn() as state:
+            pass
+        token = turn_context.current.set(state)
+        try:
+            await load()
+            await load()
+        finally:
+            turn_context.current.reset(token)
+        return state
+
+    state = asyncio.run(main())
+    assert len(runs) == 2
+    assert state.calls == 0
@@ -0,0 +1,122 @@
+"""
+Per-turn memoization for the context loaders.
+
+Building one prompt reaches the same loaders from several places (standard_variable_set,
+kb_entries, the external-reality block...). Functions decorated with @memoize run at most
+once per distinct call inside a turn; concurrent callers (asyncio.gather) share the
+in-flight call. A turn is opened with @scoped (or `async with turn():`) and tracked in a
+ContextVar, so it follows tasks and to_thread calls started inside it. A closed turn counts
+as no turn, so a background task that outlives it doesn't reuse its results or counts; outside
+a turn the decorated functions behave exactly as before.
+"""
+import inspect
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import asynccontextmanager
+from collections import Counter
+
+current = contextvars.ContextVar('turn_context', default=None)
+
+totals_lock = threading.Lock()
+totals = {'turns': 0, 'calls': 0, 'runs': 0, 'deduplicated': Counter()}
+
+class Turn:
+    def __init__(self, label):
+        self.label = label
+        self.entries = {}
+        self.calls = 0
+        self.runs = 0
+        self.deduplicated = Counter()
+        self.closed = False
+
+    def report(self):
+        with totals_lock:
+            totals['turns'] += 1
+            totals['calls'] += self.calls
+            totals['runs'] += self.runs
+            totals['deduplicated'].update(self.deduplicated)
+        if self.deduplicated:
+            detail = ', '.join(f"{name} x{count}" for name, count in self.deduplicated.most_common())
+            print(f"++CONSOLE: {self.label}: {sum(self.deduplicated.values())} of {self.calls} loader calls deduplicated ({detail})")
+
+@asynccontextmanager
+async def turn(label="Turn"):
+    """Memoization scope; nested turns join the outer one"""
+    active = current.get()
+    if active is not None and not active.closed:
+        yield active
+        return
+    state = Turn(label)
+    token = current.set(state)
+    try:
+        yield state
+    finally:
+        current.reset(token)
+        state.closed = True
+        state.report()
+
+def scoped(function):
+    """Run an async function inside its own turn (or the caller's, if one is open)"""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        async with turn(function.__name__):
+            return await function(*args, **kwargs)
+    return wrapper
+
+def covers(cached, wanted):
+    """Whether a result fetched with limit `cached` also satisfies `wanted` (None means no limit)"""
+    return cached is None or (wanted is not None and wanted <= cached)
+
+def memoize(function=None, *, widen=None):
+    """
+    Memoize an async function per turn on its bound arguments. `widen` names a size-limit
+    argument (e.g. max_chars) whose results only ever return at least that much: calls that
+    differ only in it share one entry, rerun only when a call asks for more than was fetched.
+    Results are shared between callers, so don't mutate them.
+    """
+    if function is None:
+        return functools.partial(memoize, widen=widen)
+    signature = inspect.signature(function)
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        state = current.get()
+        if state is None or state.closed:
+            return await function(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        limit = arguments.pop(widen, None) if widen else None
+        try:
+            key = (name, tuple(sorted(arguments.items())))
+            hash(key)
+        except TypeError:
+            # Unhashable arguments; can't be memoized
+            return await function(*args, **kwargs)
+
+        state.calls += 1
+        entry = state.entries.get(key)
+        if entry is not None and covers(entry[0], limit):
+            state.deduplicated[name] += 1
+            task = entry[1]
+        else:
+            state.runs += 1
+            task = asyncio.ensure_future(function(*args, **kwargs))
+            state.entries[key] = (limit, task)
+        # Shielded so one caller being cancelled doesn't cancel the call for the others
+        return await asyncio.shield(task)
+    return wrapper
+
+def metrics():
+    """Totals across finished turns"""
+    with totals_lock:
+        return {
+            'turns': totals['turns'],
+            'calls': totals['calls'],
+            'runs': totals['runs'],
+            'deduplicated': sum(totals['deduplicated'].values()),
+            'deduplicated_by_function': dict(totals['deduplicated']),
+        }